@@ -1,18 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, g, request, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, insert, inspect, literal, or_, select, text, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge, UnsupportedMediaType
 import os
 import base64
 import traceback
-import cv2
 import numpy as np
-from PIL import Image
-import io
 import requests
 import json
 import uuid
+import hmac
 import re
-from datetime import datetime
+import statistics
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
 from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
 import google.generativeai as genai
@@ -46,7 +50,78 @@ else:
     print(f"[INFO] Using SQLite database at {db_path}")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+
+# Connection pool tuning + checkout metrics, and the optional read-replica bind
+from db_pool import RoutingSession, configure_database, pool_stats, read_replica, set_shared_write_clock
+configure_database(app, app.config['SQLALCHEMY_DATABASE_URI'])
+
+# Optional geographic sharding of complaint storage (SHARD_CONFIG, see sharding.py)
+from sharding import DEFAULT_SHARD, SHARD_ID_SPAN, SHARDED_TABLES, ShardedSession, configure_shards, merge_page, shard_scope
+shard_router = configure_shards(app)
+
+db = SQLAlchemy(app, session_options={'class_': ShardedSession if shard_router else RoutingSession})
+if shard_router is not None:
+    shard_router.db = db
+
+# Per-request SQL statement counts / time, slow-query log with plans, query budgets
+from query_monitor import create_query_monitor, query_budget
+# Totals go out as response headers only to admins and header-profiled requests
+query_monitor = create_query_monitor(
+    show_headers=lambda: admin_authorized() or g.get('profile_trigger') == 'header')
+if query_monitor is not None:
+    with app.app_context():
+        query_monitor.init_app(app, db.engines.values())
+
+# Fast JSON encoding + gzip/brotli compression for the large list endpoints
+from serialization import json_response
+
+# Read-through cache for the polling endpoints, invalidated on writes
+from response_cache import create_response_cache
+response_cache = create_response_cache()
+# Every write invalidates the cache, so its last invalidation (shared by the workers with the
+# sqlite backend) keeps replica reads, and the entries they would fill, off lagging data
+set_shared_write_clock(response_cache.last_write)
+# Per-complaint entries also carry this tag, which large bulk updates bump instead of one tag per row
+BULK_UPDATE_TAG = 'complaints:bulk'
+
+# Complaint change events, fanned out to SSE subscribers across workers
+from events import BULK_UPDATE_EVENT, STREAM_RETRY_AFTER, EventFilter, complaint_event_data, create_event_bus
+event_bus = create_event_bus()
+
+# Opt-in sampling profiler (X-Profile header / PROFILE_SAMPLE_RATE); no hooks at all when disabled
+from request_profiler import create_request_profiler
+request_profiler = create_request_profiler(os.path.join(backend_dir, 'profiles'))
+if request_profiler is not None:
+    request_profiler.init_app(app)
+
+# Upload limits: request body cap, then byte / pixel budgets checked before decoding images
+from image_guard import ImageRejected, create_image_guard
+image_guard = create_image_guard()
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_REQUEST_BYTES', 32 * 1024 * 1024))
+
+def request_too_large_response():
+    limit = app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f'Request body too large (limit {limit // (1024 * 1024)} MB)'}), 413
+
+@app.before_request
+def reject_oversized_body():
+    limit = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is not None:
+        # Refused from Content-Length before the body is read
+        if request.content_length > limit:
+            return request_too_large_response()
+    elif request.method in ('POST', 'PUT', 'PATCH'):
+        # Werkzeug stops reading a chunked body at the cap without an error, so the
+        # handler would see truncated JSON; read it here (cached) and check its size
+        if len(request.get_data(cache=True)) >= limit:
+            return request_too_large_response()
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_request_too_large(e):
+    return request_too_large_response()
+
+# Full-text complaint search (FTS5 on SQLite, tsvector + GIN on PostgreSQL)
+from search import COUNT_CAP, RANK_LIMIT, install_search_index, search_complaints, search_shards
 
 # API Keys
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
@@ -66,9 +141,16 @@ def root():
             'classify_issue': 'POST /api/classify-issue',
             'submit_complaint': 'POST /api/submit-complaint',
             'track_complaint': 'GET /api/track-complaint/<id>',
-            'complaints_map': 'GET /api/complaints-map?lat=<>&lon=<>',
-            'heatmap_data': 'GET /api/heatmap-data',
-            'all_complaints': 'GET /api/all-complaints'
+            'complaints_map': 'GET /api/complaints-map?lat=<>&lon=<>&include_archived=<>',
+            'heatmap_data': 'GET /api/heatmap-data?include_archived=<>',
+            'submit_complaints_batch': 'POST /api/submit-complaints/batch',
+            'all_complaints': 'GET /api/all-complaints?limit=<>&offset=<>&include_archived=<>',
+            'bulk_update_status': 'PUT /api/complaints/update-status',
+            'stats': 'GET /api/stats?since=<>&until=<>&bbox=<>&shard=<>',
+            'search': 'GET /api/search?q=<>&limit=<>&offset=<>&shard=<>',
+            'events': 'GET /api/events?complaint_id=<>&department=<>&bbox=<>',
+            'db_stats': 'GET /api/db-stats (X-Admin-Token)',
+            'image_stats': 'GET /api/image-stats'
         }
     })
 
@@ -83,9 +165,35 @@ def api_root():
 def health():
     return jsonify({'status': 'ok'})
 
+@app.route('/api/db-stats', methods=['GET'])
+def db_stats():
+    """Connection pool state and checkout wait metrics per database bind, plus per-endpoint SQL totals (requires X-Admin-Token)"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        stats = pool_stats(db.engines)
+        if query_monitor is not None:
+            stats['queries'] = query_monitor.snapshot()
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/image-stats', methods=['GET'])
+def image_stats():
+    """Upload guard outcomes (decoded, reduced, rejected, ...) and decode times"""
+    try:
+        return jsonify(image_guard.metrics.snapshot())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Complaint ids, and every column that stores one. Shard n allocates ids from n * SHARD_ID_SPAN,
+# past the int4 maximum from shard 3 on, so they are BIGINT (SQLite integers are 64-bit already,
+# and INTEGER keeps the primary key an alias of the rowid there)
+COMPLAINT_ID = db.BigInteger().with_variant(db.Integer(), 'sqlite')
+
 # Database Models
 class IssueReport(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(COMPLAINT_ID, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False)
     image_path = db.Column(db.String(500))
     issue_type = db.Column(db.String(100))
@@ -93,12 +201,115 @@ class IssueReport(db.Model):
     longitude = db.Column(db.Float)
     address = db.Column(db.String(500))
     description = db.Column(db.Text)
-    formal_complaint = db.Column(db.Text)
+    # Deferred: only the details endpoint reads it. New rows leave it NULL and the letter
+    # is rendered on demand from the row (see complaint_letter); older rows keep theirs.
+    # Search indexes the fields the letter is rendered from, not this column (see search.py).
+    formal_complaint = db.deferred(db.Column(db.Text))
     status = db.Column(db.String(50), default='pending')
     priority = db.Column(db.String(20), default='normal')
     department = db.Column(db.String(100))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Finds archivable rows (closed, not updated for a while) without a table scan
+    __table_args__ = (db.Index('ix_issue_report_status_updated_at', 'status', 'updated_at'),)
+
+class ArchivedIssueReport(db.Model):
+    """Cold tier: closed complaints moved out of issue_report by archive.py (same ids and columns)"""
+    id = db.Column(COMPLAINT_ID, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.String(100), nullable=False)
+    image_path = db.Column(db.String(500))  # archive/<file> once the photo is in cold storage
+    issue_type = db.Column(db.String(100))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    address = db.Column(db.String(500))
+    description = db.Column(db.Text)
+    formal_complaint = db.Column(db.Text)
+    status = db.Column(db.String(50))
+    priority = db.Column(db.String(20))
+    department = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, index=True)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Statuses that end a complaint's lifecycle
+CLOSED_STATUSES = ('resolved', 'rejected')
+
+# Photos of archived complaints (see archive.py)
+from archive import ARCHIVE_IMAGE_PREFIX
+ARCHIVE_IMAGE_DIR = os.getenv('ARCHIVE_IMAGE_DIR') or os.path.join(backend_dir, 'archive_images')
+
+def include_archived():
+    """Explicit opt-in to history: ?include_archived=true"""
+    return request.args.get('include_archived', 'false').lower() in ('1', 'true', 'yes')
+
+def complaint_models():
+    """Complaint tables a list endpoint reads: the hot table, plus the archive on opt-in."""
+    return (IssueReport, ArchivedIssueReport) if include_archived() else (IssueReport,)
+
+def get_complaint_or_404(complaint_id, *options):
+    """A complaint by id from the hot table, or from the archive once it has been archived."""
+    with shard_scope(complaint_shard(complaint_id)):
+        complaint = db.session.get(IssueReport, complaint_id, options=options)
+        if complaint is None:
+            complaint = db.session.get(ArchivedIssueReport, complaint_id)
+    if complaint is None:
+        abort(404)
+    return complaint
+
+def complaint_shard(complaint_id):
+    """Shard that stores a complaint, from its id alone (None without sharding)."""
+    return shard_router.shard_for_id(complaint_id) if shard_router else None
+
+def location_shard(lat, lon):
+    """Shard a new complaint at this location goes to (None without sharding)."""
+    if shard_router is None:
+        return None
+    if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+        return DEFAULT_SHARD
+    return shard_router.shard_for_point(lat, lon)
+
+def requested_shard():
+    """
+    Shard named by ?shard= on stats and search, None without it (every shard, or the
+    only database when not sharded). Raises ValueError for an unknown name.
+    """
+    name = request.args.get('shard')
+    if not name or shard_router is None:
+        return None
+    if name not in shard_router.numbers:
+        raise ValueError(f'Unknown shard: {name}')
+    return name
+
+def fetch_complaints(where=lambda model: (), limit=None, offset=0):
+    """
+    Complaint rows from the hot table (plus the archive on opt-in) of every shard.
+    
+    Shards are queried in parallel. With a limit, each table returns its newest
+    offset + limit rows and the results are merged into one newest-first page.
+    
+    Args:
+        where: callable(model) -> filter conditions
+        limit: page size (None: every row, unordered)
+        offset: rows to skip in the merged order
+    
+    Returns:
+        list of rows with the model's attributes, except formal_complaint
+    """
+    statements = []
+    for model in complaint_models():
+        columns = [column for column in model.__table__.c if column.name != 'formal_complaint']
+        statement = select(*columns).where(*where(model))
+        if limit is not None:
+            statement = statement.order_by(model.created_at.desc(), model.id.desc()).limit(offset + limit)
+        statements.append(statement)
+    if shard_router is None:
+        parts = [db.session.execute(statement).all() for statement in statements]
+    else:
+        per_shard = shard_router.scatter(lambda conn: [conn.execute(statement).all() for statement in statements])
+        parts = [rows for shard_parts in per_shard for rows in shard_parts]
+    if limit is None:
+        return [row for rows in parts for row in rows]
+    return merge_page(parts, key=lambda row: (row.created_at or datetime.min, row.id), offset=offset, limit=limit)
 
 class Department(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -108,19 +319,68 @@ class Department(db.Model):
     issue_types = db.Column(db.String(500))  # JSON string of handled issue types
     contact_info = db.Column(db.String(200))
 
+class SubmissionKey(db.Model):
+    """Idempotency key -> complaint, so retried offline syncs don't create duplicates"""
+    key = db.Column(db.String(200), primary_key=True)
+    complaint_id = db.Column(COMPLAINT_ID, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ComplaintEmbedding(db.Model):
+    """Photo embedding of a complaint (576 float32), used for near-duplicate detection"""
+    complaint_id = db.Column(COMPLAINT_ID, primary_key=True, autoincrement=False)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    issue_type = db.Column(db.String(100))
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    model_version = db.Column(db.String(100))  # vectors of different model versions are not comparable
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class DuplicateReport(db.Model):
+    """A submission linked to an existing complaint instead of creating a new one"""
+    id = db.Column(db.Integer, primary_key=True)
+    complaint_id = db.Column(COMPLAINT_ID, nullable=False, index=True)
+    user_id = db.Column(db.String(100))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    description = db.Column(db.Text)
+    similarity = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Complaint letter template and address gazetteer
+from complaint_letters import render_letter
+
+# Nearest-department routing over an in-memory spatial index of the departments table
+from department_routing import create_department_router
+
+department_router = create_department_router(lambda: Department.query.all())
+department_router.watch(db.session, Department)
+LOCATION_ROUTING = os.getenv('LOCATION_ROUTING', 'true').lower() in ('1', 'true', 'yes')
+
 # Import the model inference module
 from model_inference import IssueClassifier
+# Versioned weights; the active model is hot-swapped in the background without a restart
+from model_registry import ModelManager, ModelRegistry
 
 # Initialize the classifier with the trained MobileNetV3 model
-# Using the best_urban_mobilenet.pth model from the model directory
+# Using the best_urban_mobilenet.pth model from the model directory, unless MODEL_PATH points
+# elsewhere (e.g. a memory-mapped copy made with convert_weights.py)
 # Get the project root directory (parent of backend)
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-model_path = os.path.join(project_root, 'model', 'best_urban_mobilenet.pth')
+model_path = os.getenv('MODEL_PATH') or os.path.join(project_root, 'model', 'best_urban_mobilenet.pth')
+
+# When MODEL_REGISTRY_DIR (default model/registry) has a registry.json, its current version is
+# served instead of MODEL_PATH (see model_registry.py)
+model_registry_dir = os.getenv('MODEL_REGISTRY_DIR') or os.path.join(project_root, 'model', 'registry')
+
+def load_classifier(path):
+    # Set num_classes=6 if your model was trained with all 6 categories (including illegal_parking)
+    # Set num_classes=5 if your model was trained with only 5 categories (without illegal_parking)
+    # MODEL_CBAM: auto (use the trained CBAM block when the checkpoint has it), true or false
+    return IssueClassifier(model_path=path, num_classes=6, cbam=os.getenv('MODEL_CBAM', 'auto'))
 
-# Set num_classes=6 if your model was trained with all 6 categories (including illegal_parking)
-# Set num_classes=5 if your model was trained with only 5 categories (without illegal_parking)
+model_manager = ModelManager(load_classifier, registry=ModelRegistry(model_registry_dir), fallback_path=model_path)
 try:
-    classifier = IssueClassifier(model_path=model_path, num_classes=6)
+    model_manager.load_initial()
     print("=" * 60)
     print("[OK] Model classifier initialized successfully!")
     print("=" * 60)
@@ -143,6 +403,25 @@ except Exception as e:
     print(str(e))
     print("=" * 60)
     raise
+model_manager.watch(float(os.getenv('MODEL_WATCH_INTERVAL', 10)))
+MODEL_ADMIN_TOKEN = os.getenv('MODEL_ADMIN_TOKEN')
+
+def active_model():
+    """The classifier for this request. Read once, so a request finishes on the model it started with."""
+    if 'model' not in g:
+        g.model_version, g.model = model_manager.current
+    return g.model
+
+@app.after_request
+def add_model_version_header(response):
+    response.headers['X-Model-Version'] = g.get('model_version') or model_manager.version
+    return response
+
+# Near-duplicate detection: photo embeddings in a place/time-filtered vector index
+from duplicates import (EmbeddingCache, blob_to_vector, create_duplicate_index, image_payload_key,
+                        vector_to_blob)
+duplicate_index = create_duplicate_index(SHARD_ID_SPAN if shard_router else None)
+embedding_cache = EmbeddingCache()
 
 # Utility Functions
 def get_address_from_coords(lat, lon):
@@ -193,252 +472,290 @@ def get_address_from_coords(lat, lon):
         print(f"Reverse geocoding error: {e}")
         return "Address not found"
 
-def get_department_for_issue(issue_type):
-    """Assign department based on issue type"""
-    department_mapping = {
-        # Model categories (6 categories from MobileNetV3)
-        'damaged_signs': 'Traffic Department',
-        'fallen_trees': 'Public Works',
-        'garbage': 'Sanitation',
-        'graffiti': 'Public Works',
-        'illegal_parking': 'Traffic Department',
-        'potholes': 'Public Works',
-        
-        # Legacy categories (for backward compatibility)
-        'pothole': 'Public Works',
-        'street_light': 'Public Works',
-        'sidewalk_damage': 'Public Works',
-        'road_damage': 'Public Works',
-        'bridge_issue': 'Public Works',
-        'street_repair': 'Public Works',
-        
-        # Water Department
-        'water_leak': 'Water Department',
-        'drainage': 'Water Department',
-        'sewage_issue': 'Water Department',
-        'water_supply': 'Water Department',
-        
-        # Traffic Department
-        'traffic_signal': 'Traffic Department',
-        'traffic_sign': 'Traffic Department',
-        'road_marking': 'Traffic Department',
-        'traffic_light': 'Traffic Department',
-        
-        # Sanitation
-        'waste_management': 'Sanitation',
-        'cleanliness': 'Sanitation',
-        
-        # Health Department
-        'health_issue': 'Health Department',
-        'medical_emergency': 'Health Department',
-        'sanitation_health': 'Health Department',
-        
-        # Education Department
-        'school_issue': 'Education Department',
-        'education_facility': 'Education Department',
-        
-        # Default for unknown issues
-        'other': 'Public Works'
-    }
-    return department_mapping.get(issue_type, 'Public Works')  # Always return a valid department
-
-def find_nearest_department(lat, lon, issue_type):
-    departments = Department.query.all()
-    if not departments:
-        return None
-    
-    min_distance = float('inf')
-    nearest_dept = None
-    
-    for dept in departments:
-        if dept.latitude and dept.longitude:
-            distance = geodesic((lat, lon), (dept.latitude, dept.longitude)).kilometers
-            if distance < min_distance:
-                min_distance = distance
-                nearest_dept = dept
-    
-    return nearest_dept
-
-def generate_formal_complaint(issue_type, description, location, latitude=None, longitude=None, priority='normal', department=None, user_id='anonymous'):
-    """
-    Generate a professional, formal complaint letter with actual details.
-    Uses 100% template-based approach - NO placeholders, all actual data.
-    
-    Args:
-        issue_type: Type of issue (e.g., 'potholes')
-        description: User description of the issue
-        location: Full address
-        latitude: GPS latitude
-        longitude: GPS longitude
-        priority: Priority level (low, normal, high, urgent)
-        department: Assigned department name
-        user_id: User identifier
-    
-    Returns:
-        str: Complete complaint letter with no placeholders
-    """
+# Static issue type -> department mapping, used when no located department handles the type
+DEPARTMENT_MAPPING = {
+    # Model categories (6 categories from MobileNetV3)
+    'damaged_signs': 'Traffic Department',
+    'fallen_trees': 'Public Works',
+    'garbage': 'Sanitation',
+    'graffiti': 'Public Works',
+    'illegal_parking': 'Traffic Department',
+    'potholes': 'Public Works',
     
-    # Format issue type for display
-    issue_type_display = issue_type.replace('_', ' ').title()
-    
-    # Extract city and state from location if available
-    # Format: "Jajmau, Kanpur, Kanpur Nagar, Uttar Pradesh, 208015, India"
-    location_parts = [part.strip() for part in location.split(',')] if location else []
-    
-    # Try to extract city and state from location parts
-    city = "Kanpur"  # Default
-    state = "Uttar Pradesh"  # Default
-    
-    if len(location_parts) >= 4:
-        # Usually format: Area, City, District, State, Pincode, Country
-        for i, part in enumerate(location_parts):
-            # Check for common state names in India
-            state_names = ['Uttar Pradesh', 'Maharashtra', 'Karnataka', 'Gujarat', 'Rajasthan', 'Punjab', 
-                          'West Bengal', 'Tamil Nadu', 'Andhra Pradesh', 'Madhya Pradesh', 'Bihar', 'Odisha', 
-                          'Assam', 'Haryana', 'Kerala', 'Jharkhand', 'Chhattisgarh', 'Delhi', 
-                          'Himachal Pradesh', 'Uttarakhand', 'Goa', 'Manipur', 'Meghalaya', 'Mizoram', 
-                          'Nagaland', 'Sikkim', 'Tripura', 'Arunachal Pradesh', 'Telangana']
-            if any(state_name in part for state_name in state_names):
-                state = part
-                # City is usually the part before state
-                if i > 0:
-                    city = location_parts[i-1]
-                break
+    # Legacy categories (for backward compatibility)
+    'pothole': 'Public Works',
+    'street_light': 'Public Works',
+    'sidewalk_damage': 'Public Works',
+    'road_damage': 'Public Works',
+    'bridge_issue': 'Public Works',
+    'street_repair': 'Public Works',
     
-    # Fallback: use index-based extraction
-    if city == "Kanpur" and len(location_parts) >= 2:
-        # Try to find city (usually second to last before pincode)
-        for i, part in enumerate(location_parts):
-            if part.lower() in ['kanpur', 'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad', 'pune', 'ahmedabad']:
-                city = part
-                break
-        if city == "Kanpur" and len(location_parts) >= 2:
-            city = location_parts[-3] if len(location_parts) >= 3 else location_parts[-2]
-    
-    if state == "Uttar Pradesh" and len(location_parts) >= 2:
-        # Skip pincode and country, get state
-        for part in reversed(location_parts):
-            if not part.isdigit() and part.lower() not in ['india', 'indian']:
-                if any(s in part for s in ['Pradesh', 'Bengal', 'Nadu', 'Kerala', 'Gujarat', 'Rajasthan']):
-                    state = part
-                    break
+    # Water Department
+    'water_leak': 'Water Department',
+    'drainage': 'Water Department',
+    'sewage_issue': 'Water Department',
+    'water_supply': 'Water Department',
     
-    # Format coordinates
-    coordinates_text = ""
-    if latitude and longitude:
-        coordinates_text = f"Latitude: {latitude:.6f}° N\nLongitude: {longitude:.6f}° E"
-    
-    # Priority mapping
-    priority_map = {
-        'low': 'Low',
-        'normal': 'Normal',
-        'high': 'High',
-        'urgent': 'Urgent'
-    }
-    priority_display = priority_map.get(priority, 'Normal')
+    # Traffic Department
+    'traffic_signal': 'Traffic Department',
+    'traffic_sign': 'Traffic Department',
+    'road_marking': 'Traffic Department',
+    'traffic_light': 'Traffic Department',
     
-    # Department name
-    dept_name = department or get_department_for_issue(issue_type)
+    # Sanitation
+    'waste_management': 'Sanitation',
+    'cleanliness': 'Sanitation',
     
-    # Current date
-    current_date = datetime.now().strftime('%B %d, %Y')
+    # Health Department
+    'health_issue': 'Health Department',
+    'medical_emergency': 'Health Department',
+    'sanitation_health': 'Health Department',
     
-    # Build description text
-    if description:
-        description_text = description
-    else:
-        # Generate default description based on issue type
-        issue_descriptions = {
-            'potholes': f'The road surface in {location} has multiple potholes that are causing significant disruption to traffic flow and posing safety risks to vehicles and pedestrians.',
-            'damaged_signs': f'Traffic signs or road signs in {location} are damaged, missing, or illegible, which poses safety risks to motorists and pedestrians.',
-            'fallen_trees': f'Fallen trees or tree branches in {location} are blocking roads or pathways, creating obstacles and potential safety hazards.',
-            'garbage': f'Garbage and waste accumulation in {location} is causing health and environmental concerns, requiring immediate cleanup and waste management.',
-            'graffiti': f'Unauthorized graffiti and vandalism in {location} is affecting the aesthetic appearance of public spaces and may indicate security concerns.',
-            'illegal_parking': f'Illegal parking in {location} is obstructing traffic flow and creating safety hazards for vehicles and pedestrians.',
-            'street_light': f'Street lights in {location} are not functioning properly, creating safety concerns especially during nighttime hours.',
-            'water_leak': f'Water leaks in {location} are causing water wastage and potential damage to infrastructure and surrounding areas.',
-            'traffic_signal': f'Traffic signals in {location} are malfunctioning or not working, creating traffic congestion and safety risks.',
-            'sidewalk_damage': f'Sidewalk damage in {location} is creating hazards for pedestrians and requires immediate repair.',
-            'drainage': f'Drainage issues in {location} are causing water accumulation and potential flooding risks.',
-        }
-        description_text = issue_descriptions.get(issue_type, f'Civic infrastructure issue of type {issue_type_display.lower()} has been identified in {location} and requires immediate attention to ensure public safety.')
+    # Education Department
+    'school_issue': 'Education Department',
+    'education_facility': 'Education Department',
     
-    # Build complaint letter using template (NO placeholders - all actual data)
-    complaint_letter = f"""Nagrik Nivedan Platform
-Complaint Reference: {user_id}
-
-{current_date}
-
-To,
-The Municipal Commissioner,
-{city} Municipal Corporation,
-{city}, {state}, India.
-
-**Subject: Formal Complaint Regarding {issue_type_display} Issue in {location}**
-
-Dear Sir/Madam,
-
-This letter serves as a formal complaint regarding a {issue_type_display.lower()} issue that has been identified in {location} and requires immediate attention.
-
-**COMPLAINT DETAILS:**
-
-**Issue Type:** {issue_type_display} (AI-Identified)
-**Priority:** {priority_display} Priority
-**Location:** {location}
-{f'**Coordinates:**\n{coordinates_text}' if coordinates_text else ''}
-**Date:** {current_date}
-**Assigned Department:** {dept_name}
-**Complaint ID:** {user_id}
+    # Default for unknown issues
+    'other': 'Public Works'
+}
 
-**DESCRIPTION:**
-
-{description_text}
+def get_department_for_issue(issue_type, latitude=None, longitude=None):
+    """
+    Assign department based on issue type, and on location when coordinates are given.
 
-**LOCATION DETAILS:**
+    With coordinates (and LOCATION_ROUTING enabled) the nearest department whose
+    issue_types include issue_type is chosen; otherwise, or when no department
+    handles it, the static mapping applies.
 
-- **Full Address:** {location}
-{f'- **GPS Coordinates:** {coordinates_text}' if coordinates_text else ''}
-{f'- **Captured from user\'s device GPS**' if coordinates_text else ''}
+    Args:
+        issue_type: Type of issue (e.g., 'potholes')
+        latitude, longitude: Optional complaint coordinates
 
-**URGENCY ASSESSMENT:**
+    Returns:
+        str: Department name (always a valid department)
+    """
+    if LOCATION_ROUTING and latitude is not None and longitude is not None:
+        try:
+            dept, _ = department_router.nearest(float(latitude), float(longitude), issue_type)
+            if dept is not None:
+                return dept.name
+        except (TypeError, ValueError):
+            pass  # unparseable coordinates: fall back to the static mapping
+    return DEPARTMENT_MAPPING.get(issue_type, 'Public Works')
 
-We consider this issue to be of **{priority_display.lower()} priority**. The condition of the {issue_type_display.lower()} in {location} requires attention to ensure public safety and maintain service standards. {'Given the ' + priority_display.lower() + ' priority level, we request immediate action to address this matter.' if priority in ['high', 'urgent'] else 'Prompt action is necessary to prevent further deterioration and ensure the safety of residents and commuters.'}
+def parse_bbox(value):
+    """Parse a bounding box given as 'min_lat,min_lon,max_lat,max_lon' or a 4-item list."""
+    parts = value.split(',') if isinstance(value, str) else value
+    if not isinstance(parts, (list, tuple)) or len(parts) != 4:
+        raise ValueError('bbox must be min_lat,min_lon,max_lat,max_lon')
+    return tuple(float(p) for p in parts)
 
-**POTENTIAL SAFETY CONCERNS:**
+def find_nearest_department(lat, lon, issue_type=None):
+    """
+    Nearest department handling issue_type, or the nearest of all if none handles it.
 
-The presence of this {issue_type_display.lower()} issue presents several potential safety concerns, including:
-- Increased risk of accidents, particularly for vehicles and pedestrians
-- Potential damage to vehicles and infrastructure
-- Disruption to traffic flow and public safety
-- Risk of injury to residents and commuters
+    Returns:
+        DepartmentEntry (id, name, latitude, longitude, issue_types, contact_info) or None
+    """
+    dept, _ = department_router.nearest(lat, lon, issue_type)
+    if dept is None and issue_type is not None:
+        dept, _ = department_router.nearest(lat, lon)
+    return dept
 
-**REQUEST FOR IMMEDIATE ACTION:**
+def decode_image(image_data):
+    """
+    Decode a base64 / data URL image into an RGB PIL Image, within the upload budgets.
+    
+    Raises:
+        ImageRejected (a ValueError): with a client-facing message and HTTP status
+    """
+    return image_guard.decode(image_data)
 
-We respectfully request that the {dept_name} take immediate action to address this critical issue. Specifically, we request the following:
+def embedding_cache_key(image_data):
+    """Cache key of a photo's embedding under the request's model version (None if not cacheable)."""
+    payload_key = image_payload_key(image_data)
+    return f"{g.model_version}:{payload_key}" if payload_key else None
 
-1. **Immediate Inspection:** Conduct a thorough inspection of the location in {location} to assess the extent of the {issue_type_display.lower()} issue.
+def complaint_embedding_for(image_data):
+    """Embedding of a submitted photo, reused from /api/classify-issue when possible. None on failure."""
+    model = active_model()
+    key = embedding_cache_key(image_data)
+    vector = embedding_cache.get(key)
+    if vector is None:
+        try:
+            vector = model.embed(np.array(decode_image(image_data)))
+        except Exception as e:
+            print(f"[WARN] Could not embed complaint image: {e}")
+            return None
+        embedding_cache.put(key, vector)
+    return vector
 
-2. **Assessment and Remediation:** Implement appropriate measures to resolve the {issue_type_display.lower()} issue and restore the area to a safe and usable condition.
+def sync_duplicate_index():
+    """Catch the in-memory index up with embeddings stored by any worker."""
+    since = datetime.utcnow() - timedelta(seconds=duplicate_index.window_seconds)
+    # Usually only past the cursors; now and then also the overlap below them, for late commits
+    rescan = duplicate_index.rescan_due()
+    # One cursor per shard id range: ids of a later shard must not hide new ones of an earlier shard
+    if shard_router is None:
+        after_cursor = ComplaintEmbedding.complaint_id > duplicate_index.sync_from(rescan=rescan)
+    else:
+        after_cursor = or_(*[
+            ComplaintEmbedding.complaint_id.between(duplicate_index.sync_from(base, rescan) + 1,
+                                                    base + SHARD_ID_SPAN - 1)
+            for base in (number * SHARD_ID_SPAN for number in shard_router.numbers.values())
+        ])
+    conditions = (after_cursor, ComplaintEmbedding.created_at >= since)
+    if rescan:
+        # Ids only first: the vectors of rows already indexed are not loaded again
+        ids = [complaint_id for complaint_id in db.session.scalars(
+            select(ComplaintEmbedding.complaint_id).where(*conditions))
+            if not duplicate_index.contains(complaint_id)]
+        conditions = (ComplaintEmbedding.complaint_id.in_(ids),) if ids else None
+    if conditions:
+        rows = ComplaintEmbedding.query.filter(*conditions).order_by(ComplaintEmbedding.complaint_id).all()
+        for row in rows:
+            index_complaint_embedding(row)
+    duplicate_index.prune_if_due()
 
-3. **Preventative Measures:** Explore and implement preventative measures to prevent the recurrence of similar issues in the future, such as improved maintenance and use of durable materials.
+def index_complaint_embedding(row):
+    """Add a ComplaintEmbedding row to this worker's duplicate index."""
+    duplicate_index.add(row.complaint_id, row.latitude, row.longitude,
+                        row.created_at.replace(tzinfo=timezone.utc).timestamp(),
+                        row.issue_type, blob_to_vector(row.vector), row.model_version)
 
-4. **Status Updates:** Provide updates on the progress through our tracking system (Complaint ID: {user_id}).
+def find_duplicate_complaint(vector, issue_type, lat, lon):
+    """
+    Most similar open complaint of the same type nearby and recent, if any. Only
+    embeddings from the request's model version are compared.
+    
+    Returns:
+        tuple: (IssueReport, similarity) or (None, None)
+    """
+    sync_duplicate_index()
+    for complaint_id, similarity, _ in duplicate_index.query(lat, lon, vector, issue_type,
+                                                             model_version=g.model_version):
+        with shard_scope(complaint_shard(complaint_id)):
+            complaint = db.session.get(IssueReport, complaint_id)
+        if complaint is not None and (complaint.status or 'pending') not in CLOSED_STATUSES:
+            return complaint, similarity
+    return None, None
 
-We believe that prompt action is essential to mitigate any risks associated with this issue and ensure the safety and well-being of the residents and commuters in {location}. We look forward to a timely response and a concrete plan of action to address this matter.
+def link_duplicate_report(original, similarity, data, lat, lon):
+    """Record a submission as a duplicate of an existing complaint and build the submit response."""
+    # Expired by the commit, the original is reloaded from its own shard
+    with shard_scope(complaint_shard(original.id)):
+        db.session.add(DuplicateReport(
+            complaint_id=original.id,
+            user_id=data.get('user_id', 'anonymous'),
+            latitude=lat,
+            longitude=lon,
+            description=data.get('description', ''),
+            similarity=similarity
+        ))
+        db.session.commit()
+        response_cache.invalidate(f'complaint:{original.id}')
+        event_bus.publish('complaint.duplicate', complaint_event_data(original))
+        return jsonify({
+            'success': True,
+            'complaint_id': original.id,
+            'duplicate_of': original.id,
+            'similarity': round(similarity, 4),
+            'department': original.department,
+            'issue_type': original.issue_type
+        })
 
-Thank you for your attention to this important issue.
+def save_complaint_image(image_data):
+    """Save a base64 (or data URL) image to uploads/. Returns the relative path or None."""
+    if not image_data:
+        return None
+    try:
+        # Create images directory if it doesn't exist
+        uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+        os.makedirs(uploads_dir, exist_ok=True)
+        
+        # Generate unique filename
+        filename = f"{uuid.uuid4().hex}.jpg"
+        image_path = f"uploads/{filename}"
+        
+        # Save image
+        if image_data.startswith('data:image'):
+            # Remove data URL prefix
+            image_data = image_data.split(',')[1]
+        
+        full_image_path = os.path.join(uploads_dir, filename)
+        with open(full_image_path, 'wb') as f:
+            f.write(base64.b64decode(image_data))
+        return image_path
+        
+    except Exception as e:
+        print(f"Error saving image: {e}")
+        traceback.print_exc()
+        return None
 
-Respectfully,
+def remove_complaint_image(image_path):
+    """Delete an image saved by save_complaint_image (used when its insert is rolled back)."""
+    if not image_path:
+        return
+    try:
+        os.remove(os.path.join(os.path.dirname(os.path.abspath(__file__)), image_path))
+    except OSError:
+        pass
 
-Nagrik Nivedan Platform
-Complaint ID: {user_id}
-{current_date}"""
+def generate_formal_complaint(issue_type, description, location, latitude=None, longitude=None, priority='normal', department=None, user_id='anonymous', letter_date=None):
+    """
+    Generate a professional, formal complaint letter with actual details.
+    Uses 100% template-based approach - NO placeholders, all actual data.
+    See complaint_letters.py for the precompiled template and address parsing.
     
-    # Final cleanup - remove any remaining brackets or placeholder-like text (shouldn't be any, but just in case)
-    complaint_letter = re.sub(r'\[.*?\]', '', complaint_letter)
-    complaint_letter = re.sub(r'\n{3,}', '\n\n', complaint_letter)
+    Args:
+        issue_type: Type of issue (e.g., 'potholes')
+        description: User description of the issue
+        location: Full address
+        latitude: GPS latitude
+        longitude: GPS longitude
+        priority: Priority level (low, normal, high, urgent)
+        department: Assigned department name
+        user_id: User identifier
+        letter_date: Date printed on the letter (defaults to today)
     
-    return complaint_letter.strip()
+    Returns:
+        str: Complete complaint letter with no placeholders
+    """
+    return render_letter(
+        issue_type, description, location, latitude, longitude, priority,
+        department or get_department_for_issue(issue_type, latitude, longitude), user_id, letter_date
+    )
+
+@lru_cache(maxsize=int(os.getenv('LETTER_CACHE_SIZE', 1024)))
+def render_complaint_letter(issue_type, description, location, latitude, longitude, priority, department, user_id, letter_date):
+    """Memoized generate_formal_complaint(); the template is deterministic for fixed inputs."""
+    return generate_formal_complaint(
+        issue_type=issue_type,
+        description=description,
+        location=location,
+        latitude=latitude,
+        longitude=longitude,
+        priority=priority,
+        department=department,
+        user_id=user_id,
+        letter_date=letter_date
+    )
+
+def complaint_letter(complaint):
+    """The stored letter for legacy rows, otherwise the letter rendered from the row's fields."""
+    if complaint.formal_complaint:
+        return complaint.formal_complaint
+    return render_complaint_letter(
+        complaint.issue_type or 'other',
+        complaint.description,
+        complaint.address,
+        complaint.latitude,
+        complaint.longitude,
+        complaint.priority or 'normal',
+        complaint.department,
+        complaint.user_id,
+        complaint.created_at.date() if complaint.created_at else None
+    )
 
 # API Routes
 @app.route('/api/classify-issue', methods=['POST'])
@@ -446,54 +763,27 @@ def classify_issue():
     try:
         data = request.json
         image_data = data.get('image') if data else None
-        mime_hint = None
         
         if not image_data:
             return jsonify({'error': 'No image provided'}), 400
         
-        # Decode base64 image (supports both data URL and raw base64)
-        try:
-            if isinstance(image_data, str) and image_data.startswith('data:image'):
-                # data URL format: data:image/<type>;base64,<payload>
-                try:
-                    header, payload = image_data.split(',', 1)
-                    # Example header: data:image/webp;base64
-                    if ';' in header and ':' in header:
-                        mime_hint = header.split(':', 1)[1].split(';', 1)[0]  # image/webp, image/jpeg, etc.
-                    image_data = payload
-                except Exception:
-                    # Fallback if split fails
-                    image_data = image_data.split(',', 1)[1]
-            image_bytes = base64.b64decode(image_data)
-        except Exception:
-            return jsonify({'error': 'Invalid image format. Expected a base64-encoded image string.'}), 400
-        
-        # Open image (PIL first, then OpenCV fallback for formats like WEBP)
         try:
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        except Exception:
-            try:
-                # Fallback: OpenCV decode (handles webp if build supports it)
-                npbuf = np.frombuffer(image_bytes, np.uint8)
-                cv_img = cv2.imdecode(npbuf, cv2.IMREAD_COLOR)  # BGR
-                if cv_img is None:
-                    raise ValueError("cv2.imdecode returned None")
-                cv_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-                image = Image.fromarray(cv_img)
-            except Exception:
-                msg = 'Failed to decode image bytes.'
-                if mime_hint:
-                    msg += f' mime={mime_hint}'
-                return jsonify({'error': msg}), 400
+            image = decode_image(image_data)
+        except ImageRejected as e:
+            return jsonify({'error': str(e)}), e.status
         
         # Convert to numpy array for processing
         image_array = np.array(image)
         
-        # Classify the issue
-        result = classifier.classify_issue(image_array)
+        # Classify the issue; keep the embedding for the submit that usually follows
+        result = active_model().classify_issue(image_array, return_embedding=True)
+        embedding_cache.put(embedding_cache_key(image_data), result.pop('embedding'))
+        result['model_version'] = g.model_version
         
         return jsonify(result)
     
+    except HTTPException:
+        raise  # e.g. 400 from request.json on a malformed body
     except Exception as e:
         print("Classification endpoint error:", e)
         print(traceback.format_exc())
@@ -502,6 +792,46 @@ def classify_issue():
             'detail': str(e)
         }), 500
 
+def admin_authorized():
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(MODEL_ADMIN_TOKEN) and hmac.compare_digest(supplied.encode(), MODEL_ADMIN_TOKEN.encode())
+
+@app.route('/api/admin/model', methods=['GET'])
+def model_status():
+    """Active model version, reload state and registry versions (requires X-Admin-Token)"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        return jsonify(model_manager.status())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/model/reload', methods=['POST'])
+def reload_model():
+    """
+    Load a model version in the background and swap it in (requires X-Admin-Token).
+    
+    Body (optional): {"version": "v3", "activate": true}
+    Without a version the registry's current one is loaded. activate=true also makes the
+    version current in the registry, so every other worker's watcher follows.
+    """
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        data = request.get_json(silent=True) or {}
+        version = data.get('version')
+        if version and version not in model_manager.registry.read()['versions']:
+            return jsonify({'error': f"Unknown model version: {version}"}), 400
+        if version and data.get('activate'):
+            model_manager.registry.activate(version)
+        if not model_manager.reload(version):
+            return jsonify({'error': 'A model load is already in progress', 'status': model_manager.status()}), 409
+        return jsonify({'accepted': True, 'status': model_manager.status()}), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/submit-complaint', methods=['POST'])
 def submit_complaint():
     try:
@@ -515,6 +845,17 @@ def submit_complaint():
         # Get location details
         lat = data.get('latitude')
         lon = data.get('longitude')
+        
+        # A photo of an open complaint nearby is linked to it instead of creating a new one
+        embedding = None
+        if duplicate_index is not None and data.get('image') and isinstance(lat, (int, float)) \
+                and isinstance(lon, (int, float)):
+            embedding = complaint_embedding_for(data.get('image'))
+            if embedding is not None:
+                original, similarity = find_duplicate_complaint(embedding, issue_type, lat, lon)
+                if original is not None:
+                    return link_duplicate_report(original, similarity, data, lat, lon)
+        
         # Prefer client-provided address if available; fallback to reverse geocoding
         if data.get('address'):
             address = data.get('address')
@@ -523,8 +864,8 @@ def submit_complaint():
         else:
             address = "Location not provided"
         
-        # Assign department based on issue type
-        assigned_department = get_department_for_issue(issue_type)
+        # Assign department based on issue type and location
+        assigned_department = get_department_for_issue(issue_type, lat, lon)
         
         # Get priority (default to normal)
         priority = data.get('priority', 'normal')
@@ -532,95 +873,365 @@ def submit_complaint():
         # Get user ID
         user_id = data.get('user_id', 'anonymous')
         
-        # Generate formal complaint with all details
-        formal_complaint = generate_formal_complaint(
-            issue_type=issue_type,
-            description=data.get('description', ''),
-            location=address,
-            latitude=lat,
-            longitude=lon,
-            priority=priority,
-            department=assigned_department,
-            user_id=user_id
-        )
-        
         # Save image if provided
-        image_path = None
-        if data.get('image'):
-            try:
-                # Create images directory if it doesn't exist
-                uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-                os.makedirs(uploads_dir, exist_ok=True)
-                
-                # Generate unique filename
-                filename = f"{uuid.uuid4().hex}.jpg"
-                image_path = f"uploads/{filename}"
-                
-                # Save image
-                image_data = data.get('image')
-                if image_data.startswith('data:image'):
-                    # Remove data URL prefix
-                    image_data = image_data.split(',')[1]
-                
-                full_image_path = os.path.join(uploads_dir, filename)
-                with open(full_image_path, 'wb') as f:
-                    f.write(base64.b64decode(image_data))
-                    
-            except Exception as e:
-                print(f"Error saving image: {e}")
-                traceback.print_exc()
-                image_path = None
+        image_path = save_complaint_image(data.get('image'))
 
-        # Create issue report
-        issue_report = IssueReport(
-            user_id=user_id,
-            issue_type=issue_type,  # Ensure issue_type is always set
-            latitude=lat,
-            longitude=lon,
-            address=address,
-            description=data.get('description', ''),
-            formal_complaint=formal_complaint,
-            department=assigned_department,
-            status='pending',
-            priority=priority,  # Set priority
-            image_path=image_path
-        )
+        row = {
+            'user_id': user_id,
+            'issue_type': issue_type,  # Ensure issue_type is always set
+            'latitude': lat,
+            'longitude': lon,
+            'address': address,
+            'description': data.get('description', ''),
+            'department': assigned_department,
+            'status': 'pending',
+            'priority': priority,  # Set priority
+            'image_path': image_path
+        }
         
-        db.session.add(issue_report)
-        db.session.commit()
+        now = datetime.utcnow()
+        row.update(created_at=now, updated_at=now)
+        embedding_row = None
+        if embedding is not None:
+            embedding_row = ComplaintEmbedding(vector=vector_to_blob(embedding), issue_type=issue_type,
+                                               latitude=lat, longitude=lon, model_version=g.model_version,
+                                               created_at=now)
+        
+        if group_writer is not None:
+            # Committed together with other concurrent submissions; the writer
+            # invalidates the cache and publishes the events
+            future = group_writer.submit(row)
+            try:
+                complaint_id = future.result(timeout=GROUP_COMMIT_TIMEOUT)
+            except Exception:
+                if future.done():  # the insert failed; a timed-out row may still be committed
+                    remove_complaint_image(image_path)
+                raise
+            if embedding_row is not None:
+                embedding_row.complaint_id = complaint_id
+                db.session.add(embedding_row)
+                db.session.commit()
+        else:
+            # Create issue report (in its region's shard)
+            with shard_scope(location_shard(lat, lon)):
+                issue_report = IssueReport(**row)
+                db.session.add(issue_report)
+                if embedding_row is not None:
+                    db.session.flush()  # assigns the id; the embedding commits with the complaint
+                    embedding_row.complaint_id = issue_report.id
+                    db.session.add(embedding_row)
+                db.session.commit()
+                complaint_id = issue_report.id
+                response_cache.invalidate('complaints')
+                event_bus.publish('complaint.created', complaint_event_data(issue_report))
+        
+        if embedding is not None:
+            duplicate_index.add(complaint_id, lat, lon, now.replace(tzinfo=timezone.utc).timestamp(),
+                                issue_type, embedding, g.model_version)
         
         return jsonify({
             'success': True,
-            'complaint_id': issue_report.id,
+            'complaint_id': complaint_id,
             'department': assigned_department,
             'issue_type': issue_type
         })
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error submitting complaint: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/track-complaint/<int:complaint_id>', methods=['GET'])
-def track_complaint(complaint_id):
+# Offline-sync batch ingestion
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 500))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 100))
+
+def validate_batch_item(item):
+    """Normalize one batch item. Returns (fields, error_message)."""
+    if not isinstance(item, dict):
+        return None, 'Item must be an object'
+    issue_type = item.get('issue_type') or item.get('issueType')
+    if not issue_type:
+        return None, 'Issue type is required'
+    lat = item.get('latitude')
+    lon = item.get('longitude')
+    if (lat is None) != (lon is None):
+        return None, 'Latitude and longitude must be provided together'
+    if lat is not None:
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return None, 'Latitude and longitude must be numbers'
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None, 'Latitude or longitude out of range'
+    key = item.get('idempotency_key')
+    if key is not None and (not isinstance(key, str) or not key or len(key) > 200):
+        return None, 'idempotency_key must be a non-empty string of at most 200 characters'
+    return {
+        'issue_type': issue_type,
+        'latitude': lat,
+        'longitude': lon,
+        'address': item.get('address'),
+        'description': item.get('description', ''),
+        'priority': item.get('priority', 'normal'),
+        'user_id': item.get('user_id', 'anonymous'),
+        'image': item.get('image'),
+        'idempotency_key': key
+    }, None
+
+def insert_complaint_chunk(chunk):
+    """
+    Bulk insert one chunk of prepared rows (plus their idempotency keys) in one transaction,
+    one per shard when sharded. If a later shard fails to commit, the earlier shards'
+    complaints are stored with their keys, so a retry reports them as duplicates.
+    
+    Args:
+        chunk: list of (index, row, idempotency_key) tuples
+    
+    Returns:
+        list of complaint ids, in chunk order
+    """
+    # One multi-row INSERT per shard the chunk's locations map to. Idempotency keys go to
+    # their complaint's shard, so a complaint never commits without its key
+    by_shard = {}
+    for position, (_, row, _) in enumerate(chunk):
+        by_shard.setdefault(location_shard(row['latitude'], row['longitude']), []).append(position)
+    ids = [None] * len(chunk)
+    for shard, positions in by_shard.items():
+        with shard_scope(shard):
+            shard_ids = db.session.scalars(
+                insert(IssueReport).returning(IssueReport.id, sort_by_parameter_order=True),
+                [chunk[position][1] for position in positions]
+            ).all()
+            keys = [{'key': chunk[position][2], 'complaint_id': complaint_id}
+                    for position, complaint_id in zip(positions, shard_ids) if chunk[position][2]]
+            if keys:
+                db.session.execute(insert(SubmissionKey), keys)
+        for position, complaint_id in zip(positions, shard_ids):
+            ids[position] = complaint_id
+    db.session.commit()
+    return ids
+
+def find_submission_keys(keys):
+    """{idempotency key: complaint id} for the keys already ingested, from every shard."""
+    if not keys:
+        return {}
+    statement = select(SubmissionKey.key, SubmissionKey.complaint_id).where(SubmissionKey.key.in_(list(keys)))
+    if shard_router is None:
+        return dict(db.session.execute(statement).all())
+    return {key: complaint_id for rows in shard_router.scatter(lambda conn: conn.execute(statement).all())
+            for key, complaint_id in rows}
+
+def write_complaint_rows(rows):
+    """Insert rows in one transaction for the group-commit writer (rolls back on failure)."""
     try:
-        complaint = IssueReport.query.get_or_404(complaint_id)
+        return insert_complaint_chunk([(None, row, None) for row in rows])
+    except Exception:
+        db.session.rollback()
+        raise
+
+def after_group_commit(rows, ids):
+    response_cache.invalidate('complaints')
+    for row, complaint_id in zip(rows, ids):
+        event_bus.publish('complaint.created', complaint_event_data(IssueReport(id=complaint_id, **row)))
+
+# Optional group commit of concurrent single submissions (GROUP_COMMIT=true)
+from group_commit import create_group_commit_writer
+group_writer = create_group_commit_writer(app, write_complaint_rows, after_group_commit)
+GROUP_COMMIT_TIMEOUT = float(os.getenv('GROUP_COMMIT_TIMEOUT', 30))
+
+@app.route('/api/submit-complaints/batch', methods=['POST'])
+def submit_complaints_batch():
+    """
+    Submit many complaints at once (offline kiosks / field app sync).
+    
+    Body: {"complaints": [<submit-complaint body> + optional "idempotency_key"], "atomic": false}
+    With atomic=true the batch is all-or-nothing: one invalid item rejects it with a 400,
+    and the rest is inserted in one transaction (one per shard when sharded). Otherwise
+    valid items are committed in chunks of BATCH_CHUNK_SIZE and invalid ones reported
+    per item. Items whose idempotency_key was already ingested are reported as
+    duplicates with the existing complaint_id.
+    """
+    try:
+        try:
+            data = request.get_json()
+        except BadRequest:
+            return jsonify({'error': 'Invalid JSON body'}), 400
+        except UnsupportedMediaType:
+            return jsonify({'error': 'Content-Type must be application/json'}), 415
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Body must be a JSON object'}), 400
+        items = data.get('complaints')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'complaints must be a non-empty list'}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {BATCH_MAX_ITEMS} complaints per batch'}), 413
+        atomic = bool(data.get('atomic'))
+        
+        results = [None] * len(items)
+        pending = []  # (index, fields)
+        for index, item in enumerate(items):
+            fields, error = validate_batch_item(item)
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'error': error}
+            else:
+                pending.append((index, fields))
+        if atomic and len(pending) < len(items):
+            # All or nothing: one invalid item rejects the batch before anything is written
+            return jsonify({
+                'error': 'Batch rejected: atomic batches are all-or-nothing and some complaints are invalid',
+                'results': [result for result in results if result]
+            }), 400
+        
+        # Idempotency: one lookup for the whole batch, then de-duplicate within it
+        keys = {fields['idempotency_key'] for _, fields in pending if fields['idempotency_key']}
+        known = find_submission_keys(keys)
+        first_in_batch = {}
+        to_insert = []
+        for index, fields in pending:
+            key = fields['idempotency_key']
+            if key in known:
+                results[index] = {'index': index, 'status': 'duplicate', 'complaint_id': known[key]}
+            elif key and key in first_in_batch:
+                results[index] = {'index': index, 'status': 'duplicate', 'duplicate_of': first_in_batch[key]}
+            else:
+                if key:
+                    first_in_batch[key] = index
+                to_insert.append((index, fields))
+        
+        # Resolve departments and addresses once per distinct issue type / location
+        departments = {}  # (issue_type, lat, lon) -> department
+        addresses = {}
+        now = datetime.utcnow()
+        prepared = []  # (index, row, idempotency_key)
+        for index, fields in to_insert:
+            issue_type = fields['issue_type']
+            lat, lon = fields['latitude'], fields['longitude']
+            department_key = (issue_type, lat, lon)
+            if department_key not in departments:
+                departments[department_key] = get_department_for_issue(issue_type, lat, lon)
+            if fields['address']:
+                address = fields['address']
+            elif lat is not None:
+                location_key = (round(lat, 5), round(lon, 5))
+                if location_key not in addresses:
+                    addresses[location_key] = get_address_from_coords(lat, lon)
+                address = addresses[location_key]
+            else:
+                address = "Location not provided"
+            
+            prepared.append((index, {
+                'user_id': fields['user_id'],
+                'issue_type': issue_type,
+                'latitude': lat,
+                'longitude': lon,
+                'address': address,
+                'description': fields['description'],
+                'department': departments[department_key],
+                'status': 'pending',
+                'priority': fields['priority'],
+                'image_path': save_complaint_image(fields['image']),
+                'created_at': now,
+                'updated_at': now
+            }, fields['idempotency_key']))
+        
+        chunk_size = len(prepared) if atomic else BATCH_CHUNK_SIZE
+        created = []
+        for start in range(0, len(prepared), max(chunk_size, 1)):
+            chunk = prepared[start:start + chunk_size]
+            try:
+                try:
+                    ids = insert_complaint_chunk(chunk)
+                except IntegrityError:
+                    # A concurrent retry of the same sync won the race for some keys
+                    db.session.rollback()
+                    chunk_keys = [key for _, _, key in chunk if key]
+                    raced = find_submission_keys(chunk_keys)
+                    remaining = []
+                    for index, row, key in chunk:
+                        if key in raced:
+                            remove_complaint_image(row['image_path'])
+                            results[index] = {'index': index, 'status': 'duplicate', 'complaint_id': raced[key]}
+                        else:
+                            remaining.append((index, row, key))
+                    chunk = remaining
+                    ids = insert_complaint_chunk(chunk) if chunk else []
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error inserting complaint batch chunk: {e}")
+                traceback.print_exc()
+                for index, row, _ in chunk:
+                    remove_complaint_image(row['image_path'])
+                    results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+                if atomic:
+                    break
+                continue
+            for (index, row, _), complaint_id in zip(chunk, ids):
+                results[index] = {
+                    'index': index,
+                    'status': 'created',
+                    'complaint_id': complaint_id,
+                    'department': row['department'],
+                    'issue_type': row['issue_type']
+                }
+                created.append(IssueReport(id=complaint_id, **row))
+        
+        # Duplicates inside the batch point at the first item's outcome
+        for index, result in enumerate(results):
+            if result and 'duplicate_of' in result:
+                original = results[result.pop('duplicate_of')]
+                if original.get('complaint_id'):
+                    result['complaint_id'] = original['complaint_id']
+                else:
+                    results[index] = {'index': index, 'status': original['status'], 'error': original.get('error')}
+        
+        if created:
+            response_cache.invalidate('complaints')
+            for complaint in created:
+                event_bus.publish('complaint.created', complaint_event_data(complaint))
+        
+        summary = {status: sum(1 for r in results if r['status'] == status) for status in ('created', 'duplicate', 'error')}
         return jsonify({
-            'id': complaint.id,
-            'issue_type': complaint.issue_type or 'other',
-            'status': complaint.status or 'pending',
-            'priority': complaint.priority or 'normal',
-            'department': complaint.department,
-            'created_at': complaint.created_at.isoformat() if complaint.created_at else None,
-            'updated_at': complaint.updated_at.isoformat() if complaint.updated_at else None
+            'success': summary['error'] == 0,
+            'results': results,
+            **summary
         })
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error submitting complaint batch: {e}")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/track-complaint/<int:complaint_id>', methods=['GET'])
+@query_budget(2)
+def track_complaint(complaint_id):
+    try:
+        def build():
+            complaint = get_complaint_or_404(complaint_id)
+            return {
+                'id': complaint.id,
+                'issue_type': complaint.issue_type or 'other',
+                'status': complaint.status or 'pending',
+                'priority': complaint.priority or 'normal',
+                'department': complaint.department,
+                'created_at': complaint.created_at,
+                'updated_at': complaint.updated_at
+            }
+        
+        return response_cache.serve(build, tags=[f'complaint:{complaint_id}', BULK_UPDATE_TAG])
+    
     except Exception as e:
         print(f"Error tracking complaint: {e}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/complaints-map', methods=['GET'])
+@query_budget(2)
+@read_replica
 def get_complaints_map():
     try:
         lat = request.args.get('lat', type=float)
@@ -631,10 +1242,7 @@ def get_complaints_map():
             return jsonify({'error': 'Latitude and longitude required'}), 400
         
         # Get complaints within radius
-        complaints = IssueReport.query.filter(
-            IssueReport.latitude.isnot(None),
-            IssueReport.longitude.isnot(None)
-        ).all()
+        complaints = fetch_complaints(lambda model: (model.latitude.isnot(None), model.longitude.isnot(None)))
         
         nearby_complaints = []
         for complaint in complaints:
@@ -650,7 +1258,7 @@ def get_complaints_map():
                     'distance': distance
                 })
         
-        return jsonify({
+        return json_response({
             'complaints': nearby_complaints,
             'center': {'lat': lat, 'lon': lon},
             'radius': radius
@@ -660,105 +1268,353 @@ def get_complaints_map():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/heatmap-data', methods=['GET'])
+@query_budget(2)
+@read_replica
 def get_heatmap_data():
     try:
-        complaints = IssueReport.query.filter(
-            IssueReport.latitude.isnot(None),
-            IssueReport.longitude.isnot(None)
-        ).all()
-        
-        # Group complaints by location clusters (within 100m radius)
-        clusters = {}
-        cluster_radius = 0.001  # Approximately 100m
-        
-        for complaint in complaints:
-            lat, lng = complaint.latitude, complaint.longitude
+        def build():
+            complaints = fetch_complaints(lambda model: (model.latitude.isnot(None), model.longitude.isnot(None)))
+            
+            # Group complaints by location clusters (within 100m radius)
+            clusters = {}
+            cluster_radius = 0.001  # Approximately 100m
+            
+            for complaint in complaints:
+                lat, lng = complaint.latitude, complaint.longitude
+                
+                # Find existing cluster or create new one
+                cluster_found = False
+                for cluster_center, cluster_data in clusters.items():
+                    cluster_lat, cluster_lng = cluster_center
+                    distance = ((lat - cluster_lat) ** 2 + (lng - cluster_lng) ** 2) ** 0.5
+                    
+                    if distance < cluster_radius:
+                        clusters[cluster_center]['count'] += 1
+                        clusters[cluster_center]['complaints'].append(complaint)
+                        cluster_found = True
+                        break
+                
+                if not cluster_found:
+                    clusters[(lat, lng)] = {
+                        'count': 1,
+                        'complaints': [complaint],
+                        'center_lat': lat,
+                        'center_lng': lng
+                    }
             
-            # Find existing cluster or create new one
-            cluster_found = False
+            # Convert clusters to heatmap data with intensity based on complaint count
+            heatmap_data = []
             for cluster_center, cluster_data in clusters.items():
-                cluster_lat, cluster_lng = cluster_center
-                distance = ((lat - cluster_lat) ** 2 + (lng - cluster_lng) ** 2) ** 0.5
+                # Calculate intensity based on complaint count
+                intensity = min(cluster_data['count'] / 5.0, 1.0)  # Cap at 1.0 for 5+ complaints
                 
-                if distance < cluster_radius:
-                    clusters[cluster_center]['count'] += 1
-                    clusters[cluster_center]['complaints'].append(complaint)
-                    cluster_found = True
-                    break
+                heatmap_data.append({
+                    'lat': cluster_data['center_lat'],
+                    'lng': cluster_data['center_lng'],
+                    'weight': intensity,
+                    'count': cluster_data['count'],
+                    'complaints': [
+                        {
+                            'id': c.id,
+                            'issue_type': c.issue_type or 'other',
+                            'status': c.status or 'pending',
+                            'priority': c.priority or 'normal'
+                        } for c in cluster_data['complaints']
+                    ]
+                })
+            return heatmap_data
+        
+        return response_cache.serve(build, tags=['complaints'])
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+ALL_COMPLAINTS_MAX_LIMIT = int(os.getenv('ALL_COMPLAINTS_MAX_LIMIT', 1000))
+
+@app.route('/api/all-complaints', methods=['GET'])
+@query_budget(2)
+@read_replica
+def get_all_complaints():
+    try:
+        # Optional page (newest first): ?limit=<>&offset=<>
+        limit = request.args.get('limit', type=int)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        if limit is not None:
+            limit = min(max(limit, 1), ALL_COMPLAINTS_MAX_LIMIT)
+        
+        def build():
+            if limit is None:
+                complaints = fetch_complaints()
+            else:
+                complaints = fetch_complaints(limit=limit + 1, offset=offset)  # one extra row: is there a next page?
+                has_more = len(complaints) > limit
+                complaints = complaints[:limit]
             
-            if not cluster_found:
-                clusters[(lat, lng)] = {
-                    'count': 1,
-                    'complaints': [complaint],
-                    'center_lat': lat,
-                    'center_lng': lng
-                }
+            complaints_data = []
+            for complaint in complaints:
+                # Provide default values for None fields
+                issue_type = complaint.issue_type or 'other'
+                complaints_data.append({
+                    'id': complaint.id,
+                    'user_id': complaint.user_id,
+                    'issue_type': issue_type,
+                    'status': complaint.status or 'pending',
+                    'priority': complaint.priority or 'normal',
+                    'latitude': complaint.latitude,
+                    'longitude': complaint.longitude,
+                    'address': complaint.address,
+                    'description': complaint.description,
+                    'department': complaint.department,
+                    # Raw datetimes: the encoder serializes each one once
+                    'created_at': complaint.created_at,
+                    'updated_at': complaint.updated_at
+                })
+            
+            page = {
+                'complaints': complaints_data,
+                'total': len(complaints_data)
+            }
+            if limit is not None:
+                page.update(limit=limit, offset=offset, has_more=has_more)
+            return page
         
-        # Convert clusters to heatmap data with intensity based on complaint count
-        heatmap_data = []
-        for cluster_center, cluster_data in clusters.items():
-            # Calculate intensity based on complaint count
-            intensity = min(cluster_data['count'] / 5.0, 1.0)  # Cap at 1.0 for 5+ complaints
+        return response_cache.serve(build, tags=['complaints'])
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', 300))
+
+def elapsed_seconds(dialect, start, end):
+    """SQL expression for the seconds between two datetime expressions."""
+    if dialect.name == 'postgresql':
+        return func.extract('epoch', end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400.0
+
+def sql_median(conn, expr, source, conditions):
+    """Median of a SQL expression over the matching rows, computed in the database."""
+    count = conn.execute(select(func.count()).select_from(source).where(*conditions)).scalar()
+    if not count:
+        return None
+    middle = conn.execute(select(expr).select_from(source).where(*conditions).order_by(expr)
+                          .offset((count - 1) // 2).limit(2 - count % 2)).scalars().all()
+    return sum(middle) / len(middle)
+
+STATS_COLUMNS = ('id', 'issue_type', 'status', 'priority', 'department', 'latitude', 'longitude',
+                 'created_at', 'updated_at')
+
+def stats_source(since, until=None, bbox=None):
+    """
+    Complaints created in the window, from the hot table and the archive (UNION ALL).
+    
+    Each branch filters its own table, so both use their created_at index. The
+    'archived' column is 1 for rows from the archive.
+    """
+    branches = []
+    for model in (IssueReport, ArchivedIssueReport):
+        table = model.__table__
+        conditions = [table.c.created_at >= since]
+        if until:
+            conditions.append(table.c.created_at < until)
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            conditions.append(table.c.latitude.between(min_lat, max_lat))
+            conditions.append(table.c.longitude.between(min_lon, max_lon))
+        branches.append(select(*[table.c[name] for name in STATS_COLUMNS],
+                               literal(int(model is ArchivedIssueReport)).label('archived')).where(*conditions))
+    return union_all(*branches).subquery('complaints')
+
+def stats_aggregates(conn, source, now, durations=False):
+    """
+    Stats aggregates of one database.
+    
+    Args:
+        conn: connection (or session) to run the queries on
+        source: stats_source() subquery
+        now: reference time for open complaint ages
+        durations: return the resolution / open-age durations themselves instead of
+                   their medians, so results of several shards can be merged exactly
+    """
+    c = source.c
+    
+    def counts_by(column, default):
+        key = func.coalesce(column, default)
+        return dict(conn.execute(select(key, func.count()).select_from(source).group_by(key)).all())
+    
+    day = func.date(c.created_at)
+    by_day = conn.execute(select(day, func.count()).select_from(source).group_by(day)).all()
+    
+    status = func.coalesce(c.status, 'pending')
+    closed = [status.in_(CLOSED_STATUSES)]
+    still_open = [status.notin_(CLOSED_STATUSES)]
+    # updated_at is the best available proxy for when the status last changed
+    resolution = elapsed_seconds(conn.dialect, c.created_at, c.updated_at)
+    open_age = elapsed_seconds(conn.dialect, c.created_at, literal(now, db.DateTime))
+    if durations:
+        resolution = conn.execute(select(resolution).select_from(source).where(*closed)).scalars().all()
+        open_age = conn.execute(select(open_age).select_from(source).where(*still_open)).scalars().all()
+    else:
+        resolution = sql_median(conn, resolution, source, closed)
+        open_age = sql_median(conn, open_age, source, still_open)
+    open_count, oldest_open = conn.execute(
+        select(func.count(), func.min(c.created_at)).select_from(source).where(*still_open)
+    ).one()
+    archived = conn.execute(select(func.count()).select_from(source).where(c.archived == 1)).scalar()
+    return {
+        'by_issue_type': counts_by(c.issue_type, 'other'),
+        'by_status': counts_by(c.status, 'pending'),
+        'by_department': counts_by(c.department, 'unassigned'),
+        'by_priority': counts_by(c.priority, 'normal'),
+        'by_day': {str(d): count for d, count in by_day},
+        'open': open_count,
+        'archived': archived,
+        'oldest_open': oldest_open,
+        'resolution_seconds': resolution,
+        'open_age_seconds': open_age
+    }
+
+def merge_stats_aggregates(parts):
+    """Combine stats_aggregates(..., durations=True) of several shards; medians over all of them."""
+    merged = {}
+    for key in ('by_issue_type', 'by_status', 'by_department', 'by_priority', 'by_day'):
+        totals = {}
+        for part in parts:
+            for value, count in part[key].items():
+                totals[value] = totals.get(value, 0) + count
+        merged[key] = totals
+    merged['open'] = sum(part['open'] for part in parts)
+    merged['archived'] = sum(part['archived'] for part in parts)
+    merged['oldest_open'] = min((part['oldest_open'] for part in parts if part['oldest_open']), default=None)
+    for key in ('resolution_seconds', 'open_age_seconds'):
+        values = [value for part in parts for value in part[key]]
+        merged[key] = statistics.median(values) if values else None
+    return merged
+
+@app.route('/api/stats', methods=['GET'])
+@query_budget(11)
+def get_complaint_stats():
+    """
+    Complaint counts and backlog metrics computed in the database, over live and
+    archived complaints (backlog.archived counts the latter).
+    
+    Query params:
+        since, until: ISO dates/datetimes bounding created_at (default: last 30 days)
+        bbox: min_lat,min_lon,max_lat,max_lon
+        shard: report on one shard only (sharded deployments; default: every shard,
+               queried in parallel and merged)
+    Results are cached per window for STATS_CACHE_TTL seconds.
+    """
+    try:
+        now = datetime.utcnow()
+        try:
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else now - timedelta(days=30)
+            until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+            bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid stats window: {e}'}), 400
+        try:
+            shard = requested_shard()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        def build():
+            source = stats_source(since, until, bbox)
+            if shard_router is None or shard is not None:
+                with shard_scope(shard):
+                    stats = stats_aggregates(db.session.connection(), source, now)
+            else:
+                stats = merge_stats_aggregates(shard_router.scatter(
+                    lambda conn: stats_aggregates(conn, source, now, durations=True)))
             
-            heatmap_data.append({
-                'lat': cluster_data['center_lat'],
-                'lng': cluster_data['center_lng'],
-                'weight': intensity,
-                'count': cluster_data['count'],
-                'complaints': [
-                    {
-                        'id': c.id,
-                        'issue_type': c.issue_type or 'other',
-                        'status': c.status or 'pending',
-                        'priority': c.priority or 'normal'
-                    } for c in cluster_data['complaints']
-                ]
-            })
+            by_status = stats['by_status']
+            resolution_seconds, open_age_seconds = stats['resolution_seconds'], stats['open_age_seconds']
+            return {
+                'window': {'since': since, 'until': until},
+                'bbox': list(bbox) if bbox else None,
+                'shards': [shard] if shard else (shard_router.names if shard_router else None),
+                'total': sum(by_status.values()),
+                'by_issue_type': stats['by_issue_type'],
+                'by_status': by_status,
+                'by_department': stats['by_department'],
+                'by_priority': stats['by_priority'],
+                'by_day': [{'date': d, 'count': count} for d, count in sorted(stats['by_day'].items())],
+                'backlog': {
+                    'open': stats['open'],
+                    'closed': sum(by_status.get(s, 0) for s in CLOSED_STATUSES),
+                    'archived': stats['archived'],
+                    'oldest_open_created_at': stats['oldest_open'],
+                    'median_open_age_hours': round(open_age_seconds / 3600, 2) if open_age_seconds is not None else None,
+                    'median_resolution_hours': round(resolution_seconds / 3600, 2) if resolution_seconds is not None else None
+                }
+            }
         
-        return jsonify(heatmap_data)
+        # Cached per window (path + query) for a bounded time, not invalidated per write
+        return response_cache.serve(build, tags=['stats'], ttl=STATS_CACHE_TTL)
     
     except Exception as e:
+        print(f"Error computing complaint stats: {e}")
+        traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/all-complaints', methods=['GET'])
-def get_all_complaints():
+SEARCH_MAX_LIMIT = 100
+
+@app.route('/api/search', methods=['GET'])
+@query_budget(2)
+def search():
+    """
+    Ranked full-text search over complaint address, description, issue type and department
+    (the fields the complaint letter is rendered from).
+    
+    Query params: q (required), limit (default 20, max 100), offset,
+    optional department and status filters, shard (sharded deployments: search one
+    shard only; default: every shard, queried in parallel and merged).
+    """
     try:
-        complaints = IssueReport.query.all()
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({'error': 'Search query q is required'}), 400
+        limit = min(max(request.args.get('limit', 20, type=int), 1), SEARCH_MAX_LIMIT)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        try:
+            shard = requested_shard()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        complaints_data = []
-        for complaint in complaints:
-            # Provide default values for None fields
-            issue_type = complaint.issue_type or 'other'
-            complaints_data.append({
-                'id': complaint.id,
-                'user_id': complaint.user_id,
-                'issue_type': issue_type,
-                'status': complaint.status or 'pending',
-                'priority': complaint.priority or 'normal',
-                'latitude': complaint.latitude,
-                'longitude': complaint.longitude,
-                'address': complaint.address,
-                'description': complaint.description,
-                'department': complaint.department,
-                'created_at': complaint.created_at.isoformat() if complaint.created_at else None,
-                'updated_at': complaint.updated_at.isoformat() if complaint.updated_at else None
-            })
+        def build():
+            filters = {'department': request.args.get('department'), 'status': request.args.get('status')}
+            if shard_router is None or shard is not None:
+                with shard_scope(shard):
+                    total, results = search_complaints(db.session, query, limit=limit, offset=offset, **filters)
+                ranked = total < RANK_LIMIT
+            else:
+                total, ranked, results = search_shards(shard_router.scatter, query, limit=limit, offset=offset,
+                                                       **filters)
+            return {
+                'query': query,
+                'total': total,
+                'total_capped': total >= COUNT_CAP,
+                'ranked': ranked,
+                'limit': limit,
+                'offset': offset,
+                'results': results
+            }
         
-        return jsonify({
-            'complaints': complaints_data,
-            'total': len(complaints_data)
-        })
+        return response_cache.serve(build, tags=['complaints'])
     
     except Exception as e:
+        print(f"Error searching complaints: {e}")
+        traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/complaint/<int:complaint_id>', methods=['GET'])
+@query_budget(4)
 def get_complaint_details(complaint_id):
     try:
-        complaint = IssueReport.query.get_or_404(complaint_id)
-        
-        # Provide default values for None fields
-        return jsonify({
+        def build():
+            complaint = get_complaint_or_404(complaint_id, undefer(IssueReport.formal_complaint))
+            
+            # Provide default values for None fields
+            return {
                 'id': complaint.id,
                 'user_id': complaint.user_id,
                 'issue_type': complaint.issue_type or 'other',
@@ -768,12 +1624,15 @@ def get_complaint_details(complaint_id):
                 'longitude': complaint.longitude,
                 'address': complaint.address,
                 'description': complaint.description,
-                'formal_complaint': complaint.formal_complaint,
+                'formal_complaint': complaint_letter(complaint),
                 'department': complaint.department,
                 'image_path': complaint.image_path,
-                'created_at': complaint.created_at.isoformat() if complaint.created_at else None,
-                'updated_at': complaint.updated_at.isoformat() if complaint.updated_at else None
-            })
+                'duplicate_reports': DuplicateReport.query.filter_by(complaint_id=complaint.id).count(),
+                'created_at': complaint.created_at,
+                'updated_at': complaint.updated_at
+            }
+        
+        return response_cache.serve(build, tags=[f'complaint:{complaint_id}', BULK_UPDATE_TAG])
     
     except Exception as e:
         print(f"Error fetching complaint details: {e}")
@@ -781,38 +1640,192 @@ def get_complaint_details(complaint_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/complaint/<int:complaint_id>/update-status', methods=['PUT'])
+@query_budget(3)
 def update_complaint_status(complaint_id):
     try:
         data = request.get_json()
-        complaint = IssueReport.query.get_or_404(complaint_id)
+        # The complaint's shard, for the lookup and the refresh after commit
+        with shard_scope(complaint_shard(complaint_id)):
+            complaint = db.session.get(IssueReport, complaint_id)
+            if complaint is None:
+                if db.session.get(ArchivedIssueReport, complaint_id) is not None:
+                    return jsonify({'error': 'Complaint is archived and can no longer be updated'}), 409
+                abort(404)
+        
+            # Update status and priority if provided
+            if 'status' in data:
+                complaint.status = data['status']
+            if 'priority' in data:
+                complaint.priority = data['priority']
+        
+            complaint.updated_at = datetime.utcnow()
+            db.session.commit()
+            response_cache.invalidate('complaints', f'complaint:{complaint_id}')
+            event_bus.publish('complaint.updated', complaint_event_data(complaint))
+        
+            return jsonify({
+                'success': True,
+                'message': 'Complaint status updated successfully',
+                'complaint': {
+                    'id': complaint.id,
+                    'status': complaint.status,
+                    'priority': complaint.priority,
+                    'updated_at': complaint.updated_at.isoformat()
+                }
+            })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+BULK_UPDATE_MAX_IDS = int(os.getenv('BULK_UPDATE_MAX_IDS', 5000))
+# Up to this many rows a bulk update publishes per-complaint events and invalidates per-complaint
+# cache tags; above it, one bulk event and the coarse tags (per-row tags would pile up in the cache)
+BULK_UPDATE_FANOUT = int(os.getenv('BULK_UPDATE_FANOUT', 50))
+
+@app.route('/api/complaints/update-status', methods=['PUT'])
+@query_budget(1)
+def bulk_update_complaint_status():
+    """
+    Apply a status and/or priority change to many complaints with one UPDATE.
+    
+    Body: {"status": ..., "priority": ..., and either
+           "ids": [1, 2, ...] or
+           "filter": {"department": ..., "status": ... or [...], "issue_type": ...,
+                      "bbox": "min_lat,min_lon,max_lat,max_lon"}}
+    Up to BULK_UPDATE_FANOUT rows publish one complaint.updated event each; a larger
+    update publishes a single complaints.bulk_updated event instead.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        values = {field: data[field] for field in ('status', 'priority') if field in data}
+        if not values:
+            return jsonify({'error': 'status or priority is required'}), 400
         
-        # Update status and priority if provided
-        if 'status' in data:
-            complaint.status = data['status']
-        if 'priority' in data:
-            complaint.priority = data['priority']
+        conditions = []
+        ids = data.get('ids')
+        criteria = data.get('filter')
+        if criteria is None:
+            criteria = {}
+        elif not isinstance(criteria, dict):
+            return jsonify({'error': 'filter must be an object'}), 400
+        if ids is not None:
+            if not isinstance(ids, list) or not ids \
+                    or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+                return jsonify({'error': 'ids must be a non-empty list of integers'}), 400
+            if len(ids) > BULK_UPDATE_MAX_IDS:
+                return jsonify({'error': f'At most {BULK_UPDATE_MAX_IDS} ids per request'}), 413
+            conditions.append(IssueReport.id.in_(ids))
+        if criteria.get('department'):
+            conditions.append(IssueReport.department == criteria['department'])
+        if criteria.get('issue_type'):
+            conditions.append(IssueReport.issue_type == criteria['issue_type'])
+        if criteria.get('status'):
+            statuses = criteria['status'] if isinstance(criteria['status'], list) else [criteria['status']]
+            conditions.append(IssueReport.status.in_(statuses))
+        if criteria.get('bbox'):
+            try:
+                min_lat, min_lon, max_lat, max_lon = parse_bbox(criteria['bbox'])
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': f'Invalid bbox: {e}'}), 400
+            conditions.append(IssueReport.latitude.between(min_lat, max_lat))
+            conditions.append(IssueReport.longitude.between(min_lon, max_lon))
+        if not conditions:
+            # Never update the whole table by accident
+            return jsonify({'error': 'ids or a non-empty filter is required'}), 400
         
-        complaint.updated_at = datetime.utcnow()
+        values['updated_at'] = datetime.utcnow()
+        statement = (
+            update(IssueReport)
+            .where(*conditions)
+            .values(**values)
+            .returning(
+                IssueReport.id, IssueReport.issue_type, IssueReport.status, IssueReport.priority,
+                IssueReport.department, IssueReport.latitude, IssueReport.longitude, IssueReport.updated_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+        # Ids name their shards; a filter has to visit every shard
+        if shard_router is None:
+            shards = [None]
+        elif ids is not None:
+            shards = {complaint_shard(complaint_id) for complaint_id in ids}
+        else:
+            shards = shard_router.names
+        updated = []
+        for shard in shards:
+            with shard_scope(shard):
+                # Tagged with its shard, so the query budget counts the per-shard repeats once
+                shard_statement = statement if shard is None else statement.execution_options(shard=shard)
+                updated.extend(db.session.execute(shard_statement).all())
         db.session.commit()
         
+        updated_ids = [row.id for row in updated]
+        if len(updated_ids) > BULK_UPDATE_FANOUT:
+            response_cache.invalidate('complaints', BULK_UPDATE_TAG)
+            event_bus.publish(BULK_UPDATE_EVENT, {
+                'count': len(updated_ids),
+                'ids': ids,  # None for a filter-based update
+                'filter': criteria or None,
+                **values
+            })
+        elif updated_ids:
+            response_cache.invalidate('complaints', *[f'complaint:{cid}' for cid in updated_ids])
+            for row in updated:
+                event_bus.publish('complaint.updated', complaint_event_data(row))
+        
         return jsonify({
             'success': True,
-            'message': 'Complaint status updated successfully',
-            'complaint': {
-                'id': complaint.id,
-                'status': complaint.status,
-                'priority': complaint.priority,
-                'updated_at': complaint.updated_at.isoformat()
-            }
+            'updated': len(updated_ids),
+            'ids': updated_ids,
+            'updated_at': values['updated_at'].isoformat()
         })
     
     except Exception as e:
+        db.session.rollback()
+        print(f"Error in bulk status update: {e}")
+        traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/events', methods=['GET'])
+def complaint_events():
+    """
+    Server-Sent Events stream of complaint changes.
+    
+    Query params (all optional, combined with AND):
+        complaint_id: only events for this complaint
+        department: only events for this department
+        bbox: min_lat,min_lon,max_lat,max_lon
+    Reconnecting clients resume from the Last-Event-ID header (or ?last_event_id=).
+    Beyond EVENTS_MAX_STREAMS open streams in this worker, answers 503 with Retry-After.
+    """
+    try:
+        event_filter = EventFilter.from_args(request.args)
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid event filter: {e}'}), 400
+    
+    if not event_bus.open_stream():
+        response = jsonify({'error': 'Too many open event streams, retry later'})
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response, 503
+    response = Response(event_bus.stream(event_filter, last_event_id), mimetype='text/event-stream')
+    # Runs when the server closes the response, also if the stream never started
+    response.call_on_close(event_bus.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # disable proxy buffering
+    return response
+
 @app.route('/api/image/<path:filename>')
 def serve_image(filename):
     try:
         from flask import send_from_directory
+        # Archived complaints' photos are in cold storage (or still in uploads/ if the move was interrupted)
+        if filename.startswith(ARCHIVE_IMAGE_PREFIX):
+            actual_filename = filename[len(ARCHIVE_IMAGE_PREFIX):]
+            if os.path.exists(os.path.join(ARCHIVE_IMAGE_DIR, actual_filename)):
+                return send_from_directory(ARCHIVE_IMAGE_DIR, actual_filename)
+            return send_from_directory('uploads', actual_filename)
         # Handle both cases: filename only or uploads/filename
         if filename.startswith('uploads/'):
             # Extract just the filename from uploads/filename
@@ -825,9 +1838,60 @@ def serve_image(filename):
         print(f"Error serving image: {e}")
         return jsonify({'error': 'Image not found'}), 404
 
+# Complaint id columns as (table, column); tables created before ids were BIGINT are widened
+COMPLAINT_ID_COLUMNS = (('issue_report', 'id'), ('archived_issue_report', 'id'), ('submission_key', 'complaint_id'),
+                        ('complaint_embedding', 'complaint_id'), ('duplicate_report', 'complaint_id'),
+                        ('image_prediction', 'complaint_id'))
+
+def widen_complaint_id_columns(engine, columns):
+    """
+    ALTER int4 complaint id columns (and their id sequences) to BIGINT on PostgreSQL.
+    
+    A no-op on SQLite, whose integers are 64-bit. Tables that do not exist yet are
+    skipped; create_all() makes them BIGINT.
+    
+    Args:
+        engine: database to migrate
+        columns: (table, column) pairs
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column in columns:
+            if not inspector.has_table(table):
+                continue
+            current = next(c['type'] for c in inspector.get_columns(table) if c['name'] == column)
+            if isinstance(current, db.BigInteger):
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT"))
+            # A serial's sequence is int4 too and would stop at the same limit
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, :column)"),
+                                    {'table': table, 'column': column}).scalar()
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} AS BIGINT"))
+            print(f"[INFO] Widened {table}.{column} to BIGINT")
+
 # Initialize database
 def create_tables():
+    widen_complaint_id_columns(db.engine, COMPLAINT_ID_COLUMNS)
     db.create_all()
+    # create_all() skips indexes on tables that already exist
+    for index in IssueReport.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    install_search_index(db.engine)
+    # Column added after the table first shipped; create_all() does not alter existing tables
+    if 'model_version' not in {c['name'] for c in inspect(db.engine).get_columns('complaint_embedding')}:
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE complaint_embedding ADD COLUMN model_version VARCHAR(100)"))
+    if shard_router is not None:
+        # Before create_tables() reserves the id ranges, which do not fit in int4
+        for name, engine in shard_router.engines().items():
+            if name != DEFAULT_SHARD:
+                widen_complaint_id_columns(engine, [(table, column) for table, column in COMPLAINT_ID_COLUMNS
+                                                    if table in SHARDED_TABLES])
+        shard_router.create_tables([IssueReport.__table__, ArchivedIssueReport.__table__,
+                                    SubmissionKey.__table__], install_search_index)
     
     # Add sample departments
     if not Department.query.first():
@@ -0,0 +1,188 @@
+"""
+Hot/cold tiering of closed complaints.
+
+Complaints that are closed (CLOSED_STATUSES) and have not changed for
+ARCHIVE_AFTER_DAYS days move from issue_report (hot) to archived_issue_report
+(cold), in batches. Each batch is its own short transaction:
+
+    DELETE FROM issue_report WHERE id IN (<batch>) AND <still archivable> RETURNING *
+    INSERT INTO archived_issue_report <the returned rows>
+
+Re-checking the predicate in the DELETE means a complaint reopened after the batch
+was selected stays hot. The full-text index follows by itself, because the FTS delete
+trigger drops the rows from issue_report_fts. After the commit, each batch's photos
+move from uploads/ to the cold image directory and the archived rows point at
+archive/<file>. The image endpoint looks in uploads/ as well, in case a run stopped
+before moving them.
+
+The hot table then holds only open complaints plus recently closed ones, so the
+full-table endpoints (all complaints, heatmap, map) stay bounded as history grows.
+Those endpoints read the archive only with ?include_archived=true. Lookups by id fall
+back to the archive on their own. /api/stats always aggregates both tables, so its
+counts and medians do not change as batches move.
+
+With SHARD_CONFIG set, every shard's database is archived in turn; each keeps its
+archived rows in its own archived_issue_report.
+
+Usage (cron):
+    python archive.py [--older-than-days 365] [--batch-size 500] [--max-batches N] [--dry-run]
+"""
+
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+ARCHIVE_IMAGE_PREFIX = 'archive/'
+
+
+def archivable(hot, closed_statuses, cutoff, max_id):
+    """WHERE clause for hot rows that may move to the archive."""
+    return (
+        hot.c.status.in_(closed_statuses)
+        & (func.coalesce(hot.c.updated_at, hot.c.created_at) < cutoff)
+        # SQLite reuses max(rowid) + 1 for a table without AUTOINCREMENT, so archiving the
+        # newest row could hand its id to the next complaint; the newest row always stays hot
+        & (hot.c.id < max_id)
+    )
+
+
+def cold_image_path(image_path):
+    """archive/<file> for a photo stored as uploads/<file>."""
+    if not image_path or image_path.startswith(ARCHIVE_IMAGE_PREFIX):
+        return image_path
+    return ARCHIVE_IMAGE_PREFIX + os.path.basename(image_path)
+
+
+def archive_batch(conn, hot, cold, closed_statuses, cutoff, batch_size):
+    """
+    Move one batch of archivable rows from hot to cold in the caller's transaction.
+
+    Returns:
+        list of archived rows (dicts, image_path still the hot path)
+    """
+    max_id = conn.execute(select(func.max(hot.c.id))).scalar()
+    if max_id is None:
+        return []
+    condition = archivable(hot, closed_statuses, cutoff, max_id)
+    ids = conn.scalars(select(hot.c.id).where(condition).order_by(hot.c.id).limit(batch_size)).all()
+    if not ids:
+        return []
+    rows = [dict(row) for row in conn.execute(
+        delete(hot).where(hot.c.id.in_(ids), condition).returning(*hot.c)).mappings()]
+    if rows:
+        archived_at = datetime.utcnow()
+        conn.execute(insert(cold), [dict(row, image_path=cold_image_path(row['image_path']), archived_at=archived_at)
+                                    for row in rows])
+    return rows
+
+
+def move_images(rows, backend_dir, cold_dir):
+    """Move archived rows' photos from uploads/ to the cold directory. Returns the number moved."""
+    moved = 0
+    for row in rows:
+        image_path = row['image_path']
+        if not image_path or image_path.startswith(ARCHIVE_IMAGE_PREFIX):
+            continue
+        source = os.path.join(backend_dir, image_path)
+        if not os.path.exists(source):
+            continue
+        os.makedirs(cold_dir, exist_ok=True)
+        try:
+            shutil.move(source, os.path.join(cold_dir, os.path.basename(image_path)))
+            moved += 1
+        except OSError as e:
+            print(f"[WARN] Could not move {image_path} to cold storage: {e}")
+    return moved
+
+
+def count_archivable(conn, hot, closed_statuses, cutoff):
+    max_id = conn.execute(select(func.max(hot.c.id))).scalar()
+    if max_id is None:
+        return 0
+    return conn.execute(select(func.count()).where(archivable(hot, closed_statuses, cutoff, max_id))).scalar()
+
+
+def run_archival(engine, hot, cold, closed_statuses, older_than_days, backend_dir, cold_dir,
+                 batch_size=500, max_batches=None, pause=0.05, on_batch=None):
+    """
+    Archive closed complaints older than older_than_days, one transaction per batch.
+
+    Args:
+        engine: SQLAlchemy engine
+        hot, cold: issue_report and archived_issue_report tables
+        closed_statuses: statuses that end a complaint's lifecycle
+        backend_dir: directory image paths are relative to
+        cold_dir: where archived photos go
+        pause: seconds between batches, so request writers get the database lock
+        on_batch: optional callable(rows) after each committed batch (cache invalidation)
+
+    Returns:
+        dict: counts of archived rows, moved images and batches
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    stats = {'archived': 0, 'images_moved': 0, 'batches': 0}
+    while max_batches is None or stats['batches'] < max_batches:
+        with engine.begin() as conn:
+            rows = archive_batch(conn, hot, cold, closed_statuses, cutoff, batch_size)
+        if not rows:
+            break
+        stats['batches'] += 1
+        stats['archived'] += len(rows)
+        stats['images_moved'] += move_images(rows, backend_dir, cold_dir)
+        if on_batch:
+            on_batch(rows)
+        time.sleep(pause)
+    return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--older-than-days', type=float, default=float(os.getenv('ARCHIVE_AFTER_DAYS', 365)),
+                        help='archive complaints closed (last updated) more than this many days ago')
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('ARCHIVE_BATCH_SIZE', 500)))
+    parser.add_argument('--max-batches', type=int, help='per database when sharded')
+    parser.add_argument('--dry-run', action='store_true', help='only count what would be archived')
+    args = parser.parse_args()
+
+    import app as backend
+
+    hot = backend.IssueReport.__table__
+    cold = backend.ArchivedIssueReport.__table__
+    with backend.app.app_context():
+        backend.create_tables()
+        # Each shard archives its own complaints into its own archived_issue_report
+        engines = backend.shard_router.engines() if backend.shard_router else {None: backend.db.engine}
+        cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+        pending = {}
+        for name, engine in engines.items():
+            with engine.connect() as conn:
+                pending[name] = count_archivable(conn, hot, backend.CLOSED_STATUSES, cutoff)
+                hot_rows = conn.execute(select(func.count()).select_from(hot)).scalar()
+            where = f" on shard {name}" if name else ''
+            print(f"[INFO] {pending[name]} of {hot_rows} hot complaints{where} are closed and older than "
+                  f"{args.older_than_days:g} days")
+        if args.dry_run or not any(pending.values()):
+            return
+
+        def invalidate(rows):
+            backend.response_cache.invalidate('complaints', *[f"complaint:{row['id']}" for row in rows])
+
+        for name, engine in engines.items():
+            if not pending[name]:
+                continue
+            start = time.perf_counter()
+            stats = run_archival(engine, hot, cold, backend.CLOSED_STATUSES, args.older_than_days,
+                                 backend.backend_dir, backend.ARCHIVE_IMAGE_DIR, batch_size=args.batch_size,
+                                 max_batches=args.max_batches, on_batch=invalidate)
+            where = f" on shard {name}" if name else ''
+            print(f"[OK] Archived {stats['archived']} complaints{where} in {stats['batches']} batches "
+                  f"({stats['images_moved']} photos moved to {backend.ARCHIVE_IMAGE_DIR}) "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: latency cost of running the trained CBAM block at inference.
+
+Loads the checkpoint three ways and times a forward pass (median of --runs):
+
+    plain      UrbanMobileNet with CBAM bypassed (Identity)
+    reference  the training-time CBAM module (with its per-call ensure_4d checks)
+    fused      FusedCBAM, as used by IssueClassifier when the checkpoint has CBAM weights
+
+It also reports the block alone on the (N, 576, 7, 7) feature map, and checks that
+fused and reference outputs agree.
+
+Usage:
+    python benchmarks/bench_cbam.py [--weights ../model/best_urban_mobilenet.pth] [--runs 200] [--batch 1,8]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import torch
+
+from model_inference import CBAM, UrbanMobileNet, read_state_dict
+
+DEFAULT_WEIGHTS = os.path.join(os.path.dirname(BACKEND_DIR), 'model', 'best_urban_mobilenet.pth')
+
+
+def median_ms(fns, x, runs):
+    """Median milliseconds per call for each fn, run round-robin so drift hits all of them alike."""
+    times = {name: [] for name in fns}
+    with torch.inference_mode():
+        for fn in fns.values():
+            for _ in range(10):
+                fn(x)
+        for _ in range(runs):
+            for name, fn in fns.items():
+                start = time.perf_counter()
+                fn(x)
+                times[name].append(time.perf_counter() - start)
+    return {name: statistics.median(values) * 1000 for name, values in times.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--batch', default='1,8')
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    state_dict, _ = read_state_dict(args.weights, torch.device('cpu'))
+    if not any(key.startswith('cbam.') for key in state_dict):
+        raise SystemExit(f"[ERROR] {args.weights} has no cbam.* weights")
+
+    plain = UrbanMobileNet(num_classes=6)
+    plain.load_state_dict(state_dict, strict=False)
+    fused = UrbanMobileNet(num_classes=6, cbam=True)
+    fused.load_state_dict(state_dict, strict=True)
+    reference = UrbanMobileNet(num_classes=6)
+    reference.cbam = CBAM(576)
+    reference.load_state_dict(state_dict, strict=True)
+    models = {'plain': plain, 'reference': reference, 'fused': fused}
+    for model in models.values():
+        model.eval()
+
+    torch.manual_seed(0)
+    for batch in (int(b) for b in args.batch.split(',')):
+        x = torch.randn(batch, 3, 224, 224)
+        with torch.inference_mode():
+            logit_diff = (fused(x) - reference(x)).abs().max().item()
+            feature_map = plain.features(x)
+            # Unit-scale probe: an untrained backbone can yield near-zero feature maps
+            probe = torch.randn_like(feature_map)
+            block_diff = (fused.cbam(probe) - reference.cbam(probe)).abs().max().item()
+        print(f"batch {batch}: fused vs reference max diff: logits {logit_diff:.1e}, block output {block_diff:.1e}")
+        whole = median_ms(models, x, args.runs)
+        block = median_ms({name: model.cbam for name, model in models.items()}, feature_map, args.runs * 5)
+        for name in models:
+            extra = (whole[name] - whole['plain']) / whole['plain']
+            print(f"  {name:10s} model {whole[name]:7.2f} ms ({extra:+6.1%})   block {block[name] * 1000:7.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark: formal complaint letters per second, before and after complaint_letters.py.
+
+Also checks that the new generator produces byte-identical letters to the previous
+implementation (kept below) over a corpus of addresses, descriptions and options.
+
+Usage:
+    python benchmarks/bench_letters.py [--letters 20000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complaint_letters import parse_location, render_letter  # noqa: E402
+
+ADDRESSES = [
+    'Jajmau, Kanpur, Kanpur Nagar, Uttar Pradesh, 208015, India',
+    'Connaught Place, New Delhi, Delhi, 110001, India',
+    'Bandra West, Mumbai, Mumbai Suburban, Maharashtra, 400050, India',
+    'Koramangala, Bangalore, Bangalore Urban, Karnataka, 560034, India',
+    'Salt Lake, Kolkata, North 24 Parganas, West Bengal, 700091, India',
+    'Punjabi Bagh, West Delhi, 110026, India',
+    'Panaji, North Goa, Goa, 403001, India',
+    'Goalpara, Assam, India',
+    'Mall Road, Kanpur',
+    'Civil Lines, Kanpur, 208001',
+    'Hazratganj, Lucknow, Uttar Pradesh, 226001, India',
+    'T. Nagar, Chennai, Tamil Nadu, 600017, India',
+    'Location not provided',
+    'Address not found',
+    'Some Village, Some District, Himachal Pradesh, 171001, India',
+    '',
+]
+ISSUES = ['potholes', 'damaged_signs', 'fallen_trees', 'garbage', 'graffiti', 'illegal_parking',
+          'water_leak', 'drainage', 'school_issue', 'other']
+DESCRIPTIONS = ['', 'Huge pothole near the market gate', 'Garbage [photo attached] near school',
+                'Line one\n\n\n\nLine after blanks', 'Trailing newline\n', '[only brackets]', 'a [b] c [d']
+
+
+def legacy_generate_formal_complaint(issue_type, description, location, latitude=None, longitude=None, priority='normal', department=None, user_id='anonymous', letter_date=None):
+    """Letter generator as it was before complaint_letters.py (kept verbatim for comparison)."""
+    
+    # Format issue type for display
+    issue_type_display = issue_type.replace('_', ' ').title()
+    
+    # Extract city and state from location if available
+    # Format: "Jajmau, Kanpur, Kanpur Nagar, Uttar Pradesh, 208015, India"
+    location_parts = [part.strip() for part in location.split(',')] if location else []
+    
+    # Try to extract city and state from location parts
+    city = "Kanpur"  # Default
+    state = "Uttar Pradesh"  # Default
+    
+    if len(location_parts) >= 4:
+        # Usually format: Area, City, District, State, Pincode, Country
+        for i, part in enumerate(location_parts):
+            # Check for common state names in India
+            state_names = ['Uttar Pradesh', 'Maharashtra', 'Karnataka', 'Gujarat', 'Rajasthan', 'Punjab', 
+                          'West Bengal', 'Tamil Nadu', 'Andhra Pradesh', 'Madhya Pradesh', 'Bihar', 'Odisha', 
+                          'Assam', 'Haryana', 'Kerala', 'Jharkhand', 'Chhattisgarh', 'Delhi', 
+                          'Himachal Pradesh', 'Uttarakhand', 'Goa', 'Manipur', 'Meghalaya', 'Mizoram', 
+                          'Nagaland', 'Sikkim', 'Tripura', 'Arunachal Pradesh', 'Telangana']
+            if any(state_name in part for state_name in state_names):
+                state = part
+                # City is usually the part before state
+                if i > 0:
+                    city = location_parts[i-1]
+                break
+    
+    # Fallback: use index-based extraction
+    if city == "Kanpur" and len(location_parts) >= 2:
+        # Try to find city (usually second to last before pincode)
+        for i, part in enumerate(location_parts):
+            if part.lower() in ['kanpur', 'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad', 'pune', 'ahmedabad']:
+                city = part
+                break
+        if city == "Kanpur" and len(location_parts) >= 2:
+            city = location_parts[-3] if len(location_parts) >= 3 else location_parts[-2]
+    
+    if state == "Uttar Pradesh" and len(location_parts) >= 2:
+        # Skip pincode and country, get state
+        for part in reversed(location_parts):
+            if not part.isdigit() and part.lower() not in ['india', 'indian']:
+                if any(s in part for s in ['Pradesh', 'Bengal', 'Nadu', 'Kerala', 'Gujarat', 'Rajasthan']):
+                    state = part
+                    break
+    
+    # Format coordinates
+    coordinates_text = ""
+    if latitude and longitude:
+        coordinates_text = f"Latitude: {latitude:.6f}° N\nLongitude: {longitude:.6f}° E"
+    
+    # Priority mapping
+    priority_map = {
+        'low': 'Low',
+        'normal': 'Normal',
+        'high': 'High',
+        'urgent': 'Urgent'
+    }
+    priority_display = priority_map.get(priority, 'Normal')
+    
+    # Department name
+    dept_name = department
+    
+    # Letter date
+    current_date = (letter_date or datetime.now()).strftime('%B %d, %Y')
+    
+    # Build description text
+    if description:
+        description_text = description
+    else:
+        # Generate default description based on issue type
+        issue_descriptions = {
+            'potholes': f'The road surface in {location} has multiple potholes that are causing significant disruption to traffic flow and posing safety risks to vehicles and pedestrians.',
+            'damaged_signs': f'Traffic signs or road signs in {location} are damaged, missing, or illegible, which poses safety risks to motorists and pedestrians.',
+            'fallen_trees': f'Fallen trees or tree branches in {location} are blocking roads or pathways, creating obstacles and potential safety hazards.',
+            'garbage': f'Garbage and waste accumulation in {location} is causing health and environmental concerns, requiring immediate cleanup and waste management.',
+            'graffiti': f'Unauthorized graffiti and vandalism in {location} is affecting the aesthetic appearance of public spaces and may indicate security concerns.',
+            'illegal_parking': f'Illegal parking in {location} is obstructing traffic flow and creating safety hazards for vehicles and pedestrians.',
+            'street_light': f'Street lights in {location} are not functioning properly, creating safety concerns especially during nighttime hours.',
+            'water_leak': f'Water leaks in {location} are causing water wastage and potential damage to infrastructure and surrounding areas.',
+            'traffic_signal': f'Traffic signals in {location} are malfunctioning or not working, creating traffic congestion and safety risks.',
+            'sidewalk_damage': f'Sidewalk damage in {location} is creating hazards for pedestrians and requires immediate repair.',
+            'drainage': f'Drainage issues in {location} are causing water accumulation and potential flooding risks.',
+        }
+        description_text = issue_descriptions.get(issue_type, f'Civic infrastructure issue of type {issue_type_display.lower()} has been identified in {location} and requires immediate attention to ensure public safety.')
+    
+    coordinates_line = ('**Coordinates:**\n' + coordinates_text) if coordinates_text else ''
+    captured_line = "- **Captured from user's device GPS**" if coordinates_text else ''
+
+    # Build complaint letter using template (NO placeholders - all actual data)
+    complaint_letter = f"""Nagrik Nivedan Platform
+Complaint Reference: {user_id}
+
+{current_date}
+
+To,
+The Municipal Commissioner,
+{city} Municipal Corporation,
+{city}, {state}, India.
+
+**Subject: Formal Complaint Regarding {issue_type_display} Issue in {location}**
+
+Dear Sir/Madam,
+
+This letter serves as a formal complaint regarding a {issue_type_display.lower()} issue that has been identified in {location} and requires immediate attention.
+
+**COMPLAINT DETAILS:**
+
+**Issue Type:** {issue_type_display} (AI-Identified)
+**Priority:** {priority_display} Priority
+**Location:** {location}
+{coordinates_line}
+**Date:** {current_date}
+**Assigned Department:** {dept_name}
+**Complaint ID:** {user_id}
+
+**DESCRIPTION:**
+
+{description_text}
+
+**LOCATION DETAILS:**
+
+- **Full Address:** {location}
+{f'- **GPS Coordinates:** {coordinates_text}' if coordinates_text else ''}
+{captured_line}
+
+**URGENCY ASSESSMENT:**
+
+We consider this issue to be of **{priority_display.lower()} priority**. The condition of the {issue_type_display.lower()} in {location} requires attention to ensure public safety and maintain service standards. {'Given the ' + priority_display.lower() + ' priority level, we request immediate action to address this matter.' if priority in ['high', 'urgent'] else 'Prompt action is necessary to prevent further deterioration and ensure the safety of residents and commuters.'}
+
+**POTENTIAL SAFETY CONCERNS:**
+
+The presence of this {issue_type_display.lower()} issue presents several potential safety concerns, including:
+- Increased risk of accidents, particularly for vehicles and pedestrians
+- Potential damage to vehicles and infrastructure
+- Disruption to traffic flow and public safety
+- Risk of injury to residents and commuters
+
+**REQUEST FOR IMMEDIATE ACTION:**
+
+We respectfully request that the {dept_name} take immediate action to address this critical issue. Specifically, we request the following:
+
+1. **Immediate Inspection:** Conduct a thorough inspection of the location in {location} to assess the extent of the {issue_type_display.lower()} issue.
+
+2. **Assessment and Remediation:** Implement appropriate measures to resolve the {issue_type_display.lower()} issue and restore the area to a safe and usable condition.
+
+3. **Preventative Measures:** Explore and implement preventative measures to prevent the recurrence of similar issues in the future, such as improved maintenance and use of durable materials.
+
+4. **Status Updates:** Provide updates on the progress through our tracking system (Complaint ID: {user_id}).
+
+We believe that prompt action is essential to mitigate any risks associated with this issue and ensure the safety and well-being of the residents and commuters in {location}. We look forward to a timely response and a concrete plan of action to address this matter.
+
+Thank you for your attention to this important issue.
+
+Respectfully,
+
+Nagrik Nivedan Platform
+Complaint ID: {user_id}
+{current_date}"""
+    
+    # Final cleanup - remove any remaining brackets or placeholder-like text (shouldn't be any, but just in case)
+    complaint_letter = re.sub(r'\[.*?\]', '', complaint_letter)
+    complaint_letter = re.sub(r'\n{3,}', '\n\n', complaint_letter)
+    
+    return complaint_letter.strip()
+
+
+def corpus(n, seed=1):
+    rng = random.Random(seed)
+    for i in range(n):
+        lat, lon = rng.choice([(26.4499, 80.3319), (None, None), (0.0, 80.1), (28.6, 77.2)])
+        yield dict(
+            issue_type=rng.choice(ISSUES),
+            # Most citizens type plain text or nothing; a few paste brackets or blank lines
+            description=rng.choice(DESCRIPTIONS) if rng.random() < 0.2 else rng.choice(DESCRIPTIONS[:2]),
+            location=rng.choice(ADDRESSES) if rng.random() < 0.7 else f"Ward {i}, Kanpur, Kanpur Nagar, Uttar Pradesh, {208000 + i % 100}, India",
+            latitude=lat,
+            longitude=lon,
+            priority=rng.choice(['low', 'normal', 'high', 'urgent', 'unknown']),
+            department=rng.choice(['Public Works', 'Sanitation', 'Traffic Department']),
+            user_id=f"user-{rng.randint(1, 999)}",
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--letters', type=int, default=20000)
+    args = parser.parse_args()
+
+    today = date.today()
+    items = list(corpus(args.letters))
+
+    mismatches = 0
+    for item in items:
+        if legacy_generate_formal_complaint(letter_date=today, **item) != render_letter(letter_date=today, **item):
+            mismatches += 1
+    print(f"identical output: {len(items) - mismatches}/{len(items)}")
+
+    def rate(generate, rounds=3):
+        best = 0
+        for _ in range(rounds):
+            parse_location.cache_clear()
+            start = time.perf_counter()
+            for item in items:
+                generate(letter_date=today, **item)
+            best = max(best, len(items) / (time.perf_counter() - start))
+        return best
+
+    before = rate(legacy_generate_formal_complaint)
+    after = rate(render_letter)
+
+    print(f"before: {before:10.0f} letters/s")
+    print(f"after:  {after:10.0f} letters/s  ({after / before:.2f}x, parse cache {parse_location.cache_info().hits} hits)")
+
+
+if __name__ == '__main__':
+    main()
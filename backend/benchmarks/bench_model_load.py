@@ -0,0 +1,103 @@
+"""
+Benchmark: model load time and resident memory per process.
+
+Each run is a fresh process (like a new worker) that imports torch, loads the
+weights and runs one forward pass. It records:
+
+    load_ms     time from reading the file to a ready model
+    anon_mb     anonymous (private, unshareable) memory added by loading + first inference
+    file_mb     file-backed resident memory added (mapped weights; shared between workers)
+
+Modes:
+    legacy   torch.load of the whole pickle, random-init UrbanMobileNet, load_state_dict(strict=False)
+    inplace  IssueClassifier: mmap + meta-device model built directly on the checkpoint tensors
+
+Usage:
+    python benchmarks/bench_model_load.py [--weights ../model/best_urban_mobilenet.pth] [--runs 5]
+    python benchmarks/bench_model_load.py --weights ../model/best_urban_mobilenet.safetensors --modes inplace
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WEIGHTS = os.path.join(os.path.dirname(BACKEND_DIR), 'model', 'best_urban_mobilenet.pth')
+
+
+def memory_kb():
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(('RssAnon', 'RssFile')):
+                name, value = line.split(':')
+                values[name] = int(value.split()[0])
+    return values
+
+
+def run_child(mode, weights):
+    """Child process: load once, print one JSON result line."""
+    sys.path.insert(0, BACKEND_DIR)
+    import torch
+    from model_inference import IssueClassifier, UrbanMobileNet
+    torch.set_num_threads(1)
+
+    before = memory_kb()
+    start = time.perf_counter()
+    if mode == 'legacy':
+        model = UrbanMobileNet(num_classes=6)
+        model.load_state_dict(torch.load(weights, map_location='cpu'), strict=False)
+        model.eval()
+    else:
+        model = IssueClassifier(model_path=weights, num_classes=6).model
+    load_seconds = time.perf_counter() - start
+    with torch.inference_mode():
+        logits = model(torch.ones(1, 3, 224, 224))
+    after = memory_kb()
+    print('RESULT ' + json.dumps({
+        'load_ms': load_seconds * 1000,
+        'anon_mb': (after['RssAnon'] - before['RssAnon']) / 1024,
+        'file_mb': (after['RssFile'] - before['RssFile']) / 1024,
+        'checksum': float(logits.sum()),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS)
+    parser.add_argument('--runs', type=int, default=5, help='processes per mode')
+    parser.add_argument('--modes', default='legacy,inplace')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.weights)
+        return
+
+    print(f"weights: {args.weights} ({os.path.getsize(args.weights) / 1e6:.1f} MB), {args.runs} processes per mode")
+    for mode in args.modes.split(','):
+        results = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, '--weights', args.weights],
+                capture_output=True, text=True, cwd=BACKEND_DIR
+            ).stdout
+            line = next((l for l in output.splitlines() if l.startswith('RESULT ')), None)
+            if line is None:
+                print(f"{mode:8s} failed:\n{output[-2000:]}")
+                break
+            results.append(json.loads(line[len('RESULT '):]))
+        if not results:
+            continue
+        print(f"{mode:8s} load {statistics.median(r['load_ms'] for r in results):7.1f} ms (median)  "
+              f"anon +{statistics.median(r['anon_mb'] for r in results):5.1f} MB  "
+              f"file +{statistics.median(r['file_mb'] for r in results):5.1f} MB  "
+              f"logits sum {results[0]['checksum']:.6f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Check read-replica routing and pool checkout metrics with two local SQLite files.
+
+The primary is seeded and then copied to the replica file. After that, complaints are
+written only to the primary, so the replica lags behind on purpose. The script then
+checks the routing:
+- @read_replica endpoints read the stale replica
+- other endpoints, and reads inside the read-after-write window, see the primary
+- so do reads right after another worker's write (through the shared response cache's
+  invalidation clock), and the cache entry they fill is not the replica's stale page
+
+Last, it drives concurrent requests through a deliberately small pool and prints
+/api/db-stats.
+
+Usage:
+    python benchmarks/bench_replica.py [--dir /tmp/replica_check] [--threads 16] [--requests 400]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default='/tmp/replica_check')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400)
+    args = parser.parse_args()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    os.makedirs(args.dir)
+    primary = os.path.join(args.dir, 'primary.db')
+    replica = os.path.join(args.dir, 'replica.db')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{primary}",
+        'DATABASE_REPLICA_URL': f"sqlite:///{replica}",
+        'RESPONSE_CACHE': 'off',  # every request must reach the database
+        'LOCATION_ROUTING': 'false',
+        'DB_POOL_SIZE': '2',
+        'DB_MAX_OVERFLOW': '0',
+        'REPLICA_READ_AFTER_WRITE': '1',
+        'MODEL_ADMIN_TOKEN': 'bench',  # /api/db-stats is admin only
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as backend  # noqa: E402
+
+    with backend.app.app_context():
+        backend.create_tables()
+    client = backend.app.test_client()
+
+    def submit(n):
+        for i in range(n):
+            client.post('/api/submit-complaint', json={'issue_type': 'garbage', 'latitude': 26.45 + i * 0.01,
+                                                      'longitude': 80.33, 'address': f"Ward {i}, Kanpur"})
+
+    submit(5)
+    with backend.app.app_context():
+        backend.db.session.remove()
+        for engine in backend.db.engines.values():
+            engine.dispose()
+    src, dst = sqlite3.connect(primary), sqlite3.connect(replica)
+    src.backup(dst)
+    src.close()
+    dst.close()
+
+    submit(3)  # primary only: the replica is now 3 complaints behind
+    time.sleep(1.1)  # let the read-after-write window close
+
+    replica_total = client.get('/api/all-complaints').get_json()['total']
+    primary_total = len(client.get('/api/search?q=ward&limit=100').get_json()['results'])
+    print(f"all-complaints (replica): {replica_total}   search (primary): {primary_total}")
+    assert (replica_total, primary_total) == (5, 8), "routing mismatch"
+
+    submit(1)
+    fresh_total = client.get('/api/all-complaints').get_json()['total']
+    print(f"all-complaints right after a write (primary): {fresh_total}")
+    assert fresh_total == 9, "read-after-write window not honoured"
+    time.sleep(1.1)
+
+    # Another worker's write: only the shared cache's invalidation clock knows about it
+    import db_pool  # noqa: E402
+    from response_cache import SQLiteBackend  # noqa: E402
+    no_cache = backend.response_cache.backend
+    backend.response_cache.backend = SQLiteBackend(os.path.join(args.dir, 'response_cache.db'))
+    submit(1)
+    db_pool._last_write = 0.0
+    other_total = client.get('/api/all-complaints').get_json()['total']
+    time.sleep(1.1)
+    cached_total = client.get('/api/all-complaints').get_json()['total']
+    print(f"all-complaints after another worker's write (primary): {other_total}, cached: {cached_total}")
+    assert other_total == cached_total == 10, "other workers' writes not honoured, or lagging rows cached"
+    backend.response_cache.backend = no_cache
+
+    def hit(i):
+        start = time.perf_counter()
+        path = ('/api/all-complaints', '/api/heatmap-data', '/api/complaints-map?lat=26.45&lon=80.33')[i % 3]
+        assert backend.app.test_client().get(path).status_code == 200
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        start = time.perf_counter()
+        latencies = sorted(pool.map(hit, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    print(f"{args.requests} reads on {args.threads} threads in {elapsed:.2f}s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms")
+    for name, stats in client.get('/api/db-stats', headers={'X-Admin-Token': 'bench'}).get_json().items():
+        print(f"  {name}: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: nearest-department lookup, linear geodesic scan vs. the KD-tree router.
+
+Generates N synthetic departments scattered around Indian cities, each handling a
+few issue types, and times "nearest department handling this issue type" with the
+previous approach (load every department, geodesic() to each) and with
+department_routing.DepartmentRouter. Also checks both pick the same department.
+
+Usage:
+    python benchmarks/bench_routing.py [--departments 2000] [--queries 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geopy.distance import geodesic  # noqa: E402
+
+from department_routing import DepartmentRouter  # noqa: E402
+
+CITIES = [(26.4499, 80.3319), (28.6139, 77.2090), (19.0760, 72.8777), (12.9716, 77.5946),
+          (22.5726, 88.3639), (13.0827, 80.2707), (17.3850, 78.4867), (23.0225, 72.5714)]
+ISSUE_TYPES = ['potholes', 'garbage', 'fallen_trees', 'graffiti', 'damaged_signs', 'illegal_parking',
+               'water_leak', 'drainage', 'street_light', 'traffic_signal']
+
+
+def make_departments(count, rng):
+    departments = []
+    for i in range(count):
+        lat, lon = rng.choice(CITIES)
+        departments.append(SimpleNamespace(
+            id=i + 1,
+            name=f"Department {i + 1}",
+            latitude=lat + rng.gauss(0, 0.3),
+            longitude=lon + rng.gauss(0, 0.3),
+            issue_types=json.dumps(rng.sample(ISSUE_TYPES, 3)),
+            contact_info=None
+        ))
+    return departments
+
+
+def linear_nearest(departments, lat, lon, issue_type):
+    """The previous approach: every department, geodesic distance, filtered by issue type."""
+    nearest, best = None, float('inf')
+    for dept in departments:
+        if issue_type not in json.loads(dept.issue_types):
+            continue
+        distance = geodesic((lat, lon), (dept.latitude, dept.longitude)).kilometers
+        if distance < best:
+            nearest, best = dept, distance
+    return nearest
+
+
+def timed(fn, queries):
+    samples = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(*query))
+        samples.append((time.perf_counter() - start) * 1000)
+    return results, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--departments', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    departments = make_departments(args.departments, rng)
+    queries = []
+    for _ in range(args.queries):
+        lat, lon = rng.choice(CITIES)
+        queries.append((lat + rng.gauss(0, 0.2), lon + rng.gauss(0, 0.2), rng.choice(ISSUE_TYPES)))
+
+    router = DepartmentRouter(lambda: departments)
+    start = time.perf_counter()
+    router.nearest(*queries[0])
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms for {len(departments)} departments")
+
+    # The linear scan is slow; time it on a subset
+    linear_queries = queries[:max(len(queries) // 20, 10)]
+    linear, linear_ms = timed(lambda lat, lon, t: linear_nearest(departments, lat, lon, t), linear_queries)
+    routed, routed_ms = timed(lambda lat, lon, t: router.nearest(lat, lon, t)[0], queries)
+
+    # geodesic (ellipsoid) and great-circle distances can disagree on near-ties
+    agree = sum(1 for a, b in zip(linear, routed) if a.id == b.id)
+    print(f"same department: {agree}/{len(linear)}")
+    for label, samples in (('linear geodesic', linear_ms), ('kd-tree router', routed_ms)):
+        samples = sorted(samples)
+        print(f"{label:16s} p50 {statistics.median(samples):8.3f} ms   "
+              f"p99 {samples[int(len(samples) * 0.99) - 1]:8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: full-text complaint search latency on a large local SQLite database.
+
+Creates (or reuses) a SQLite file with N synthetic issue_report rows, installs the
+FTS5 index from search.py, and times search_complaints() for rare, medium and
+broad queries.
+
+Usage:
+    python benchmarks/bench_search.py [--rows 1000000] [--db /tmp/search_bench.db]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import search  # noqa: E402
+
+STREETS = [f"{name} {kind}" for name in (
+    'Mall', 'Birhana', 'Swaroop Nagar', 'Kidwai', 'Govind', 'Harsh', 'Tilak', 'Arya', 'Shastri',
+    'Nehru', 'Gandhi', 'Patel', 'Azad', 'Bose', 'Rawatpur', 'Kakadeo', 'Naveen', 'Ashok', 'Lajpat',
+    'Sarvodaya') for kind in ('Road', 'Marg', 'Chowk', 'Lane', 'Nagar')]
+AREAS = ['Civil Lines', 'Jajmau', 'Kalyanpur', 'Panki', 'Barra', 'Kidwai Nagar', 'Shyam Nagar', 'Chakeri']
+PHRASES = ['deep pothole', 'garbage pile', 'fallen tree', 'broken sign', 'graffiti on wall',
+           'car parked on footpath', 'water logging', 'open drain', 'near the school', 'outside the temple']
+
+
+def populate(db_path, rows):
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS issue_report (id INTEGER PRIMARY KEY, user_id TEXT, image_path TEXT, "
+            "issue_type TEXT, latitude REAL, longitude REAL, address TEXT, description TEXT, formal_complaint TEXT, "
+            "status TEXT, priority TEXT, department TEXT, created_at DATETIME, updated_at DATETIME)"
+        ))
+        existing = conn.execute(text("SELECT COUNT(*) FROM issue_report")).scalar()
+        # Rebuild the index from scratch each run (and load rows without the triggers)
+        conn.execute(text("DROP TABLE IF EXISTS issue_report_fts"))
+        for trigger in ('ai', 'ad', 'au'):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS issue_report_fts_{trigger}"))
+    if existing < rows:
+        rng = random.Random(7)
+        batch = []
+        for i in range(existing, rows):
+            street = rng.choice(STREETS)
+            area = rng.choice(AREAS)
+            phrase = rng.choice(PHRASES)
+            batch.append({
+                'id': i + 1, 'issue_type': 'potholes', 'status': 'pending', 'priority': 'normal',
+                'department': 'Public Works', 'latitude': 26.4, 'longitude': 80.3,
+                'address': f"{rng.randint(1, 400)} {street}, {area}, Kanpur, Uttar Pradesh, India",
+                'description': f"{phrase.capitalize()} on {street} {phrase} report {i}",
+                'formal_complaint': f"Formal complaint regarding {phrase} at {street}, {area}. Complaint ID {i}.",
+                'created_at': '2025-01-01 00:00:00'
+            })
+            if len(batch) == 20000:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "INSERT INTO issue_report (id, issue_type, status, priority, department, latitude, longitude, "
+                        "address, description, formal_complaint, created_at) VALUES (:id, :issue_type, :status, "
+                        ":priority, :department, :latitude, :longitude, :address, :description, :formal_complaint, "
+                        ":created_at)"), batch)
+                batch = []
+        if batch:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO issue_report (id, issue_type, status, priority, department, latitude, longitude, "
+                    "address, description, formal_complaint, created_at) VALUES (:id, :issue_type, :status, "
+                    ":priority, :department, :latitude, :longitude, :address, :description, :formal_complaint, "
+                    ":created_at)"), batch)
+    start = time.perf_counter()
+    search.install_search_index(engine)
+    print(f"index install: {time.perf_counter() - start:.1f}s")
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--db', default='/tmp/search_bench.db')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    engine = populate(args.db, args.rows)
+    queries = {
+        'rare street': 'rawatpur chowk 17',
+        'common + rare': 'report 123457',
+        'street + area': 'birhana road jajmau',
+        'street prefix': 'swaroop nag',
+        'broad (one phrase)': 'graffiti',
+    }
+    with Session(engine) as session:
+        for label, query in queries.items():
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                total, results = search.search_complaints(session, query, limit=20)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{label:<20} q={query!r:<24} total={total:>6} page={len(results):>2} "
+                  f"p50={statistics.median(timings):7.1f} ms  max={max(timings):7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: /api/all-complaints serialization before and after serialization.py.
+
+Builds N synthetic complaint rows and measures CPU time for row building plus JSON
+encoding, and the bytes on the wire uncompressed, gzip and brotli.
+
+Usage:
+    python benchmarks/bench_serialization.py [--rows 20000] [--repeat 5]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+
+ISSUE_TYPES = ['potholes', 'garbage', 'graffiti', 'fallen_trees', 'damaged_signs', 'illegal_parking']
+STATUSES = ['pending', 'in_progress', 'resolved']
+
+
+def make_complaints(n):
+    rng = random.Random(42)
+    base = datetime(2025, 1, 1)
+    rows = []
+    for i in range(n):
+        created = base + timedelta(seconds=rng.randint(0, 300 * 86400), microseconds=rng.randint(0, 999999))
+        rows.append(SimpleNamespace(
+            id=i + 1,
+            user_id=f"user-{rng.randint(1, 5000)}",
+            issue_type=rng.choice(ISSUE_TYPES),
+            status=rng.choice(STATUSES),
+            priority='normal',
+            latitude=26.4 + rng.random() / 10,
+            longitude=80.3 + rng.random() / 10,
+            address='Jajmau, Kanpur, Kanpur Nagar, Uttar Pradesh, 208015, India',
+            description='Large pothole near the market entrance, water collects after rain.',
+            department='Public Works',
+            created_at=created,
+            updated_at=created + timedelta(hours=rng.randint(0, 500)),
+        ))
+    return rows
+
+
+def build_rows(complaints, raw_datetimes):
+    out = []
+    for c in complaints:
+        row = {
+            'id': c.id,
+            'user_id': c.user_id,
+            'issue_type': c.issue_type or 'other',
+            'status': c.status or 'pending',
+            'priority': c.priority or 'normal',
+            'latitude': c.latitude,
+            'longitude': c.longitude,
+            'address': c.address,
+            'description': c.description,
+            'department': c.department,
+        }
+        if raw_datetimes:
+            row['created_at'] = c.created_at
+            row['updated_at'] = c.updated_at
+        else:
+            row['created_at'] = c.created_at.isoformat() if c.created_at else None
+            row['updated_at'] = c.updated_at.isoformat() if c.updated_at else None
+        out.append(row)
+    return {'complaints': out, 'total': len(out)}
+
+
+def encode_before(payload):
+    # What Flask 2.3's default jsonify does outside debug mode
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def cpu_time(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = fn()
+        best = min(best, time.process_time() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    complaints = make_complaints(args.rows)
+    before_t, before_body = cpu_time(lambda: encode_before(build_rows(complaints, False)), args.repeat)
+    print(f"rows={args.rows}")
+    print(f"before (stdlib jsonify)      cpu={before_t * 1000:8.1f} ms  bytes={len(before_body):>10}")
+
+    for name in sorted(serialization.ENCODERS):
+        serialization.set_encoder(name)
+        t, body = cpu_time(lambda: serialization.encode_json(build_rows(complaints, True)), args.repeat)
+        print(f"after  ({name:<8})            cpu={t * 1000:8.1f} ms  bytes={len(body):>10}  speedup={before_t / t:.2f}x")
+
+    gz_t, gz = cpu_time(lambda: serialization.compress_body(body, 'gzip'), args.repeat)
+    print(f"gzip level {serialization.GZIP_LEVEL}                 cpu={gz_t * 1000:8.1f} ms  bytes={len(gz):>10}  "
+          f"ratio={len(before_body) / len(gz):.1f}x")
+    if serialization.brotli is not None:
+        br_t, br = cpu_time(lambda: serialization.compress_body(body, 'br'), args.repeat)
+        print(f"brotli quality {serialization.BROTLI_QUALITY}             cpu={br_t * 1000:8.1f} ms  bytes={len(br):>10}  "
+              f"ratio={len(before_body) / len(br):.1f}x")
+    else:
+        print("brotli not installed; skipping")
+
+
+if __name__ == '__main__':
+    main()
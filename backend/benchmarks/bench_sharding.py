@@ -0,0 +1,145 @@
+"""
+Check geographic sharding end to end with local SQLite files standing in for the shards.
+
+Writes a shard config (nyc, sf, plus the default shard = the main database), submits
+complaints in three cities through the batch endpoint and then checks:
+- every complaint landed in its region's file, with an id from that shard's range
+- /api/track-complaint/<id> resolves from the id alone with one SQL statement
+- paged /api/all-complaints (parallel scatter-gather, merged newest first) matches
+  the full list sorted by created_at, id across every page
+- /api/stats and /api/search without ?shard= cover every shard: stats totals equal
+  the sum of the per-shard reports, search finds every complaint once
+
+Last, it times the cross-shard endpoints.
+
+Usage:
+    python benchmarks/bench_sharding.py [--dir /tmp/shard_check] [--complaints 3000] [--page 50]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+CITIES = {
+    # name: (lat, lon, shard)
+    'New York': (40.71, -74.00, 'nyc'),
+    'San Francisco': (37.77, -122.42, 'sf'),
+    'Kanpur': (26.45, 80.33, 'default'),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default='/tmp/shard_check')
+    parser.add_argument('--complaints', type=int, default=3000)
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    os.makedirs(args.dir)
+    files = {'default': os.path.join(args.dir, 'main.db'), 'nyc': os.path.join(args.dir, 'nyc.db'),
+             'sf': os.path.join(args.dir, 'sf.db')}
+    config = os.path.join(args.dir, 'shards.json')
+    with open(config, 'w') as f:
+        json.dump({'shards': {'nyc': {'number': 1, 'url': f"sqlite:///{files['nyc']}"},
+                              'sf': {'number': 3, 'url': f"sqlite:///{files['sf']}"}},
+                   'regions': {'dr5': 'nyc', '9q8': 'sf'}}, f, indent=2)
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{files['default']}",
+        'SHARD_CONFIG': config,
+        'RESPONSE_CACHE': 'off',  # every request must reach the databases
+        'LOCATION_ROUTING': 'false',
+        'BATCH_MAX_ITEMS': '1000',
+        'QUERY_MONITOR': 'true',  # X-DB-Queries, sent to admin requests
+        'MODEL_ADMIN_TOKEN': 'bench',
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as backend  # noqa: E402
+    from sharding import SHARD_ID_SPAN  # noqa: E402
+
+    with backend.app.app_context():
+        backend.create_tables()
+    client = backend.app.test_client()
+
+    random.seed(7)
+    expected = {}
+    start = time.perf_counter()
+    for offset in range(0, args.complaints, 500):
+        items = []
+        for i in range(offset, min(offset + 500, args.complaints)):
+            city = random.choice(list(CITIES))
+            lat, lon, shard = CITIES[city]
+            items.append({'issue_type': 'pothole', 'address': f"{city} #{i}", 'description': f"pothole {i}",
+                          'latitude': lat + random.uniform(-0.05, 0.05), 'longitude': lon + random.uniform(-0.05, 0.05)})
+            expected[shard] = expected.get(shard, 0) + 1
+        results = client.post('/api/submit-complaints/batch', json={'complaints': items}).get_json()['results']
+        assert all(r['status'] == 'created' for r in results), results[:3]
+    print(f"submitted {args.complaints} complaints in {time.perf_counter() - start:.1f}s: {expected}")
+
+    for shard, path in files.items():
+        with sqlite3.connect(path) as conn:
+            count, low, high = conn.execute("SELECT count(*), min(id), max(id) FROM issue_report").fetchone()
+        number = backend.shard_router.numbers[shard]
+        print(f"  {shard:8s} {path}: {count} rows, ids {low}..{high}")
+        assert count == expected.get(shard, 0), f"{shard}: {count} rows, expected {expected.get(shard, 0)}"
+        assert count == 0 or low // SHARD_ID_SPAN == high // SHARD_ID_SPAN == number, f"{shard}: ids outside its range"
+
+    everything = client.get('/api/all-complaints').get_json()['complaints']
+    for complaint in random.sample(everything, 20):
+        response = client.get(f"/api/track-complaint/{complaint['id']}", headers={'X-Admin-Token': 'bench'})
+        assert response.status_code == 200 and response.headers.get('X-DB-Queries') == '1', \
+            f"track {complaint['id']}: {response.status_code}, {response.headers.get('X-DB-Queries')} statements"
+    print("track-complaint: 20 random ids resolved from one shard each (1 SQL statement)")
+
+    ordered = sorted(everything, key=lambda c: (c['created_at'], c['id']), reverse=True)
+    paged, offset = [], 0
+    while True:
+        page = client.get(f"/api/all-complaints?limit={args.page}&offset={offset}").get_json()
+        paged.extend(page['complaints'])
+        offset += args.page
+        if not page['has_more']:
+            break
+    assert [c['id'] for c in paged] == [c['id'] for c in ordered], "merged pages differ from the sorted full list"
+    print(f"all-complaints: {len(paged)} rows in {offset // args.page} merged pages, same order as the full list")
+
+    stats = client.get('/api/stats').get_json()
+    per_shard = [client.get(f'/api/stats?shard={name}').get_json() for name in files]
+    assert stats['total'] == args.complaints == sum(part['total'] for part in per_shard), \
+        f"stats total {stats['total']}, per shard {[part['total'] for part in per_shard]}"
+    assert stats['backlog']['open'] == sum(part['backlog']['open'] for part in per_shard)
+    print(f"stats: {stats['total']} complaints over {stats['shards']}, same as the per-shard reports")
+
+    found, offset = [], 0
+    while True:
+        page = client.get(f"/api/search?q=pothole&limit=100&offset={offset}").get_json()
+        found.extend(result['id'] for result in page['results'])
+        offset += 100
+        if offset >= page['total']:
+            break
+    assert page['total'] == args.complaints and sorted(found) == sorted(c['id'] for c in everything), \
+        f"search: total {page['total']}, {len(set(found))} distinct of {args.complaints}"
+    print(f"search: {page['total']} matches over every shard, each returned once (ranked={page['ranked']})")
+
+    for label, path in (('all-complaints (page)', f'/api/all-complaints?limit={args.page}&offset={args.page * 10}'),
+                        ('all-complaints (full)', '/api/all-complaints'),
+                        ('heatmap-data', '/api/heatmap-data'),
+                        ('stats', '/api/stats'),
+                        ('search', '/api/search?q=pothole'),
+                        ('track-complaint', f"/api/track-complaint/{everything[0]['id']}")):
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            assert client.get(path).status_code == 200
+            times.append(time.perf_counter() - start)
+        print(f"  {label:24s} median {statistics.median(times) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
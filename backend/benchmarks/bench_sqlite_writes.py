@@ -0,0 +1,113 @@
+"""
+Benchmark: concurrent write throughput on the SQLite fallback.
+
+Many client threads submit complaints (and update statuses) against a fresh SQLite
+file via the Flask test client, once for each mode:
+
+    default   SQLite defaults (rollback journal, synchronous=FULL)   SQLITE_TUNING=false
+    wal       WAL + tuned pragmas + busy timeout                     (default)
+    group     wal + group-commit writer for submissions              GROUP_COMMIT=true
+
+Each mode runs in its own process because the settings are read at import.
+
+Usage:
+    python benchmarks/bench_sqlite_writes.py [--clients 32] [--writes 50] [--modes default,wal,group]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'default': {'SQLITE_TUNING': 'false', 'GROUP_COMMIT': 'false'},
+    'wal': {'SQLITE_TUNING': 'true', 'GROUP_COMMIT': 'false'},
+    'group': {'SQLITE_TUNING': 'true', 'GROUP_COMMIT': 'true'},
+}
+
+
+def run_mode(clients, writes, update_ratio):
+    """Child process: drive the app and print one JSON result line."""
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    with backend.app.app_context():
+        backend.create_tables()
+    seed = backend.app.test_client().post('/api/submit-complaint', json={'issue_type': 'garbage', 'address': 'seed'})
+    first_id = seed.get_json()['complaint_id']
+
+    def client_loop(client_index):
+        rng = random.Random(client_index)
+        client = backend.app.test_client()
+        ok = errors = locked = 0
+        for i in range(writes):
+            if rng.random() < update_ratio:
+                response = client.put(f"/api/complaint/{first_id}/update-status",
+                                      json={'status': rng.choice(['pending', 'in_progress'])})
+            else:
+                response = client.post('/api/submit-complaint', json={
+                    'issue_type': rng.choice(['garbage', 'potholes', 'graffiti']),
+                    'latitude': 26.4 + rng.random() * 0.1, 'longitude': 80.3 + rng.random() * 0.1,
+                    'address': f"Ward {client_index}-{i}, Kanpur", 'description': 'benchmark write'})
+            if response.status_code == 200:
+                ok += 1
+            else:
+                errors += 1
+                locked += 'locked' in (response.get_json() or {}).get('error', '')
+        return ok, errors, locked
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(client_loop, range(clients)))
+    elapsed = time.perf_counter() - start
+    ok = sum(r[0] for r in results)
+    result = {'ok': ok, 'errors': sum(r[1] for r in results), 'locked': sum(r[2] for r in results),
+              'seconds': round(elapsed, 2), 'writes_per_sec': round(ok / elapsed, 1)}
+    if backend.group_writer is not None:
+        result['group_commit'] = backend.group_writer.stats()
+    print('RESULT ' + json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--writes', type=int, default=50, help='writes per client')
+    parser.add_argument('--update-ratio', type=float, default=0.2)
+    parser.add_argument('--modes', default='default,wal,group')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_mode(args.clients, args.writes, args.update_ratio)
+        return
+
+    for mode in args.modes.split(','):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, **MODES[mode],
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                       EVENTS_BROKER_PATH=os.path.join(tmp, 'events.db'),
+                       RESPONSE_CACHE='off', LOCATION_ROUTING='false')
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', mode, '--clients', str(args.clients),
+                 '--writes', str(args.writes), '--update-ratio', str(args.update_ratio)],
+                env=env, capture_output=True, text=True, cwd=BACKEND_DIR
+            ).stdout
+        line = next((l for l in output.splitlines() if l.startswith('RESULT ')), None)
+        if line is None:
+            print(f"{mode:8s} failed:\n{output[-2000:]}")
+            continue
+        result = json.loads(line[len('RESULT '):])
+        print(f"{mode:8s} {result['writes_per_sec']:8.1f} writes/s  ok={result['ok']} errors={result['errors']} "
+              f"(locked={result['locked']}) in {result['seconds']}s"
+              + (f"  groups: {result['group_commit']}" if 'group_commit' in result else ''))
+
+
+if __name__ == '__main__':
+    main()
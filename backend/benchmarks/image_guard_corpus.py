@@ -0,0 +1,197 @@
+"""
+Adversarial image corpus for the upload guard (image_guard.py).
+
+Generates files that try to exhaust a worker's memory or CPU through the image
+decoder. Each one is then decoded in a fresh process, and the peak RSS added by the
+decode is reported (measured from /proc/self/status VmHWM after resetting it):
+
+    photo_640x480.jpg       ordinary photo                                 -> decoded
+    photo_48mp.jpg          8000x6000 phone photo, above the pixel budget  -> reduced (DCT-scaled decode)
+    png_bomb_100mp.png      10000x10000 1-bit PNG, ~15 KB on disk          -> rejected_pixels
+    png_bomb_900mp.png      30000x30000 1-bit PNG                          -> rejected_pixels
+    gif_huge_screen.gif     1x1 frame on a 65535x65535 logical screen      -> rejected_pixels
+    jpeg_lying_header.jpg   64x64 JPEG whose header claims 12000x12000     -> reduced (1/4 scale, grey padding)
+    truncated.jpg           first half of a JPEG                           -> invalid
+    random.bin              random bytes                                   -> invalid
+    oversized.bin           12 MB payload                                  -> rejected_bytes
+
+The guarded run fails (exit 1) if any file ends in a different outcome. --unguarded
+decodes the same files the way the app did before the guard, with Image.open().convert()
+and OpenCV as the fallback, for comparison.
+
+Usage:
+    python benchmarks/image_guard_corpus.py [--out corpus_dir] [--unguarded]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> expected ImageGuard outcome
+EXPECTED = {
+    'photo_640x480.jpg': 'decoded',
+    'photo_48mp.jpg': 'reduced',
+    'png_bomb_100mp.png': 'rejected_pixels',
+    'png_bomb_900mp.png': 'rejected_pixels',
+    'gif_huge_screen.gif': 'rejected_pixels',
+    'jpeg_lying_header.jpg': 'reduced',
+    'truncated.jpg': 'invalid',
+    'random.bin': 'invalid',
+    'oversized.bin': 'rejected_bytes',
+}
+
+
+def photo(size):
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', size, (90, 120, 150))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size[0], max(size[0] // 16, 1)):
+        draw.rectangle([i, 0, i + size[0] // 32, size[1] - 1], fill=(i % 256, 200, 40))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def bilevel_png(side):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('1', (side, side)).save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def huge_screen_gif():
+    # Header + logical screen 65535x65535, no global palette, one 1x1 LZW-coded frame
+    return (b'GIF89a' + (65535).to_bytes(2, 'little') * 2 + b'\x00\x00\x00'
+            + b'\x2c' + b'\x00\x00' * 2 + (1).to_bytes(2, 'little') * 2 + b'\x00'
+            + b'\x02\x02\x44\x01\x00' + b'\x3b')
+
+
+def lying_jpeg():
+    data = bytearray(photo((64, 64)))
+    sof = data.index(b'\xff\xc0')
+    # SOF0: marker(2) length(2) precision(1) height(2) width(2)
+    data[sof + 5:sof + 9] = (12000).to_bytes(2, 'big') + (12000).to_bytes(2, 'big')
+    return bytes(data)
+
+
+def build_corpus(out):
+    os.makedirs(out, exist_ok=True)
+    files = {
+        'photo_640x480.jpg': lambda: photo((640, 480)),
+        'photo_48mp.jpg': lambda: photo((8000, 6000)),
+        'png_bomb_100mp.png': lambda: bilevel_png(10000),
+        'png_bomb_900mp.png': lambda: bilevel_png(30000),
+        'gif_huge_screen.gif': huge_screen_gif,
+        'jpeg_lying_header.jpg': lying_jpeg,
+        'truncated.jpg': lambda: photo((1600, 1200))[:40000],
+        'random.bin': lambda: os.urandom(64 * 1024),
+        'oversized.bin': lambda: os.urandom(12 * 1024 * 1024),
+    }
+    for name, make in files.items():
+        path = os.path.join(out, name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(make())
+
+
+def unguarded_decode(image_bytes):
+    """The decode path before image_guard: Pillow, then OpenCV on any failure."""
+    import cv2
+    import numpy as np
+    from PIL import Image
+    try:
+        return Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    except Exception:
+        cv_img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if cv_img is None:
+            raise ValueError('Failed to decode image bytes.')
+        return Image.fromarray(cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB))
+
+
+def peak_rss_kb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+
+
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def run_child(path, unguarded):
+    """Child process: decode one file, print one JSON result line."""
+    sys.path.insert(0, BACKEND_DIR)
+    from image_guard import ImageGuard, ImageRejected
+    with open(path, 'rb') as f:
+        payload = base64.b64encode(f.read()).decode()
+    guard = ImageGuard()
+    reset_peak_rss()
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    try:
+        if unguarded:
+            image = unguarded_decode(base64.b64decode(payload))
+        else:
+            image = guard.decode(payload)
+        result = f"{image.size[0]}x{image.size[1]}"
+    except ImageRejected as e:
+        result = f"{e.status} {e}"
+    except Exception as e:
+        result = f"error {type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    counts = guard.metrics.snapshot()
+    print('RESULT ' + json.dumps({
+        'outcome': next((name for name in guard.metrics.OUTCOMES if counts[name]), None),
+        'result': result[:70],
+        'ms': elapsed * 1000,
+        'peak_mb': (peak_rss_kb() - before) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', help='corpus directory (default: a temporary directory)')
+    parser.add_argument('--unguarded', action='store_true', help='decode without the guard, for comparison')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.unguarded)
+        return
+
+    out = args.out or tempfile.mkdtemp(prefix='image_guard_corpus_')
+    build_corpus(out)
+    print(f"corpus: {out} ({'unguarded' if args.unguarded else 'guarded'} decode, one process per file)")
+    failures = 0
+    for name, expected in EXPECTED.items():
+        path = os.path.join(out, name)
+        command = [sys.executable, os.path.abspath(__file__), '--child', path]
+        if args.unguarded:
+            command.append('--unguarded')
+        output = subprocess.run(command, capture_output=True, text=True, cwd=BACKEND_DIR).stdout
+        line = next((l for l in output.splitlines() if l.startswith('RESULT ')), None)
+        if line is None:
+            failures += not args.unguarded
+            print(f"{name:22s} process died (out of memory?) {output[-500:]}")
+            continue
+        r = json.loads(line[len('RESULT '):])
+        mark = ''
+        if not args.unguarded:
+            mark = 'ok' if r['outcome'] == expected else f"FAIL (expected {expected})"
+            failures += r['outcome'] != expected
+        print(f"{name:22s} {os.path.getsize(path) / 1024:9.0f} KB  {r['ms']:8.1f} ms  peak +{r['peak_mb']:7.1f} MB  "
+              f"{str(r['outcome'] or '-'):15s} {r['result']:45s} {mark}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
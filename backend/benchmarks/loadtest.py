@@ -0,0 +1,361 @@
+"""
+End-to-end load test of the Flask backend with a realistic traffic mix.
+
+The app is started in a child process on a real HTTP server (werkzeug, threaded)
+against a fresh SQLite database seeded with --seed-rows synthetic complaints.
+External services are replaced by local fakes:
+- Nominatim: geopy is pointed at a fake reverse-geocoding server inside the child
+  that answers after --geocoder-latency-ms.
+- Model: --random-model writes a random-weight UrbanMobileNet checkpoint and loads
+  it through MODEL_PATH (no trained weights needed); otherwise the configured weights.
+
+Requests arrive open-loop (Poisson arrivals at --rate per second), so a slow
+server builds a queue instead of slowing the generator down. Latency is measured
+from each request's scheduled send time, which includes the time it waited for a
+free client. The report gives throughput, error rate and p50/p95/p99 per endpoint.
+
+All randomness (seed data, traffic, images) comes from --seed, so runs are repeatable.
+Other settings (RESPONSE_CACHE, GROUP_COMMIT, SQLITE_*, ...) are passed through
+from the environment.
+
+Usage:
+    python benchmarks/loadtest.py [--rate 20] [--duration 60] [--seed-rows 5000] [--random-model]
+        [--mix classify=5,submit=10,track=30,map=15,heatmap=15,list=25] [--json results.json]
+"""
+
+import argparse
+import base64
+import functools
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = 'classify=5,submit=10,track=30,map=15,heatmap=15,list=25'
+ISSUE_TYPES = ['damaged_signs', 'fallen_trees', 'garbage', 'graffiti', 'illegal_parking', 'potholes']
+STATUSES = ['pending'] * 5 + ['in_progress'] * 3 + ['resolved'] * 2 + ['rejected']
+# Around the seeded departments (see create_tables)
+LAT_RANGE = (40.70, 40.80)
+LON_RANGE = (-74.02, -73.93)
+
+
+# ---------------------------------------------------------------------------
+# Server side (child process)
+# ---------------------------------------------------------------------------
+
+def start_fake_nominatim(latency):
+    """Fake Nominatim /reverse endpoint on a free local port; returns the port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            lat, lon = query.get('lat', ['0'])[0], query.get('lon', ['0'])[0]
+            time.sleep(latency)
+            body = json.dumps({
+                'place_id': 1, 'lat': lat, 'lon': lon,
+                'display_name': f"Block {lat[:7]}/{lon[:8]}, Manhattan, New York, United States",
+                'address': {'house_number': '12', 'road': 'Test Street', 'suburb': 'Manhattan',
+                            'city': 'New York', 'state': 'New York', 'postcode': '10001',
+                            'country': 'United States'}
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+def seed_database(backend, rows, rng):
+    """Insert synthetic complaints spread over the last 90 days."""
+    from sqlalchemy import insert
+    now = datetime.utcnow()
+    with backend.app.app_context():
+        backend.create_tables()
+        for start in range(0, rows, 1000):
+            chunk = []
+            for i in range(start, min(start + 1000, rows)):
+                issue_type = rng.choice(ISSUE_TYPES)
+                created = now - timedelta(seconds=rng.uniform(0, 90 * 86400))
+                chunk.append({
+                    'user_id': f"user{rng.randrange(rows // 5 + 1)}",
+                    'issue_type': issue_type,
+                    'latitude': rng.uniform(*LAT_RANGE), 'longitude': rng.uniform(*LON_RANGE),
+                    'address': f"{rng.randrange(1, 999)} Seed Avenue, New York",
+                    'description': f"Synthetic {issue_type.replace('_', ' ')} report #{i}",
+                    'status': rng.choice(STATUSES), 'priority': rng.choice(['normal', 'normal', 'high', 'low']),
+                    'department': backend.DEPARTMENT_MAPPING.get(issue_type, 'General Services'),
+                    'created_at': created, 'updated_at': created,
+                })
+            backend.db.session.execute(insert(backend.IssueReport), chunk)
+            backend.db.session.commit()
+
+
+def serve(args):
+    """Child process: fake externals, seed the database, serve the app until stdin closes."""
+    sys.path.insert(0, BACKEND_DIR)
+    rng = random.Random(args.seed)
+    geocoder_port = start_fake_nominatim(args.geocoder_latency_ms / 1000)
+    import geopy.geocoders
+    geopy.geocoders.Nominatim = functools.partial(geopy.geocoders.Nominatim,
+                                                  domain=f"127.0.0.1:{geocoder_port}", scheme='http')
+    if args.random_model:
+        import torch
+        from model_inference import UrbanMobileNet
+        torch.manual_seed(args.seed)
+        model_file = os.path.join(args.workdir, 'random_urban_mobilenet.pt')
+        torch.save(UrbanMobileNet(num_classes=6, cbam=True).state_dict(), model_file)
+        os.environ['MODEL_PATH'] = model_file
+        os.environ['MODEL_REGISTRY_DIR'] = os.path.join(args.workdir, 'registry')  # none: ignore a real registry
+
+    import app as backend
+    from werkzeug.serving import make_server
+
+    start = time.perf_counter()
+    seed_database(backend, args.seed_rows, rng)
+    print(f"[INFO] Seeded {args.seed_rows} complaints in {time.perf_counter() - start:.1f}s", flush=True)
+
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"READY {server.server_port}", flush=True)
+    sys.stdin.read()  # parent closes stdin when the run is over
+    server.shutdown()
+
+    # Remove the photos this run saved to uploads/
+    with backend.app.app_context():
+        paths = backend.db.session.scalars(
+            backend.db.select(backend.IssueReport.image_path).where(backend.IssueReport.image_path.isnot(None))).all()
+    for path in paths:
+        try:
+            os.remove(os.path.join(BACKEND_DIR, path))
+        except OSError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Load generator (parent process)
+# ---------------------------------------------------------------------------
+
+def make_images(rng, count=8):
+    """Small random JPEG photos as base64 strings."""
+    import numpy as np
+    from PIL import Image
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    images = []
+    for _ in range(count):
+        pixels = (np_rng.random((240, 320, 3)) * 255).astype('uint8')
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=80)
+        images.append(base64.b64encode(buffer.getvalue()).decode())
+    return images
+
+
+class Traffic:
+    """Builds the request for each endpoint kind."""
+
+    def __init__(self, base_url, seed_rows, images, submit_image_ratio):
+        self.base_url = base_url
+        self.max_id = max(seed_rows, 1)
+        self.images = images
+        self.submit_image_ratio = submit_image_ratio
+
+    def request(self, kind, rng):
+        """Returns (method, url, json_body)."""
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        if kind == 'classify':
+            return 'POST', '/api/classify-issue', {'image': rng.choice(self.images)}
+        if kind == 'submit':
+            body = {'issue_type': rng.choice(ISSUE_TYPES), 'latitude': lat, 'longitude': lon,
+                    'description': 'Load test report', 'user_id': f"load{rng.randrange(1000)}"}
+            if rng.random() < self.submit_image_ratio:
+                body['image'] = rng.choice(self.images)
+            return 'POST', '/api/submit-complaint', body  # no address: reverse-geocoded
+        if kind == 'track':
+            return 'GET', f"/api/track-complaint/{rng.randint(1, self.max_id)}", None
+        if kind == 'map':
+            return 'GET', f"/api/complaints-map?lat={lat:.5f}&lon={lon:.5f}&radius=2", None
+        if kind == 'heatmap':
+            return 'GET', '/api/heatmap-data', None
+        if kind == 'list':
+            return 'GET', '/api/all-complaints', None
+        raise ValueError(f"Unknown endpoint kind: {kind}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_load(base_url, args, mix):
+    import requests
+
+    rng = random.Random(args.seed + 1)
+    traffic = Traffic(base_url, args.seed_rows, make_images(rng), args.submit_image_ratio)
+    kinds, weights = list(mix), list(mix.values())
+    local = threading.local()
+    results = defaultdict(list)  # kind -> [(latency_s, ok)]
+    results_lock = threading.Lock()
+
+    def fire(kind, method, path, body, scheduled, record):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=args.timeout)
+            response.content
+            ok = response.status_code < 400 or (kind == 'track' and response.status_code == 404)
+        except requests.RequestException:
+            ok = False
+        latency = time.perf_counter() - scheduled
+        if record:
+            with results_lock:
+                results[kind].append((latency, ok))
+
+    total_time = args.warmup + args.duration
+    start = time.perf_counter()
+    next_at = start
+    sent = 0
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        while True:
+            next_at += rng.expovariate(args.rate)
+            if next_at - start > total_time:
+                break
+            kind = rng.choices(kinds, weights)[0]
+            method, path, body = traffic.request(kind, rng)
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, kind, method, path, body, next_at, next_at - start >= args.warmup)
+            sent += 1
+    elapsed = time.perf_counter() - start - args.warmup
+    return results, sent, elapsed
+
+
+def report(results, elapsed, args):
+    rows = []
+    every = []
+    for kind in sorted(results):
+        samples = results[kind]
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        every.extend(samples)
+        rows.append((kind, samples, latencies, errors))
+    rows.append(('TOTAL', every, sorted(latency for latency, _ in every), sum(1 for _, ok in every if not ok)))
+
+    summary = {'target_rate': args.rate, 'duration_s': round(elapsed, 1), 'seed_rows': args.seed_rows,
+               'mix': args.mix, 'endpoints': {}}
+    print(f"\n{'endpoint':10s} {'requests':>8s} {'req/s':>7s} {'errors':>7s} "
+          f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+    for kind, samples, latencies, errors in rows:
+        stats = {
+            'requests': len(samples),
+            'throughput': round(len(samples) / elapsed, 2),
+            'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'max_ms': round((latencies[-1] if latencies else 0) * 1000, 1),
+        }
+        summary['endpoints'][kind] = stats
+        print(f"{kind:10s} {stats['requests']:8d} {stats['throughput']:7.1f} {stats['error_rate']:7.1%} "
+              f"{stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f} {stats['max_ms']:8.1f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n[OK] Results written to {args.json}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=20, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=60, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of traffic before measuring')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight,... (classify, submit, track, map, '
+                                                           'heatmap, list)')
+    parser.add_argument('--seed-rows', type=int, default=5000, help='synthetic complaints in the database')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=64, help='client threads (max in-flight requests)')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--random-model', action='store_true', help='serve a random-weight UrbanMobileNet')
+    parser.add_argument('--geocoder-latency-ms', type=float, default=100, help='fake Nominatim response time')
+    parser.add_argument('--submit-image-ratio', type=float, default=0.5, help='share of submissions with a photo')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    mix = parse_mix(args.mix)
+    unknown = set(mix) - {'classify', 'submit', 'track', 'map', 'heatmap', 'list'}
+    if unknown:
+        parser.error(f"unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+                   EVENTS_BROKER_PATH=os.path.join(workdir, 'events.db'))
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', '--workdir', workdir,
+             '--seed', str(args.seed), '--seed-rows', str(args.seed_rows),
+             '--geocoder-latency-ms', str(args.geocoder_latency_ms)] + (['--random-model'] if args.random_model else []),
+            env=env, cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True)
+        # Keep draining the server log so it never blocks on a full pipe
+        log = deque(maxlen=200)
+        port = None
+        for line in child.stdout:
+            log.append(line)
+            if line.startswith('[INFO] Seeded'):
+                print(line.rstrip())
+            if line.startswith('READY '):
+                port = int(line.split()[1])
+                break
+        if port is None:
+            print(''.join(log))
+            raise SystemExit('[ERROR] Server failed to start')
+        threading.Thread(target=lambda: log.extend(child.stdout), daemon=True).start()
+
+        print(f"[INFO] Load: {args.rate:g} req/s for {args.duration:g}s (+{args.warmup:g}s warmup), mix {args.mix}")
+        try:
+            results, sent, elapsed = run_load(f"http://127.0.0.1:{port}", args, mix)
+        finally:
+            child.stdin.close()
+            child.wait(timeout=60)
+        print(f"[INFO] Sent {sent} requests; achieved {sum(map(len, results.values())) / elapsed:.1f} req/s measured")
+        report(results, elapsed, args)
+
+
+if __name__ == '__main__':
+    main()
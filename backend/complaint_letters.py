@@ -0,0 +1,245 @@
+"""
+Formal complaint letter generation.
+
+Everything that does not depend on the complaint is built once at import time: the
+state/city gazetteer, the default issue descriptions and two letter templates (with
+and without GPS coordinates). Address parsing is memoized per address string, so a
+letter is one dict lookup, one str.format() and two substring checks.
+"""
+
+import re
+from datetime import datetime
+from functools import lru_cache
+
+DEFAULT_CITY = "Kanpur"
+DEFAULT_STATE = "Uttar Pradesh"
+
+# Gazetteer (built once)
+STATE_NAMES = (
+    'Uttar Pradesh', 'Maharashtra', 'Karnataka', 'Gujarat', 'Rajasthan', 'Punjab',
+    'West Bengal', 'Tamil Nadu', 'Andhra Pradesh', 'Madhya Pradesh', 'Bihar', 'Odisha',
+    'Assam', 'Haryana', 'Kerala', 'Jharkhand', 'Chhattisgarh', 'Delhi',
+    'Himachal Pradesh', 'Uttarakhand', 'Goa', 'Manipur', 'Meghalaya', 'Mizoram',
+    'Nagaland', 'Sikkim', 'Tripura', 'Arunachal Pradesh', 'Telangana'
+)
+CITY_NAMES = frozenset([
+    'kanpur', 'delhi', 'mumbai', 'bangalore', 'chennai', 'kolkata', 'hyderabad', 'pune', 'ahmedabad'
+])
+STATE_SUFFIXES = ('Pradesh', 'Bengal', 'Nadu', 'Kerala', 'Gujarat', 'Rajasthan')
+COUNTRY_NAMES = frozenset(['india', 'indian'])
+
+# One alternation per list: a single C-level scan per address part ("contains any of")
+_STATE_MATCHER = re.compile('|'.join(re.escape(name) for name in STATE_NAMES))
+_STATE_SUFFIX_MATCHER = re.compile('|'.join(re.escape(suffix) for suffix in STATE_SUFFIXES))
+
+PRIORITY_DISPLAY = {
+    'low': 'Low',
+    'normal': 'Normal',
+    'high': 'High',
+    'urgent': 'Urgent'
+}
+
+# Default descriptions when the citizen did not write one ({location} is filled in)
+ISSUE_DESCRIPTIONS = {
+    'potholes': 'The road surface in {location} has multiple potholes that are causing significant disruption to traffic flow and posing safety risks to vehicles and pedestrians.',
+    'damaged_signs': 'Traffic signs or road signs in {location} are damaged, missing, or illegible, which poses safety risks to motorists and pedestrians.',
+    'fallen_trees': 'Fallen trees or tree branches in {location} are blocking roads or pathways, creating obstacles and potential safety hazards.',
+    'garbage': 'Garbage and waste accumulation in {location} is causing health and environmental concerns, requiring immediate cleanup and waste management.',
+    'graffiti': 'Unauthorized graffiti and vandalism in {location} is affecting the aesthetic appearance of public spaces and may indicate security concerns.',
+    'illegal_parking': 'Illegal parking in {location} is obstructing traffic flow and creating safety hazards for vehicles and pedestrians.',
+    'street_light': 'Street lights in {location} are not functioning properly, creating safety concerns especially during nighttime hours.',
+    'water_leak': 'Water leaks in {location} are causing water wastage and potential damage to infrastructure and surrounding areas.',
+    'traffic_signal': 'Traffic signals in {location} are malfunctioning or not working, creating traffic congestion and safety risks.',
+    'sidewalk_damage': 'Sidewalk damage in {location} is creating hazards for pedestrians and requires immediate repair.',
+    'drainage': 'Drainage issues in {location} are causing water accumulation and potential flooding risks.',
+}
+GENERIC_DESCRIPTION = 'Civic infrastructure issue of type {issue_lower} has been identified in {location} and requires immediate attention to ensure public safety.'
+
+URGENT_SENTENCE = 'Given the {priority_lower} priority level, we request immediate action to address this matter.'
+ROUTINE_SENTENCE = 'Prompt action is necessary to prevent further deterioration and ensure the safety of residents and commuters.'
+
+_LETTER = """Nagrik Nivedan Platform
+Complaint Reference: {user_id}
+
+{current_date}
+
+To,
+The Municipal Commissioner,
+{city} Municipal Corporation,
+{city}, {state}, India.
+
+**Subject: Formal Complaint Regarding {issue_display} Issue in {location}**
+
+Dear Sir/Madam,
+
+This letter serves as a formal complaint regarding a {issue_lower} issue that has been identified in {location} and requires immediate attention.
+
+**COMPLAINT DETAILS:**
+
+**Issue Type:** {issue_display} (AI-Identified)
+**Priority:** {priority_display} Priority
+**Location:** {location}
+<COORDINATES>
+**Date:** {current_date}
+**Assigned Department:** {department}
+**Complaint ID:** {user_id}
+
+**DESCRIPTION:**
+
+{description}
+
+**LOCATION DETAILS:**
+
+- **Full Address:** {location}
+<GPS>
+<CAPTURED>
+
+**URGENCY ASSESSMENT:**
+
+We consider this issue to be of **{priority_lower} priority**. The condition of the {issue_lower} in {location} requires attention to ensure public safety and maintain service standards. {urgency_sentence}
+
+**POTENTIAL SAFETY CONCERNS:**
+
+The presence of this {issue_lower} issue presents several potential safety concerns, including:
+- Increased risk of accidents, particularly for vehicles and pedestrians
+- Potential damage to vehicles and infrastructure
+- Disruption to traffic flow and public safety
+- Risk of injury to residents and commuters
+
+**REQUEST FOR IMMEDIATE ACTION:**
+
+We respectfully request that the {department} take immediate action to address this critical issue. Specifically, we request the following:
+
+1. **Immediate Inspection:** Conduct a thorough inspection of the location in {location} to assess the extent of the {issue_lower} issue.
+
+2. **Assessment and Remediation:** Implement appropriate measures to resolve the {issue_lower} issue and restore the area to a safe and usable condition.
+
+3. **Preventative Measures:** Explore and implement preventative measures to prevent the recurrence of similar issues in the future, such as improved maintenance and use of durable materials.
+
+4. **Status Updates:** Provide updates on the progress through our tracking system (Complaint ID: {user_id}).
+
+We believe that prompt action is essential to mitigate any risks associated with this issue and ensure the safety and well-being of the residents and commuters in {location}. We look forward to a timely response and a concrete plan of action to address this matter.
+
+Thank you for your attention to this important issue.
+
+Respectfully,
+
+Nagrik Nivedan Platform
+Complaint ID: {user_id}
+{current_date}"""
+
+_BLANK_LINES = re.compile(r'\n{3,}')
+_BRACKETED = re.compile(r'\[.*?\]')
+
+LETTER_WITH_COORDINATES = (_LETTER
+                           .replace('<COORDINATES>', '**Coordinates:**\n{coordinates}')
+                           .replace('<GPS>', '- **GPS Coordinates:** {coordinates}')
+                           .replace('<CAPTURED>', "- **Captured from user's device GPS**"))
+# Without coordinates the three lines are empty; collapse the blank runs once, here
+LETTER_WITHOUT_COORDINATES = _BLANK_LINES.sub('\n\n', _LETTER
+                                              .replace('<COORDINATES>', '')
+                                              .replace('<GPS>', '')
+                                              .replace('<CAPTURED>', ''))
+
+
+@lru_cache(maxsize=4096)
+def parse_location(location):
+    """
+    Extract (city, state) from a reverse-geocoded address.
+
+    Expected format: "Area, City, District, State, Pincode, Country", e.g.
+    "Jajmau, Kanpur, Kanpur Nagar, Uttar Pradesh, 208015, India".
+    Falls back to Kanpur / Uttar Pradesh.
+    """
+    parts = [part.strip() for part in location.split(',')] if location else []
+    city = DEFAULT_CITY
+    state = DEFAULT_STATE
+
+    if len(parts) >= 4:
+        # State is the first part naming an Indian state; the city precedes it
+        for i, part in enumerate(parts):
+            if _STATE_MATCHER.search(part):
+                state = part
+                if i > 0:
+                    city = parts[i - 1]
+                break
+
+    if city == DEFAULT_CITY and len(parts) >= 2:
+        for part in parts:
+            if part.lower() in CITY_NAMES:
+                city = part
+                break
+        if city == DEFAULT_CITY:
+            city = parts[-3] if len(parts) >= 3 else parts[-2]
+
+    if state == DEFAULT_STATE and len(parts) >= 2:
+        # Skip pincode and country, take the last part that looks like a state
+        for part in reversed(parts):
+            if not part.isdigit() and part.lower() not in COUNTRY_NAMES and _STATE_SUFFIX_MATCHER.search(part):
+                state = part
+                break
+
+    return city, state
+
+
+def render_letter(issue_type, description, location, latitude, longitude, priority, department, user_id, letter_date=None):
+    """
+    Render the formal complaint letter.
+
+    Args:
+        issue_type: Type of issue (e.g., 'potholes')
+        description: User description of the issue
+        location: Full address
+        latitude, longitude: GPS coordinates (omitted from the letter when falsy)
+        priority: Priority level (low, normal, high, urgent)
+        department: Assigned department name
+        user_id: User identifier
+        letter_date: Date printed on the letter (defaults to today)
+
+    Returns:
+        str: Complete complaint letter with no placeholders
+    """
+    issue_display = issue_type.replace('_', ' ').title()
+    issue_lower = issue_display.lower()
+    city, state = parse_location(location)
+    priority_display = PRIORITY_DISPLAY.get(priority, 'Normal')
+    priority_lower = priority_display.lower()
+
+    if description:
+        description_text = description
+    else:
+        template = ISSUE_DESCRIPTIONS.get(issue_type)
+        description_text = (template.format(location=location) if template
+                            else GENERIC_DESCRIPTION.format(issue_lower=issue_lower, location=location))
+
+    if latitude and longitude:
+        template = LETTER_WITH_COORDINATES
+        coordinates = f"Latitude: {latitude:.6f}° N\nLongitude: {longitude:.6f}° E"
+    else:
+        template = LETTER_WITHOUT_COORDINATES
+        coordinates = ''
+
+    letter = template.format(
+        user_id=user_id,
+        current_date=(letter_date or datetime.now()).strftime('%B %d, %Y'),
+        city=city,
+        state=state,
+        issue_display=issue_display,
+        issue_lower=issue_lower,
+        location=location,
+        coordinates=coordinates,
+        priority_display=priority_display,
+        priority_lower=priority_lower,
+        department=department,
+        description=description_text,
+        urgency_sentence=(URGENT_SENTENCE.format(priority_lower=priority_lower)
+                          if priority in ('high', 'urgent') else ROUTINE_SENTENCE)
+    )
+
+    # The template itself has no brackets or blank runs; only user-supplied fields can
+    # introduce them, so the cleanup passes run only when needed.
+    if '[' in letter:
+        letter = _BRACKETED.sub('', letter)
+    if '\n\n\n' in letter:
+        letter = _BLANK_LINES.sub('\n\n', letter)
+    return letter.strip()
@@ -0,0 +1,80 @@
+"""
+Convert a training checkpoint (.pth) into a memory-mappable weight file.
+
+The output holds exactly the tensors UrbanMobileNet needs (including the CBAM
+block when the checkpoint has it; --no-cbam drops it), and every tensor is stored
+contiguous, in fp32, with its own storage. IssueClassifier then maps the file and
+builds the model directly on those tensors. There is no unpickling, no random
+initialization and no copy, and worker processes share the weight pages through
+the OS page cache.
+
+Output format by extension:
+    .safetensors   safetensors file (requires: pip install safetensors)
+    anything else  zip-format torch file, read with torch.load(mmap=True, weights_only=True)
+
+After writing, the converted weights are loaded back and checked against the
+original checkpoint on a random batch.
+
+Usage:
+    python convert_weights.py ../model/best_urban_mobilenet.pth ../model/best_urban_mobilenet.safetensors
+"""
+
+import argparse
+import os
+
+import torch
+
+from model_inference import UrbanMobileNet, build_model_in_place, load_safetensors, read_state_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='checkpoint to convert (.pth)')
+    parser.add_argument('output', help='.safetensors or .pt output file')
+    parser.add_argument('--num-classes', type=int, default=6)
+    parser.add_argument('--no-cbam', action='store_true', help='drop the CBAM weights')
+    args = parser.parse_args()
+
+    source, _ = read_state_dict(args.source, torch.device('cpu'))
+    cbam = not args.no_cbam and any(key.startswith('cbam.') for key in source)
+    model = UrbanMobileNet(num_classes=args.num_classes, cbam=cbam)
+    missing, unexpected = model.load_state_dict(source, strict=False)
+    if missing:
+        raise SystemExit(f"[ERROR] Checkpoint is missing {len(missing)} model tensors, e.g. {missing[:3]}")
+    if unexpected:
+        print(f"[INFO] Dropping {len(unexpected)} tensors the inference model does not use: {', '.join(unexpected)}")
+
+    # Independent, contiguous fp32 storages (safetensors refuses shared storage)
+    weights = {key: tensor.detach().to(torch.float32 if tensor.is_floating_point() else tensor.dtype)
+               .contiguous().clone() for key, tensor in model.state_dict().items()}
+
+    if args.output.endswith('.safetensors'):
+        if load_safetensors is None:
+            raise SystemExit("[ERROR] safetensors is not installed (pip install safetensors), "
+                             "or write a .pt file instead")
+        from safetensors.torch import save_file
+        save_file(weights, args.output, metadata={'source': os.path.basename(args.source),
+                                                  'num_classes': str(args.num_classes)})
+    else:
+        torch.save(weights, args.output)  # zip format; mmap-loadable
+
+    converted, memory_mapped = read_state_dict(args.output, torch.device('cpu'))
+    fast = build_model_in_place(args.num_classes, converted, cbam=cbam)
+    if fast is None or not memory_mapped:
+        raise SystemExit(f"[ERROR] {args.output} does not load in place; conversion failed")
+
+    model.eval()
+    fast.eval()
+    batch = torch.randn(4, 3, 224, 224)
+    with torch.inference_mode():
+        diff = (model(batch) - fast(batch)).abs().max().item()
+    if diff > 1e-5:
+        raise SystemExit(f"[ERROR] Converted weights disagree with the checkpoint (max logit diff {diff:.2e})")
+
+    print(f"[OK] Wrote {args.output} ({len(weights)} tensors, {os.path.getsize(args.output) / 1e6:.1f} MB; "
+          f"source {os.path.getsize(args.source) / 1e6:.1f} MB; CBAM {'kept' if cbam else 'dropped'}); "
+          f"max logit diff {diff:.1e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Database engine setup: connection pool tuning, checkout metrics and read-replica routing.
+
+Pool settings come from the environment (DB_POOL_SIZE, DB_MAX_OVERFLOW,
+DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING). Pre-ping and recycle are on
+by default, so connections the server or a proxy dropped while idle are replaced
+on checkout instead of failing the request.
+
+Every queue pool records how long each checkout waited for a connection. That
+covers the queue wait when the pool is exhausted and the connect time when it
+opens a new one. pool_stats() reports these numbers with the live pool state.
+
+SQLite connections get WAL journaling, a busy timeout and tuned pragmas on every
+connect (SQLITE_TUNING=false keeps SQLite's defaults). In WAL mode readers never
+block the writer, and the busy timeout makes writers queue for the lock instead of
+failing with "database is locked".
+
+When DATABASE_REPLICA_URL is set, a 'replica' bind is configured. Views decorated
+with @read_replica run their queries against it. Everything else stays on the
+primary: flushes, INSERT/UPDATE/DELETE and all other views. So do reads within
+REPLICA_READ_AFTER_WRITE seconds of a committed write, which gives read-your-writes
+despite replication lag. The worker's own writes are tracked here; writes of other
+workers through the shared write clock (set_shared_write_clock), which app.py takes
+from the response cache's invalidations. That also keeps a cache miss right after an
+invalidation from caching the replica's lagging rows under the new tag versions.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+REPLICA_BIND = 'replica'
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """Checkout wait-time counters for one pool (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record(self, seconds, timed_out=False):
+        millis = seconds * 1000
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS_MS) if millis <= bound), len(WAIT_BUCKETS_MS))
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self.buckets[index] += 1
+
+    def snapshot(self):
+        with self._lock:
+            # Ordered [upper bound in ms (None = above the last bound), count] pairs
+            bounds = list(WAIT_BUCKETS_MS) + [None]
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait * 1000 / max(self.checkouts + self.timeouts, 1), 3),
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'wait_histogram': [[bound, count] for bound, count in zip(bounds, self.buckets)]
+            }
+
+
+POOL_METRICS = {}  # bind name -> PoolMetrics
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+
+def instrumented_pool_class(name):
+    """A QueuePool subclass bound to POOL_METRICS[name] (kept across pool.recreate())."""
+    metrics = POOL_METRICS.setdefault(name, PoolMetrics())
+    return type(f"InstrumentedQueuePool_{name}", (InstrumentedQueuePool,), {'metrics': metrics})
+
+
+def sqlite_pragmas():
+    """PRAGMA statements applied to every SQLite connection, from the SQLITE_* environment variables."""
+    return [
+        f"PRAGMA journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",  # NORMAL is crash-safe in WAL mode
+        f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 10000))}",
+        f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))}",  # negative = KiB
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 268435456))}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+_pragmas_installed = False
+
+
+def install_sqlite_pragmas():
+    """Apply sqlite_pragmas() on every new SQLite connection of every engine (idempotent)."""
+    global _pragmas_installed
+    if _pragmas_installed:
+        return
+    _pragmas_installed = True
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(Engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    print(f"[INFO] SQLite tuning: {'; '.join(p.replace('PRAGMA ', '') for p in pragmas)}")
+
+
+def _is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(url, name):
+    """
+    SQLAlchemy engine options for one bind, from the DB_POOL_* environment variables.
+
+    Args:
+        url: database URL of the bind
+        name: metrics name for the bind (e.g. 'primary', 'replica')
+
+    Returns:
+        dict: keyword arguments for create_engine()
+    """
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+    if _is_memory_sqlite(url):
+        # In-memory SQLite uses a single static connection; there is no pool to size
+        return options
+    options.update(
+        poolclass=instrumented_pool_class(name),
+        pool_size=int(os.getenv('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+    )
+    return options
+
+
+_last_write = 0.0  # wall-clock time of this worker's last committed write
+_shared_write_clock = None
+READ_AFTER_WRITE_SECONDS = float(os.getenv('REPLICA_READ_AFTER_WRITE', 2))
+
+
+def set_shared_write_clock(clock):
+    """
+    Also keep reads on the primary after other workers' writes.
+
+    Args:
+        clock: callable returning the wall-clock time of the last write in any worker
+               (or 0.0 when unknown); read at most once per request
+    """
+    global _shared_write_clock
+    _shared_write_clock = clock
+
+
+def _recent_write():
+    """True within READ_AFTER_WRITE_SECONDS of a write by this worker or, with a shared clock, any worker."""
+    if time.time() - _last_write <= READ_AFTER_WRITE_SECONDS:
+        return True
+    if _shared_write_clock is None:
+        return False
+    if 'shared_last_write' not in g:
+        g.shared_last_write = _shared_write_clock()
+    return time.time() - g.shared_last_write <= READ_AFTER_WRITE_SECONDS
+
+
+class RoutingSession(Session):
+    """
+    Flask-SQLAlchemy session that sends reads from @read_replica views to the replica bind.
+
+    Writes are detected in get_bind() (flushes and DML statements) and always go to
+    the primary; commit() then opens the read-after-write window.
+    """
+
+    replica_reads = 0
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+            elif has_app_context() and g.get('read_replica'):
+                engine = self._db.engines.get(REPLICA_BIND)
+                if engine is not None and not _recent_write():
+                    RoutingSession.replica_reads += 1
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def commit(self):
+        global _last_write
+        super().commit()
+        if self.info.pop('wrote', False):
+            _last_write = time.time()
+
+    def rollback(self):
+        self.info.pop('wrote', None)
+        super().rollback()
+
+
+def read_replica(view):
+    """Route the view's queries to the read replica (no-op when none is configured)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure_database(app, primary_url):
+    """
+    Apply pool settings, SQLite pragmas and the optional replica bind to the Flask app config.
+    Call before SQLAlchemy(app, session_options={'class_': RoutingSession}).
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(primary_url, 'primary')
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if (make_url(primary_url).get_backend_name() == 'sqlite'
+            or (replica_url and make_url(replica_url).get_backend_name() == 'sqlite')):
+        if os.getenv('SQLITE_TUNING', 'true').lower() in ('1', 'true', 'yes'):
+            install_sqlite_pragmas()
+    if replica_url:
+        if replica_url.startswith('postgres://'):
+            replica_url = replica_url.replace('postgres://', 'postgresql://', 1)
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: {'url': replica_url, **engine_options(replica_url, REPLICA_BIND)}}
+        print(f"[INFO] Read replica configured for read-only endpoints ({make_url(replica_url).get_backend_name()})")
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    if 'pool_size' in options:
+        print(f"[INFO] DB pool: size={options['pool_size']} overflow={options['max_overflow']} "
+              f"timeout={options['pool_timeout']}s recycle={options['pool_recycle']}s pre_ping={options['pool_pre_ping']}")
+
+
+def pool_stats(engines):
+    """
+    Live pool state plus checkout wait metrics per bind.
+
+    Args:
+        engines: db.engines (bind key -> Engine)
+    """
+    stats = {}
+    for key, engine in engines.items():
+        name = key or 'primary'
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow(),
+                         idle=pool.checkedin())
+        if isinstance(pool, InstrumentedQueuePool):
+            entry.update(pool.metrics.snapshot())
+        stats[name] = entry
+    stats['replica_reads'] = RoutingSession.replica_reads
+    return stats
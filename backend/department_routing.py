@@ -0,0 +1,187 @@
+"""
+Location-aware department routing backed by an in-memory spatial index.
+
+Departments (with their issue_types JSON) are loaded once into one KD-tree per
+issue type, so "nearest department that handles this issue type" is a
+logarithmic lookup with no database round trip.
+
+Points are stored as 3D unit vectors on the sphere: the straight-line (chord)
+distance between two such vectors grows monotonically with the great-circle
+distance, so a plain Euclidean KD-tree finds the true nearest department, with
+no distortion near the poles or across the antimeridian.
+
+The index is rebuilt lazily: it is marked stale when a session commits changes
+to the departments table (see watch()), and in any case after DEPARTMENT_ROUTING_TTL
+seconds so writes made by other worker processes are picked up as well.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import event
+
+EARTH_RADIUS_KM = 6371.0088
+
+DepartmentEntry = namedtuple('DepartmentEntry', 'id name latitude longitude issue_types contact_info')
+
+
+def to_unit_vector(lat, lon):
+    """Latitude/longitude in degrees -> (x, y, z) on the unit sphere."""
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_to_km(chord):
+    """Straight-line distance between unit vectors -> great-circle distance in km."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """Static 3D KD-tree over (point, item) pairs with nearest-neighbour search."""
+
+    __slots__ = ('_root', 'size')
+
+    def __init__(self, entries):
+        entries = list(entries)
+        self.size = len(entries)
+        self._root = self._build(entries, 0)
+
+    def _build(self, entries, depth):
+        if not entries:
+            return None
+        axis = depth % 3
+        entries.sort(key=lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        # node: (point, item, axis, left, right)
+        return (entries[middle][0], entries[middle][1], axis,
+                self._build(entries[:middle], depth + 1),
+                self._build(entries[middle + 1:], depth + 1))
+
+    def nearest(self, point):
+        """
+        Closest item to point.
+
+        Returns:
+            tuple: (item, squared euclidean distance), or (None, inf) when empty
+        """
+        best_item, best_distance = None, float('inf')
+        # (node, squared distance from point to the node's region along the split that led here)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or bound >= best_distance:
+                continue
+            node_point, item, axis, left, right = node
+            dx = node_point[0] - point[0]
+            dy = node_point[1] - point[1]
+            dz = node_point[2] - point[2]
+            distance = dx * dx + dy * dy + dz * dz
+            if distance < best_distance:
+                best_item, best_distance = item, distance
+            diff = point[axis] - node_point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Far side is pushed first so the near side is searched (and tightens the bound) first
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        return best_item, best_distance
+
+
+class DepartmentRouter:
+    """Nearest-department lookups over a lazily (re)built per-issue-type KD-tree index."""
+
+    def __init__(self, load, ttl=300):
+        """
+        Args:
+            load: zero-argument callable returning Department rows (needs an app context)
+            ttl: seconds after which the index is rebuilt even without a local change
+        """
+        self._load = load
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._trees = None  # issue_type -> KDTree
+        self._all = None  # KDTree over every located department
+        self._built_at = 0.0
+        self._stale = True
+
+    def invalidate(self):
+        """Rebuild the index on the next lookup."""
+        self._stale = True
+
+    def _index(self):
+        if self._stale or time.monotonic() - self._built_at > self.ttl:
+            with self._lock:
+                if self._stale or time.monotonic() - self._built_at > self.ttl:
+                    self._rebuild()
+        return self._trees, self._all
+
+    def _rebuild(self):
+        # Clear the flag first: a change committed while loading marks it stale again
+        self._stale = False
+        by_type = {}
+        located = []
+        for dept in self._load():
+            if dept.latitude is None or dept.longitude is None:
+                continue
+            try:
+                issue_types = tuple(json.loads(dept.issue_types or '[]'))
+            except (TypeError, ValueError):
+                print(f"[WARN] Department {dept.name!r} has malformed issue_types; routing it for no issue type")
+                issue_types = ()
+            entry = DepartmentEntry(dept.id, dept.name, dept.latitude, dept.longitude,
+                                    issue_types, dept.contact_info)
+            point = to_unit_vector(dept.latitude, dept.longitude)
+            located.append((point, entry))
+            for issue_type in issue_types:
+                by_type.setdefault(issue_type, []).append((point, entry))
+        # Swap in complete indexes; concurrent readers keep using the previous ones
+        self._trees = {issue_type: KDTree(entries) for issue_type, entries in by_type.items()}
+        self._all = KDTree(located)
+        self._built_at = time.monotonic()
+        print(f"[INFO] Department routing index: {len(located)} departments, {len(by_type)} issue types")
+
+    def nearest(self, lat, lon, issue_type=None):
+        """
+        Nearest department that handles issue_type (any department when issue_type is None).
+
+        Returns:
+            tuple: (DepartmentEntry, distance_km), or (None, None) if no department qualifies
+        """
+        trees, all_departments = self._index()
+        tree = all_departments if issue_type is None else trees.get(issue_type)
+        if tree is None or not tree.size:
+            return None, None
+        entry, squared = tree.nearest(to_unit_vector(lat, lon))
+        return entry, chord_to_km(math.sqrt(squared))
+
+    def watch(self, session, model):
+        """
+        Invalidate the index whenever session commits inserts, updates or deletes of model rows.
+
+        Args:
+            session: Session class, sessionmaker or scoped_session to listen on
+            model: the mapped Department class
+        """
+        @event.listens_for(session, 'after_flush')
+        def _note_department_changes(sess, flush_context):
+            if any(isinstance(obj, model) for obj in (*sess.new, *sess.dirty, *sess.deleted)):
+                sess.info['departments_changed'] = True
+
+        @event.listens_for(session, 'after_commit')
+        def _rebuild_after_commit(sess):
+            if sess.info.pop('departments_changed', False):
+                self.invalidate()
+
+        @event.listens_for(session, 'after_rollback')
+        def _forget_rolled_back(sess):
+            sess.info.pop('departments_changed', None)
+
+
+def create_department_router(load):
+    """Build the router from DEPARTMENT_ROUTING_TTL."""
+    return DepartmentRouter(load, ttl=int(os.getenv('DEPARTMENT_ROUTING_TTL', 300)))
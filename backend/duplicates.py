@@ -0,0 +1,242 @@
+"""
+Near-duplicate complaint detection from image embeddings.
+
+Every complaint submitted with a photo and coordinates stores the classifier's
+pooled 576-d feature vector (see IssueClassifier.embed). A new submission counts as
+a duplicate of an open complaint of the same issue type when all of these hold:
+- the photo embeddings are close (cosine similarity >= DUPLICATE_SIMILARITY)
+- the two locations are within DUPLICATE_RADIUS_M metres
+- the existing complaint is at most DUPLICATE_WINDOW_DAYS days old
+
+The vector index is filtered by place and time first. Embeddings are bucketed in
+a lat/lon grid whose cells are one search radius wide, and a query only scores the
+vectors in the cells around the new report, inside the time window. That is a few
+vectors even for a large city. A global ANN graph would instead rank the whole
+corpus and then throw away almost everything on the spatial filter.
+
+The index lives in each worker's memory and catches up from the complaint_embedding
+table (rows with a higher complaint id) before each lookup, so vectors stored by
+other workers are seen too. With sharded storage every shard allocates ids from its
+own range (id_span wide), so the index keeps one catch-up cursor per range.
+Concurrent inserts can commit out of id order, so a row may appear below a cursor
+after it has moved on. Every DUPLICATE_RESCAN_INTERVAL seconds a catch-up re-reads
+the last SYNC_OVERLAP ids of each range for that; the other lookups read only past
+the cursors, and ids already indexed are not loaded again.
+
+Each vector carries the model version that computed it. A hot-swapped model (see
+model_registry.py) has its own embedding space, so a query only scores vectors of
+the same version.
+
+Off by default (DUPLICATE_DETECTION=true enables it): the similarity threshold has to
+be calibrated on the deployed weights first. With an untrained checkpoint, unrelated
+photos of the same spot score above 0.9.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_DIM = 576
+METERS_PER_DEGREE = 111320.0
+
+
+def vector_to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def blob_to_vector(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def image_payload_key(image_data):
+    """Cache key for a base64 / data URL image as sent by the client."""
+    if not isinstance(image_data, str):
+        return None
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',', 1)[-1]
+    return hashlib.blake2b(image_data.encode('ascii', 'ignore'), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Small LRU of recent embeddings by image payload.
+
+    The app classifies a photo (/api/classify-issue) before submitting it, so the
+    submit path can reuse that forward pass instead of running the model again.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlam / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
+class DuplicateIndex:
+    """Embeddings bucketed by grid cell; lookups score only nearby, recent vectors."""
+
+    PRUNE_INTERVAL = 3600  # seconds between sweeps of expired entries
+    SYNC_OVERLAP = 100  # ids below the cursor re-read by a rescan: concurrent inserts can commit out of order
+
+    def __init__(self, radius_m=50, window_days=14, threshold=0.92, id_span=None, rescan_interval=30):
+        """
+        Args:
+            id_span: width of each shard's complaint id range (None: one range)
+            rescan_interval: seconds between catch-ups that also re-read the SYNC_OVERLAP
+                ids below each cursor
+        """
+        self.radius_m = radius_m
+        self.window_seconds = window_days * 86400
+        self.threshold = threshold
+        self.cell_deg = radius_m / METERS_PER_DEGREE
+        # (lat_cell, lon_cell) -> list of (complaint_id, created_ts, lat, lon, issue_type, vector, model_version)
+        self._cells = {}
+        self._lock = threading.Lock()
+        self.id_span = id_span
+        self.last_ids = {}  # id range start -> highest complaint id seen in it
+        self.size = 0
+        self._ids = set()
+        self._pruned_at = time.monotonic()
+        self.rescan_interval = rescan_interval
+        self._rescanned_at = time.monotonic()
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def add(self, complaint_id, lat, lon, created_ts, issue_type, vector, model_version=None):
+        with self._lock:
+            if complaint_id in self._ids:
+                return
+            self._ids.add(complaint_id)
+            self._cells.setdefault(self._cell(lat, lon), []).append(
+                (complaint_id, created_ts, lat, lon, issue_type, vector, model_version))
+            base = self.range_start(complaint_id)
+            self.last_ids[base] = max(self.last_ids.get(base, base), complaint_id)
+            self.size += 1
+
+    def range_start(self, complaint_id):
+        return complaint_id - complaint_id % self.id_span if self.id_span else 0
+
+    def sync_from(self, range_start=0, rescan=False):
+        """Complaint id above which to read from storage when catching up, in one id range."""
+        overlap = self.SYNC_OVERLAP if rescan else 0
+        return max(self.last_ids.get(range_start, range_start) - overlap, range_start)
+
+    def rescan_due(self):
+        """Whether this catch-up should re-read below the cursors (true once per rescan_interval)."""
+        if time.monotonic() - self._rescanned_at < self.rescan_interval:
+            return False
+        self._rescanned_at = time.monotonic()
+        return True
+
+    def contains(self, complaint_id):
+        with self._lock:
+            return complaint_id in self._ids
+
+    def query(self, lat, lon, vector, issue_type=None, now=None, model_version=None):
+        """
+        Likely duplicates of a new report.
+
+        Args:
+            lat, lon: location of the new report
+            vector: its L2-normalized embedding
+            issue_type: only match complaints of this type (None = any)
+            now: reference time (epoch seconds), defaults to time.time()
+            model_version: the model that computed vector; only its vectors are compared
+
+        Returns:
+            list of (complaint_id, similarity, distance_m), most similar first
+        """
+        now = now or time.time()
+        oldest = now - self.window_seconds
+        # Cells are cell_deg wide in both axes; in longitude that is fewer metres away from the equator
+        lat_span = 1
+        lon_span = math.ceil(1 / max(math.cos(math.radians(lat)), 0.01))
+        lat_cell, lon_cell = self._cell(lat, lon)
+        candidates = []
+        with self._lock:
+            for i in range(lat_cell - lat_span, lat_cell + lat_span + 1):
+                for j in range(lon_cell - lon_span, lon_cell + lon_span + 1):
+                    for entry in self._cells.get((i, j), ()):
+                        if entry[1] >= oldest and entry[6] == model_version \
+                                and (issue_type is None or entry[4] == issue_type):
+                            candidates.append(entry)
+        if not candidates:
+            return []
+        similarities = np.stack([entry[5] for entry in candidates]) @ np.asarray(vector, dtype=np.float32)
+        matches = []
+        for entry, similarity in zip(candidates, similarities.tolist()):
+            if similarity < self.threshold:
+                continue
+            distance = haversine_m(lat, lon, entry[2], entry[3])
+            if distance <= self.radius_m:
+                matches.append((entry[0], similarity, distance))
+        matches.sort(key=lambda match: -match[1])
+        return matches
+
+    def prune(self, now=None):
+        """Drop entries older than the time window."""
+        self._pruned_at = time.monotonic()
+        oldest = (now or time.time()) - self.window_seconds
+        with self._lock:
+            for key in list(self._cells):
+                kept = []
+                for entry in self._cells[key]:
+                    if entry[1] >= oldest:
+                        kept.append(entry)
+                    else:
+                        self._ids.discard(entry[0])
+                if kept:
+                    self._cells[key] = kept
+                else:
+                    del self._cells[key]
+            self.size = sum(len(entries) for entries in self._cells.values())
+
+    def prune_if_due(self):
+        if time.monotonic() - self._pruned_at > self.PRUNE_INTERVAL:
+            self.prune()
+
+
+def create_duplicate_index(id_span=None):
+    """Build the index from DUPLICATE_* environment variables (None when disabled)."""
+    if os.getenv('DUPLICATE_DETECTION', 'false').lower() not in ('1', 'true', 'yes'):
+        print("[INFO] Duplicate complaint detection: disabled")
+        return None
+    index = DuplicateIndex(
+        radius_m=float(os.getenv('DUPLICATE_RADIUS_M', 50)),
+        window_days=float(os.getenv('DUPLICATE_WINDOW_DAYS', 14)),
+        threshold=float(os.getenv('DUPLICATE_SIMILARITY', 0.92)),
+        id_span=id_span,
+        rescan_interval=float(os.getenv('DUPLICATE_RESCAN_INTERVAL', 30)),
+    )
+    print(f"[INFO] Duplicate complaint detection: radius={index.radius_m:g}m "
+          f"window={index.window_seconds / 86400:g}d similarity>={index.threshold}")
+    return index
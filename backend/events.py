@@ -0,0 +1,317 @@
+"""
+Complaint change events and the Server-Sent Events fan-out behind /api/events.
+
+Writers publish an event after their commit. Events are appended to a broker log
+that every worker process on the box can read; the local stand-in is a SQLite file
+(instance/events.db). Each worker runs one pump thread that tails the log and hands
+matching events to its own SSE subscribers, so a write handled by one worker reaches
+clients connected to any other worker.
+
+Event ids are the log's monotonically increasing row ids, so a reconnecting client's
+Last-Event-ID header is enough to replay what it missed. When the requested id has
+already been pruned from the log, the client receives a 'resync' event and should
+refetch the resource once.
+
+A bulk status update over many rows publishes one 'complaints.bulk_updated' event
+(count, ids or filter, new values) instead of one event per complaint. It goes to
+every subscriber whatever its filter, and clients refetch what they display.
+
+A client that reads slower than events arrive fills its subscription queue. The pump
+then marks the subscription as overflowed instead of silently dropping events. Once
+the queued events are sent, the stream ends with an id-only frame carrying the last
+delivered event id, so the browser's EventSource reconnects after the retry delay and
+replays the rest from the log through Last-Event-ID.
+
+Each open stream holds a worker thread for as long as the client stays connected, so
+a process serves at most EVENTS_MAX_STREAMS of them (0: no limit). Beyond that,
+/api/events answers 503 with a Retry-After header instead of starving the
+request threads.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from serialization import encode_json
+
+HEARTBEAT_SECONDS = 15
+STREAM_RETRY_AFTER = 5  # seconds a client refused for the stream cap should wait
+BULK_UPDATE_EVENT = 'complaints.bulk_updated'
+
+
+class SQLiteEventBroker:
+    """Append-only event log in a local SQLite file, shared by all worker processes."""
+
+    def __init__(self, path, retention_seconds=86400):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, type TEXT NOT NULL, "
+            "complaint_id INTEGER, department TEXT, latitude REAL, longitude REAL, data BLOB NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, event_type, data):
+        cur = self._conn().execute(
+            "INSERT INTO events (created, type, complaint_id, department, latitude, longitude, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), event_type, data.get('id'), data.get('department'),
+             data.get('latitude'), data.get('longitude'), encode_json(data))
+        )
+        return cur.lastrowid
+
+    def read_since(self, last_id, limit=1000):
+        rows = self._conn().execute(
+            "SELECT id, type, complaint_id, department, latitude, longitude, data "
+            "FROM events WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, limit)
+        ).fetchall()
+        return [Event(*row) for row in rows]
+
+    def last_id(self):
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+    def first_id(self):
+        return self._conn().execute("SELECT MIN(id) FROM events").fetchone()[0]
+
+    def prune(self):
+        self._conn().execute("DELETE FROM events WHERE created < ?", (time.time() - self.retention_seconds,))
+
+
+class Event:
+    __slots__ = ('id', 'type', 'complaint_id', 'department', 'latitude', 'longitude', 'data')
+
+    def __init__(self, id, type, complaint_id, department, latitude, longitude, data):
+        self.id = id
+        self.type = type
+        self.complaint_id = complaint_id
+        self.department = department
+        self.latitude = latitude
+        self.longitude = longitude
+        self.data = data
+
+    def to_sse(self):
+        data = self.data.decode('utf-8') if isinstance(self.data, bytes) else self.data
+        return f"id: {self.id}\nevent: {self.type}\ndata: {data}\n\n"
+
+
+class EventFilter:
+    """Subscription filter: complaint id, department and/or bounding box. Empty matches all."""
+
+    def __init__(self, complaint_id=None, department=None, bbox=None):
+        self.complaint_id = complaint_id
+        self.department = department
+        self.bbox = bbox  # (min_lat, min_lon, max_lat, max_lon)
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Build a filter from query parameters.
+
+        Args:
+            args: request.args with optional complaint_id, department and
+                  bbox=min_lat,min_lon,max_lat,max_lon
+
+        Raises:
+            ValueError: if complaint_id or bbox is malformed
+        """
+        complaint_id = args.get('complaint_id')
+        bbox = args.get('bbox')
+        if bbox:
+            parts = [float(p) for p in bbox.split(',')]
+            if len(parts) != 4:
+                raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+            bbox = tuple(parts)
+        return cls(
+            complaint_id=int(complaint_id) if complaint_id else None,
+            department=args.get('department') or None,
+            bbox=bbox or None
+        )
+
+    def matches(self, event):
+        if event.type == BULK_UPDATE_EVENT:
+            return True  # affected rows are not known per event
+        if self.complaint_id is not None and event.complaint_id != self.complaint_id:
+            return False
+        if self.department is not None and event.department != self.department:
+            return False
+        if self.bbox is not None:
+            if event.latitude is None or event.longitude is None:
+                return False
+            min_lat, min_lon, max_lat, max_lon = self.bbox
+            if not (min_lat <= event.latitude <= max_lat and min_lon <= event.longitude <= max_lon):
+                return False
+        return True
+
+
+class Subscription:
+    def __init__(self, event_filter):
+        self.filter = event_filter
+        self.queue = queue.Queue(maxsize=1000)
+        self.last_sent_id = 0
+        self.overflowed = False
+
+
+class EventBus:
+    """Per-process fan-out from the broker log to SSE subscribers."""
+
+    PRUNE_EVERY = 600  # pump iterations between retention sweeps
+
+    def __init__(self, broker, poll_interval=0.5, max_streams=0):
+        """
+        Args:
+            max_streams: concurrent SSE streams this process serves (0: no limit)
+        """
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self.max_streams = max_streams
+        self.open_streams = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._cursor = None
+
+    def publish(self, event_type, data):
+        """Append an event for every worker's subscribers. Call after the commit."""
+        try:
+            return self.broker.append(event_type, data)
+        except Exception as e:
+            # Events are best effort: never fail the write that produced them
+            print(f"[WARN] Failed to publish {event_type} event: {e}")
+            return None
+
+    def open_stream(self):
+        """Take a stream slot before serving a client. False when the process is at max_streams."""
+        with self._lock:
+            if self.max_streams and self.open_streams >= self.max_streams:
+                return False
+            self.open_streams += 1
+            return True
+
+    def close_stream(self):
+        """Release a slot taken by open_stream (when the response is closed)."""
+        with self._lock:
+            self.open_streams -= 1
+
+    def subscribe(self, event_filter):
+        sub = Subscription(event_filter)
+        with self._lock:
+            self._subscribers.add(sub)
+            if self._thread is None:
+                self._cursor = self.broker.last_id()
+                self._thread = threading.Thread(target=self._pump, name='event-pump', daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _pump(self):
+        iterations = 0
+        while True:
+            events = []
+            try:
+                events = self.broker.read_since(self._cursor)
+                if events:
+                    self._cursor = events[-1].id
+                    with self._lock:
+                        subscribers = list(self._subscribers)
+                    for event in events:
+                        for sub in subscribers:
+                            if not sub.overflowed and sub.filter.matches(event):
+                                try:
+                                    sub.queue.put_nowait(event)
+                                except queue.Full:
+                                    # Slow client: its stream ends and it replays from Last-Event-ID
+                                    sub.overflowed = True
+                iterations += 1
+                if iterations % self.PRUNE_EVERY == 0:
+                    self.broker.prune()
+            except Exception as e:
+                print(f"[WARN] Event pump error: {e}")
+            if not events:
+                time.sleep(self.poll_interval)
+
+    def stream(self, event_filter, last_event_id=None):
+        """
+        Generator yielding SSE frames for one client.
+
+        Registers the subscriber before replaying from last_event_id so that nothing
+        published in between is lost; duplicates are dropped by event id. Ends when the
+        subscription overflows, so the client reconnects and replays.
+        """
+        sub = self.subscribe(event_filter)
+        if last_event_id is None:
+            # Live only: skip anything the pump has not caught up with yet
+            sub.last_sent_id = self.broker.last_id()
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id is not None:
+                first_id = self.broker.first_id()
+                if first_id is not None and last_event_id < first_id - 1:
+                    yield "event: resync\ndata: {}\n\n"
+                replay_from = last_event_id
+                while True:
+                    events = self.broker.read_since(replay_from)
+                    if not events:
+                        break
+                    for event in events:
+                        if event_filter.matches(event):
+                            sub.last_sent_id = event.id
+                            yield event.to_sse()
+                    replay_from = events[-1].id
+            while True:
+                if sub.overflowed and sub.queue.empty():
+                    # Queued events are delivered; the reconnect replays the rest from the log
+                    print(f"[WARN] SSE subscriber fell behind; closing its stream at event {sub.last_sent_id}")
+                    yield f"id: {sub.last_sent_id}\n\n"
+                    return
+                try:
+                    event = sub.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event.id <= sub.last_sent_id:
+                    continue
+                sub.last_sent_id = event.id
+                yield event.to_sse()
+        finally:
+            self.unsubscribe(sub)
+
+
+def complaint_event_data(complaint):
+    """Compact event payload for an IssueReport row."""
+    return {
+        'id': complaint.id,
+        'issue_type': complaint.issue_type or 'other',
+        'status': complaint.status or 'pending',
+        'priority': complaint.priority or 'normal',
+        'department': complaint.department,
+        'latitude': complaint.latitude,
+        'longitude': complaint.longitude,
+        'updated_at': complaint.updated_at
+    }
+
+
+def create_event_bus():
+    """Build the event bus from EVENTS_BROKER_PATH / EVENTS_* environment variables."""
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'events.db')
+    path = os.getenv('EVENTS_BROKER_PATH', default_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    broker = SQLiteEventBroker(path, retention_seconds=int(os.getenv('EVENTS_RETENTION', 86400)))
+    max_streams = int(os.getenv('EVENTS_MAX_STREAMS', 200))
+    print(f"[INFO] Event broker: sqlite at {path}, at most {max_streams or 'unlimited'} SSE streams per worker")
+    return EventBus(broker, poll_interval=float(os.getenv('EVENTS_POLL_INTERVAL', 0.5)), max_streams=max_streams)
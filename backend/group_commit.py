@@ -0,0 +1,113 @@
+"""
+Group commit for complaint inserts.
+
+SQLite allows one writer at a time and every commit pays a WAL sync, so concurrent
+submit requests that each commit on their own queue up behind the write lock.
+With GROUP_COMMIT enabled, requests hand their row to a single writer thread and
+wait on a future. The writer takes everything that queued while it was busy and
+commits the whole group in one transaction. Throughput then scales with the
+batch size instead of the commit rate, and writers never contend for the lock.
+
+If a group fails (e.g. one bad row), its rows are retried one by one so a single
+failure is reported only to its own request.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class GroupCommitWriter:
+    """Single background writer that commits queued rows in groups."""
+
+    def __init__(self, app, write_rows, on_commit=None, max_batch=128, max_delay=0.0):
+        """
+        Args:
+            app: Flask app (the writer thread runs each group in an app context)
+            write_rows: callable(rows) -> ids; inserts and commits in one transaction,
+                        rolling back and raising on failure
+            on_commit: optional callable(rows, ids) run after each successful group
+            max_batch: most rows per transaction
+            max_delay: seconds to wait for more rows after the first (0 = take what is queued)
+        """
+        self.app = app
+        self.write_rows = write_rows
+        self.on_commit = on_commit
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.groups = 0
+        self.rows = 0
+
+    def submit(self, row):
+        """
+        Queue a row for insertion.
+
+        Returns:
+            concurrent.futures.Future resolving to the new row id
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self.app.app_context():
+                self._commit(batch)
+
+    def _commit(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            ids = self.write_rows(rows)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            print(f"[WARN] Group commit of {len(batch)} rows failed ({e}); retrying individually")
+            for item in batch:
+                self._commit([item])
+            return
+        self.groups += 1
+        self.rows += len(rows)
+        for (_, future), row_id in zip(batch, ids):
+            future.set_result(row_id)
+        if self.on_commit:
+            try:
+                self.on_commit(rows, ids)
+            except Exception as e:
+                print(f"[WARN] Group commit callback failed: {e}")
+
+    def stats(self):
+        return {'groups': self.groups, 'rows': self.rows,
+                'avg_group_size': round(self.rows / self.groups, 2) if self.groups else 0}
+
+
+def create_group_commit_writer(app, write_rows, on_commit=None):
+    """Build the writer from GROUP_COMMIT / GROUP_COMMIT_* environment variables (None when disabled)."""
+    if os.getenv('GROUP_COMMIT', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    max_batch = int(os.getenv('GROUP_COMMIT_MAX_BATCH', 128))
+    max_delay = float(os.getenv('GROUP_COMMIT_MAX_DELAY_MS', 0)) / 1000
+    print(f"[INFO] Group commit enabled for complaint inserts (max_batch={max_batch}, max_delay={max_delay * 1000:g}ms)")
+    return GroupCommitWriter(app, write_rows, on_commit, max_batch=max_batch, max_delay=max_delay)
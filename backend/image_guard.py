@@ -0,0 +1,221 @@
+"""
+Pre-decode validation of uploaded images.
+
+A photo arrives as base64 (optionally a data URL) and used to be decoded whatever
+its size, so one huge or decompression-bomb image (a few KB of PNG that inflates to
+gigabytes of pixels) could block a worker and take its memory. Every upload now goes
+through these stages, and the expensive one only runs once the cheap ones pass:
+
+1. Request body: Flask's MAX_CONTENT_LENGTH (MAX_REQUEST_BYTES) caps the request body.
+2. Payload: the decoded size is estimated from the base64 length and must be at most
+   IMAGE_MAX_BYTES. This check runs before b64decode.
+3. Header: Image.open only parses the header, so width x height are known before any
+   pixel is decoded.
+4. Pixel budget: an image of at most IMAGE_PIXEL_BUDGET pixels is decoded as usual.
+   A larger JPEG is not rejected. It is decoded at 1/2, 1/4 or 1/8 scale by the DCT
+   (Image.draft), so only the reduced image is ever allocated, and the classifier
+   resizes to 224x224 anyway. Other formats have no reduced decode, so above the
+   budget they are rejected (413).
+
+OpenCV stays the fallback for formats Pillow cannot identify. It has no header-only
+read, so that path is bounded by OpenCV's own OPENCV_IO_MAX_IMAGE_PIXELS limit. cv2
+reads it from the process environment only when it is imported, so this module sets
+it to IMAGE_PIXEL_BUDGET (unless it is set already) before importing cv2. An image
+Pillow identifies but fails to decode (e.g. a truncated JPEG) is rejected rather than
+handed to OpenCV, which would decode it at full size.
+
+Outcome counters and decode times: GET /api/image-stats. Adversarial test corpus:
+benchmarks/image_guard_corpus.py.
+"""
+
+import base64
+import binascii
+import io
+import math
+import os
+import sys
+import threading
+import time
+import warnings
+
+DEFAULT_PIXEL_BUDGET = 16_000_000
+
+# OpenCV reads its decode limit once, when cv2 is imported
+if 'cv2' in sys.modules:
+    print("[WARN] cv2 was imported before image_guard; OPENCV_IO_MAX_IMAGE_PIXELS may not bound the OpenCV fallback")
+os.environ.setdefault('OPENCV_IO_MAX_IMAGE_PIXELS', os.getenv('IMAGE_PIXEL_BUDGET', str(DEFAULT_PIXEL_BUDGET)))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image, UnidentifiedImageError  # noqa: E402
+
+# The pixel budget below is stricter than Pillow's bomb warning threshold
+warnings.filterwarnings('ignore', category=Image.DecompressionBombWarning)
+
+JPEG_FORMATS = ('JPEG', 'MPO')
+JPEG_SCALES = (2, 4, 8)
+DECODE_BUCKETS_MS = (5, 10, 50, 100, 500, 1000)
+
+
+class ImageRejected(ValueError):
+    """An upload refused before or during decoding; str(e) is safe to show the client."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ImageGuardMetrics:
+    """Outcome counters and decode-time histogram (thread-safe)."""
+
+    OUTCOMES = ('decoded', 'reduced', 'fallback', 'rejected_bytes', 'rejected_pixels', 'invalid')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.total_decode = 0.0
+        self.max_decode = 0.0
+        self.max_pixels = 0
+        self.buckets = [0] * (len(DECODE_BUCKETS_MS) + 1)
+
+    def record(self, outcome, seconds=None, pixels=0):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.max_pixels = max(self.max_pixels, pixels)
+            if seconds is not None:
+                millis = seconds * 1000
+                index = next((i for i, bound in enumerate(DECODE_BUCKETS_MS) if millis <= bound),
+                             len(DECODE_BUCKETS_MS))
+                self.buckets[index] += 1
+                self.total_decode += seconds
+                self.max_decode = max(self.max_decode, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            decodes = self.counts['decoded'] + self.counts['reduced'] + self.counts['fallback']
+            bounds = list(DECODE_BUCKETS_MS) + [None]
+            return {
+                **self.counts,
+                'max_header_pixels': self.max_pixels,
+                'avg_decode_ms': round(self.total_decode * 1000 / max(decodes, 1), 3),
+                'max_decode_ms': round(self.max_decode * 1000, 3),
+                'decode_histogram': [[bound, count] for bound, count in zip(bounds, self.buckets)]
+            }
+
+
+class ImageGuard:
+    """Validates and decodes uploaded images within a byte and pixel budget."""
+
+    def __init__(self, max_bytes=10 * 1024 * 1024, pixel_budget=DEFAULT_PIXEL_BUDGET):
+        """
+        Args:
+            max_bytes: largest accepted image file (decoded from base64)
+            pixel_budget: most pixels ever decoded into memory for one image
+        """
+        self.max_bytes = max_bytes
+        self.pixel_budget = pixel_budget
+        self.metrics = ImageGuardMetrics()
+
+    def payload_bytes(self, image_data):
+        """
+        Base64-decode an upload after checking its estimated size.
+
+        Returns:
+            tuple: (image bytes, mime type from the data URL or None)
+        """
+        if not isinstance(image_data, str):
+            raise ImageRejected('Invalid image format. Expected a base64-encoded image string.')
+        mime_hint = None
+        if image_data.startswith('data:image'):
+            # data URL format: data:image/<type>;base64,<payload>
+            header, _, payload = image_data.partition(',')
+            if ';' in header and ':' in header:
+                mime_hint = header.split(':', 1)[1].split(';', 1)[0]  # image/webp, image/jpeg, etc.
+            image_data = payload
+        if len(image_data) * 3 // 4 > self.max_bytes:
+            self.metrics.record('rejected_bytes')
+            raise ImageRejected(f'Image is too large (limit {self.max_bytes // (1024 * 1024)} MB).', status=413)
+        try:
+            return base64.b64decode(image_data), mime_hint
+        except (binascii.Error, ValueError):
+            self.metrics.record('invalid')
+            raise ImageRejected('Invalid image format. Expected a base64-encoded image string.')
+
+    def reduced_scale(self, image):
+        """Smallest JPEG DCT scale that brings the image within the pixel budget, or None."""
+        if image.format not in JPEG_FORMATS:
+            return None
+        width, height = image.size
+        return next((scale for scale in JPEG_SCALES
+                     if math.ceil(width / scale) * math.ceil(height / scale) <= self.pixel_budget), None)
+
+    def decode(self, image_data):
+        """
+        Decode a base64 / data URL image into an RGB PIL Image within the budgets.
+
+        Raises:
+            ImageRejected: with a client-facing message and HTTP status
+        """
+        image_bytes, mime_hint = self.payload_bytes(image_data)
+        start = time.perf_counter()
+        try:
+            image = Image.open(io.BytesIO(image_bytes))  # parses the header only
+        except Image.DecompressionBombError:
+            self.metrics.record('rejected_pixels')
+            raise ImageRejected('Image dimensions are too large.', status=413)
+        except UnidentifiedImageError:
+            return self._decode_fallback(image_bytes, mime_hint, start)
+        except Exception:
+            self.metrics.record('invalid')
+            raise ImageRejected(self._decode_error(mime_hint))
+
+        width, height = image.size
+        pixels = width * height
+        outcome = 'decoded'
+        if pixels > self.pixel_budget:
+            scale = self.reduced_scale(image)
+            if scale is None:
+                self.metrics.record('rejected_pixels', pixels=pixels)
+                raise ImageRejected(f'Image is {width}x{height}; at most {self.pixel_budget // 1_000_000} '
+                                    f'megapixels are accepted for this format.', status=413)
+            image.draft('RGB', (math.ceil(width / scale), math.ceil(height / scale)))
+            outcome = 'reduced'
+        try:
+            image = image.convert('RGB')
+        except Exception:
+            self.metrics.record('invalid', pixels=pixels)
+            raise ImageRejected(self._decode_error(mime_hint))
+        self.metrics.record(outcome, time.perf_counter() - start, pixels)
+        return image
+
+    def _decode_fallback(self, image_bytes, mime_hint, start):
+        # OpenCV decode for formats Pillow does not know (bounded by OPENCV_IO_MAX_IMAGE_PIXELS, set above)
+        try:
+            cv_img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)  # BGR
+        except cv2.error:
+            cv_img = None
+        if cv_img is None:
+            self.metrics.record('invalid')
+            raise ImageRejected(self._decode_error(mime_hint))
+        pixels = cv_img.shape[0] * cv_img.shape[1]
+        if pixels > self.pixel_budget:
+            self.metrics.record('rejected_pixels', pixels=pixels)
+            raise ImageRejected('Image dimensions are too large.', status=413)
+        self.metrics.record('fallback', time.perf_counter() - start, pixels)
+        return Image.fromarray(cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB))
+
+    @staticmethod
+    def _decode_error(mime_hint):
+        msg = 'Failed to decode image bytes.'
+        if mime_hint:
+            msg += f' mime={mime_hint}'
+        return msg
+
+
+def create_image_guard():
+    """ImageGuard configured from IMAGE_MAX_BYTES and IMAGE_PIXEL_BUDGET."""
+    guard = ImageGuard(max_bytes=int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024)),
+                       pixel_budget=int(os.getenv('IMAGE_PIXEL_BUDGET', DEFAULT_PIXEL_BUDGET)))
+    print(f"[INFO] Image uploads: up to {guard.max_bytes / 1e6:.1f} MB, "
+          f"{guard.pixel_budget / 1e6:g} MP decoded (larger JPEGs are decoded at reduced scale)")
+    return guard
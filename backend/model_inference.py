@@ -6,11 +6,20 @@ This module loads the trained model and performs inference on uploaded images.
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.overrides import TorchFunctionMode
 from torchvision.models import mobilenet_v3_small
 from torchvision import transforms
 from PIL import Image
 import numpy as np
+import itertools
 import os
+from contextlib import contextmanager
+
+# Optional: safetensors weight files (see convert_weights.py)
+try:
+    from safetensors.torch import load_file as load_safetensors
+except ImportError:
+    load_safetensors = None
 
 # Model classes (6 categories)
 CLASS_NAMES = [
@@ -61,20 +70,63 @@ class CBAM(nn.Module):
         spatial_out = self.spatial_gate(cat_tensor)
         return x_out * spatial_out
 
+class FusedCBAM(CBAM):
+    """
+    Inference version of CBAM: same parameters and state_dict keys (so trained weights
+    load strictly), same math, but a fixed 4D (N, C, H, W) contract and fewer ops.
+    - Channel gate: the two 1x1 convs on the pooled (N, C, 1, 1) map run as two
+      matmuls on an (N, C) vector
+    - Spatial gate: the padded 7x7 conv over the tiny (2, H, W) max/mean map is a fixed
+      linear map, folded once per map size into a (2*H*W, H*W) matrix (one matmul
+      instead of a conv call that costs more than the rest of the block)
+    The features block always yields 4D maps, so there are no per-call rank checks.
+    """
+    def __init__(self, c_in, ratio=16, kernel_size=7):
+        super().__init__(c_in, ratio, kernel_size)
+        self._spatial_matrices = {}  # (H, W, dtype, device) -> folded spatial conv
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        self._spatial_matrices.clear()
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def _spatial_matrix(self, height, width, dtype, device):
+        key = (height, width, dtype, device)
+        matrix = self._spatial_matrices.get(key)
+        if matrix is None:
+            conv = self.spatial_gate[0]
+            size = height * width
+            # Response of the conv to each one-hot input pixel = one row of the matrix
+            basis = torch.eye(2 * size, dtype=dtype, device=device).view(2 * size, 2, height, width)
+            with torch.no_grad():
+                matrix = F.conv2d(basis, conv.weight.to(dtype), padding=conv.padding).view(2 * size, size)
+            self._spatial_matrices[key] = matrix
+        return matrix
+
+    def forward(self, x):
+        n, c, h, w = x.shape
+        squeeze = self.channel_gate[1].weight.view(-1, c)  # (C/r, C)
+        excite = self.channel_gate[3].weight.view(c, -1)   # (C, C/r)
+        gate = torch.sigmoid(F.linear(F.relu(F.linear(x.mean((2, 3)), squeeze)), excite))
+        x = x * gate.view(n, c, 1, 1)
+        flat = x.view(n, c, h * w)
+        pooled = torch.cat([flat.amax(1), flat.mean(1)], dim=1)  # (N, 2*H*W), same order as the conv input
+        spatial = torch.sigmoid(pooled @ self._spatial_matrix(h, w, x.dtype, x.device))
+        return x * spatial.view(n, 1, h, w)
+
+
 # ------------------- MobileNetV3 with CBAM -------------------
 class UrbanMobileNet(nn.Module):
     """
-    Architecture for inference. We bypass CBAM to avoid runtime shape errors, while
-    preserving the classifier head structure to match trained weights.
-    - mobilenet_v3_small(features) -> (Identity in place of CBAM) -> classifier with avgpool+flatten
+    Architecture for inference, preserving the classifier head structure to match trained weights.
+    - mobilenet_v3_small(features) -> FusedCBAM (cbam=True) or Identity -> classifier with avgpool+flatten
       -> Linear(576->1024)->Hardswish->Dropout->Linear(1024->num_classes)
     """
-    def __init__(self, num_classes):
+    def __init__(self, num_classes, cbam=False):
         super().__init__()
         base_model = mobilenet_v3_small(weights=None)  # custom loading
         self.features = base_model.features
-        # Bypass CBAM for robust inference
-        self.cbam = nn.Identity()
+        # Trained CBAM block, or a bypass for checkpoints without its weights
+        self.cbam = FusedCBAM(576) if cbam else nn.Identity()
         self.classifier = nn.Sequential(
             nn.AdaptiveAvgPool2d(1),
             nn.Flatten(),
@@ -90,13 +142,108 @@ class UrbanMobileNet(nn.Module):
         x = self.classifier(x)
         return x
 
+    def forward_with_embedding(self, x):
+        """
+        Logits plus the pooled 576-d feature vector the classifier head starts from.
+        Same computation as forward(), split after avgpool+flatten.
+        """
+        x = self.cbam(self.features(x))
+        embedding = self.classifier[1](self.classifier[0](x))
+        return self.classifier[2:](embedding), embedding
+
+
+def read_state_dict(path, device):
+    """
+    Read a weights file.
+    
+    .safetensors files and zip-format .pth/.pt files are memory-mapped: tensors are
+    paged in from the file when first touched and the pages are shared by every
+    worker process through the OS page cache. Legacy pickles are read whole.
+    
+    Returns:
+        tuple: (state_dict, memory_mapped)
+    """
+    if path.endswith('.safetensors'):
+        if load_safetensors is None:
+            raise RuntimeError("safetensors is not installed (pip install safetensors)")
+        return load_safetensors(path, device=str(device)), True
+    try:
+        return torch.load(path, map_location=device, mmap=True, weights_only=True), True
+    except Exception:
+        return torch.load(path, map_location=device), False
+
+
+# torch.nn.init functions used by the layers' reset_parameters() and torchvision's weight init
+_INIT_FUNCTIONS = ('uniform_', 'normal_', 'trunc_normal_', 'constant_', 'ones_', 'zeros_',
+                   'kaiming_uniform_', 'kaiming_normal_', 'xavier_uniform_', 'xavier_normal_')
+# ... and the in-place tensor ops they and some reset_parameters() call directly
+_INIT_OPS = frozenset([getattr(nn.init, name) for name in _INIT_FUNCTIONS]
+                      + [torch.Tensor.uniform_, torch.Tensor.normal_, torch.Tensor.zero_, torch.Tensor.fill_])
+
+
+class _SkipInit(TorchFunctionMode):
+    """Turns the init functions and ops into no-ops. Torch function modes are per thread."""
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        if func in _INIT_OPS:
+            return args[0] if args else kwargs['tensor']
+        return func(*args, **kwargs)
+
+
+@contextmanager
+def skip_weight_init():
+    """
+    Build modules on the meta device without running their weight init, in this thread only.
+    
+    Parameters have shapes but no storage, and the random-init kernels, about three
+    quarters of UrbanMobileNet's construction time, do not run; load_state_dict(assign=True)
+    then supplies every tensor. The meta device alone is not enough: its init ops run as
+    Python reference implementations and end up as slow as real init for a model this
+    size. Both the device and the mode are thread-local, so modules that other threads
+    build meanwhile (e.g. while ModelManager reloads in the background) are unaffected.
+    """
+    with torch.device('meta'), _SkipInit():
+        yield
+
+
+def build_model_in_place(num_classes, state_dict, cbam=False):
+    """
+    Build UrbanMobileNet directly on the checkpoint tensors, skipping allocation and random initialization.
+    
+    The checkpoint tensors are assigned as the model's parameters and buffers
+    (load_state_dict(assign=True)), so memory-mapped weights stay mapped instead of
+    being copied into freshly allocated ones.
+    
+    Returns:
+        UrbanMobileNet, or None if the checkpoint does not cover every model tensor
+        (the caller then falls back to a regular non-strict load)
+    """
+    with skip_weight_init():
+        model = UrbanMobileNet(num_classes=num_classes, cbam=cbam)
+    expected = model.state_dict()
+    if any(key not in state_dict or state_dict[key].shape != tensor.shape for key, tensor in expected.items()):
+        return None
+    weights = {}
+    for key, tensor in expected.items():
+        value = state_dict[key]
+        # Half-precision checkpoints are upcast (this copies those tensors out of the mapping)
+        weights[key] = value.float() if value.is_floating_point() and value.dtype != tensor.dtype else value
+    try:
+        model.load_state_dict(weights, strict=True, assign=True)
+    except TypeError:
+        return None  # torch < 2.1 has no assign=True
+    if any(tensor.is_meta for tensor in itertools.chain(model.parameters(), model.buffers())):
+        return None  # a tensor outside the state dict was left without storage
+    return model
+
 
 class IssueClassifier:
     """
     Classifier for civic issues using MobileNetV3 with CBAM.
     """
     
-    def __init__(self, model_path='backend/best_model.pth', num_classes=6):
+    def __init__(self, model_path='backend/best_model.pth', num_classes=6, cbam='auto'):
         """
         Initialize the classifier.
         
@@ -105,11 +252,15 @@ class IssueClassifier:
             num_classes: Number of classes the model was trained with (5 or 6)
                          Default is 6. If your model was trained with 5 classes
                          (without illegal_parking), set this to 5.
+            cbam: 'auto' runs the trained CBAM block when the checkpoint has its weights;
+                  True / 'true' requires them, False / 'false' bypasses CBAM
         """
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.model = None
         self.model_path = model_path
         self.num_classes = num_classes
+        self.cbam = cbam if isinstance(cbam, bool) or cbam == 'auto' else str(cbam).lower() in ('1', 'true', 'yes')
+        self.use_cbam = False
         
         # Use appropriate class names based on num_classes
         if num_classes == 6:
@@ -142,26 +293,39 @@ class IssueClassifier:
         try:
             # Always load as state_dict and build the training-matched architecture
             try:
-                state_dict = torch.load(self.model_path, map_location=self.device)
+                state_dict, memory_mapped = read_state_dict(self.model_path, self.device)
             except Exception as e:
                 raise RuntimeError(f"Failed to read model file: {e}")
 
+            has_cbam = any(key.startswith('cbam.') for key in state_dict)
+            if self.cbam is True and not has_cbam:
+                raise RuntimeError("CBAM is enabled but the checkpoint has no cbam.* weights")
+            self.use_cbam = has_cbam if self.cbam == 'auto' else self.cbam
+            architecture = 'UrbanMobileNet' + (' + CBAM' if self.use_cbam else '')
+
             load_errors = []
 
-            # 1) Try UrbanMobileNet (training-time architecture) with strict load
-            try:
-                model_candidate = UrbanMobileNet(num_classes=self.num_classes)
-                # First attempt: allow non-strict to ignore CBAM-specific keys from training
-                missing_keys, unexpected_keys = model_candidate.load_state_dict(state_dict, strict=False)
-                self.model = model_candidate
-                print(f"[OK] Weights loaded into UrbanMobileNet (non-strict) from {self.model_path}")
-                if missing_keys or unexpected_keys:
-                    print(f"[WARN] Load mismatches: missing={len(missing_keys)} unexpected={len(unexpected_keys)}")
-            except Exception as e_urban_strict:
-                load_errors.append(f"UrbanMobileNet load: {e_urban_strict}")
-                self.model = None
-
-            # 2) If still not loaded, raise detailed error
+            # 1) Fast path: build the model straight on the checkpoint tensors (strict)
+            self.model = build_model_in_place(self.num_classes, state_dict, cbam=self.use_cbam)
+            if self.model is not None:
+                print(f"[OK] Weights loaded into {architecture} in place "
+                      f"({'memory-mapped' if memory_mapped else 'in memory'}) from {self.model_path}")
+
+            # 2) Otherwise UrbanMobileNet (training-time architecture) with a non-strict load
+            if self.model is None:
+                try:
+                    model_candidate = UrbanMobileNet(num_classes=self.num_classes, cbam=self.use_cbam)
+                    # Allow non-strict to ignore CBAM-specific keys when CBAM is bypassed
+                    missing_keys, unexpected_keys = model_candidate.load_state_dict(state_dict, strict=False)
+                    self.model = model_candidate
+                    print(f"[OK] Weights loaded into {architecture} (non-strict) from {self.model_path}")
+                    if missing_keys or unexpected_keys:
+                        print(f"[WARN] Load mismatches: missing={len(missing_keys)} unexpected={len(unexpected_keys)}")
+                except Exception as e_urban_strict:
+                    load_errors.append(f"UrbanMobileNet load: {e_urban_strict}")
+                    self.model = None
+
+            # 3) If still not loaded, raise detailed error
             if self.model is None:
                 raise RuntimeError(" | ".join(load_errors))
             
@@ -176,41 +340,48 @@ class IssueClassifier:
                 f"Please ensure the model file is valid and matches the architecture."
             )
     
-    def classify_issue(self, image_data):
+    def _to_tensor(self, image_data):
+        """Preprocess a numpy array or PIL Image into a (1, 3, 224, 224) tensor on the model device."""
+        # Convert numpy array to PIL Image if needed
+        if isinstance(image_data, np.ndarray):
+            # Handle different numpy array formats
+            if image_data.dtype != np.uint8:
+                image_data = (image_data * 255).astype(np.uint8)
+            image = Image.fromarray(image_data).convert('RGB')
+        elif isinstance(image_data, Image.Image):
+            image = image_data.convert('RGB')
+        else:
+            raise ValueError(f"Unsupported image type: {type(image_data)}")
+        
+        # Preprocess image
+        image_tensor = self.transform(image).unsqueeze(0)  # Add batch dimension
+        return image_tensor.to(self.device)
+    
+    def classify_issue(self, image_data, return_embedding=False):
         """
         Classify an image into one of the issue categories.
         
         Args:
             image_data: numpy array or PIL Image of the uploaded image
+            return_embedding: also return the image embedding (see embed()),
+                              computed in the same forward pass
             
         Returns:
             dict: {
                 'issue_type': str,  # Category name
-                'confidence': float  # Confidence score (0-1)
+                'confidence': float,  # Confidence score (0-1)
+                'embedding': np.ndarray  # only with return_embedding=True
             }
         """
         if self.model is None:
             raise RuntimeError("Model not loaded. Please ensure best_model.pth exists in backend directory.")
         
         try:
-            # Convert numpy array to PIL Image if needed
-            if isinstance(image_data, np.ndarray):
-                # Handle different numpy array formats
-                if image_data.dtype != np.uint8:
-                    image_data = (image_data * 255).astype(np.uint8)
-                image = Image.fromarray(image_data).convert('RGB')
-            elif isinstance(image_data, Image.Image):
-                image = image_data.convert('RGB')
-            else:
-                raise ValueError(f"Unsupported image type: {type(image_data)}")
-            
-            # Preprocess image
-            image_tensor = self.transform(image).unsqueeze(0)  # Add batch dimension
-            image_tensor = image_tensor.to(self.device)
+            image_tensor = self._to_tensor(image_data)
             
             # Run inference
             with torch.no_grad():
-                outputs = self.model(image_tensor)
+                outputs, embedding = self.model.forward_with_embedding(image_tensor)
                 probs = F.softmax(outputs, dim=1)
                 confidence, pred_idx = torch.max(probs, dim=1)
             
@@ -219,12 +390,37 @@ class IssueClassifier:
             predicted_type = self.class_names[predicted_idx]
             confidence_score = confidence.item()
             
-            return {
+            result = {
                 'issue_type': predicted_type,
                 'confidence': confidence_score
             }
+            if return_embedding:
+                result['embedding'] = self._normalize(embedding)
+            return result
             
         except Exception as e:
             print(f"Error during classification: {e}")
             raise RuntimeError(f"Classification failed: {e}")
-
+    
+    def embed(self, image_data):
+        """
+        Image embedding: the pooled 576-d feature vector before the classifier head.
+        
+        Args:
+            image_data: numpy array or PIL Image
+            
+        Returns:
+            np.ndarray: float32 vector of shape (576,), L2-normalized (dot product = cosine similarity)
+        """
+        if self.model is None:
+            raise RuntimeError("Model not loaded. Please ensure best_model.pth exists in backend directory.")
+        
+        with torch.no_grad():
+            _, embedding = self.model.forward_with_embedding(self._to_tensor(image_data))
+        return self._normalize(embedding)
+    
+    @staticmethod
+    def _normalize(embedding):
+        vector = embedding[0].float().cpu().numpy()
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).astype(np.float32)
@@ -0,0 +1,293 @@
+"""
+Versioned model registry and zero-downtime hot-swap of the classifier.
+
+Registry layout (MODEL_REGISTRY_DIR, default model/registry):
+
+    registry.json      {"current": "v2", "versions": {"v2": {"file": "v2.pth", "sha256": ..., ...}}}
+    v1.pth, v2.pth     weight files, never modified once added
+
+Weights are registered and activated with the CLI (the manifest is replaced
+atomically, so readers never see a partial file):
+
+    python model_registry.py add ../model/best_urban_mobilenet.pth --version v2 --activate
+    python model_registry.py activate v1
+    python model_registry.py list
+
+Each worker holds its active model as a single (version, classifier) tuple.
+A new version is loaded, checksum-verified and warmed up in a background thread,
+then swapped in with one assignment. Requests read the tuple once, so requests
+already in flight finish on the model they started with. A swap is triggered by
+the admin endpoint (POST /api/admin/model/reload) or by the watcher thread, which
+polls registry.json and follows its "current" version. Activating a version in the
+manifest is therefore enough to roll it out to every worker.
+
+Without a registry the app serves MODEL_PATH as before, versioned by its checksum.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+MANIFEST = 'registry.json'
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Weight files plus a JSON manifest of versions, checksums and the current version."""
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def read(self):
+        if not self.exists():
+            return {'current': None, 'versions': {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def add(self, weights_path, version=None, activate=False, notes=''):
+        """
+        Copy a weights file into the registry.
+
+        Args:
+            weights_path: .pth / .pt / .safetensors file
+            version: version name (default: v<N+1>)
+            activate: also make it the current version
+            notes: free text stored with the version
+
+        Returns:
+            str: the version name
+        """
+        manifest = self.read()
+        version = version or f"v{len(manifest['versions']) + 1}"
+        if version in manifest['versions']:
+            raise ValueError(f"Version {version} already exists")
+        filename = version + os.path.splitext(weights_path)[1]
+        os.makedirs(self.root, exist_ok=True)
+        shutil.copyfile(weights_path, os.path.join(self.root, filename))
+        manifest['versions'][version] = {
+            'file': filename,
+            'sha256': file_checksum(os.path.join(self.root, filename)),
+            'source': os.path.basename(weights_path),
+            'added_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'notes': notes,
+        }
+        if activate or manifest['current'] is None:
+            manifest['current'] = version
+        self._write(manifest)
+        return version
+
+    def activate(self, version):
+        manifest = self.read()
+        if version not in manifest['versions']:
+            raise ValueError(f"Unknown model version: {version}")
+        manifest['current'] = version
+        self._write(manifest)
+
+    def resolve(self, version=None):
+        """
+        Path of a version's weights after verifying its checksum.
+
+        Returns:
+            tuple: (version, path)
+        """
+        manifest = self.read()
+        version = version or manifest['current']
+        entry = manifest['versions'].get(version)
+        if entry is None:
+            raise ValueError(f"Unknown model version: {version}")
+        path = os.path.join(self.root, entry['file'])
+        checksum = file_checksum(path)
+        if checksum != entry['sha256']:
+            raise ValueError(f"Checksum mismatch for {version}: expected {entry['sha256'][:12]}, got {checksum[:12]}")
+        return version, path
+
+
+class ModelManager:
+    """Holds the active (version, classifier) and swaps in new versions loaded in the background."""
+
+    def __init__(self, load_classifier, registry=None, fallback_path=None):
+        """
+        Args:
+            load_classifier: callable(path) -> IssueClassifier
+            registry: ModelRegistry, used once its manifest exists
+            fallback_path: weights file served while there is no registry manifest
+        """
+        self.load_classifier = load_classifier
+        self.registry = registry
+        self.fallback_path = fallback_path
+        self.current = None  # (version, classifier); replaced as a whole, never mutated
+        self._load_lock = threading.Lock()
+        self.state = {'status': 'idle', 'target': None, 'error': None, 'swapped_at': None, 'swaps': 0}
+
+    @property
+    def version(self):
+        return self.current[0] if self.current else None
+
+    def _has_registry(self):
+        return self.registry is not None and self.registry.exists()
+
+    def _resolve(self, version=None):
+        if self._has_registry():
+            return self.registry.resolve(version)
+        if version is not None:
+            raise ValueError("No model registry configured; only the MODEL_PATH weights are available")
+        return f"{os.path.basename(self.fallback_path)}@{file_checksum(self.fallback_path)[:12]}", self.fallback_path
+
+    def load_initial(self):
+        """Load the current version synchronously (startup)."""
+        version, path = self._resolve()
+        self.current = (version, self._build(path))
+        self.state['swapped_at'] = datetime.utcnow().isoformat(timespec='seconds')
+        print(f"[OK] Serving model version {version}")
+
+    def _build(self, path):
+        classifier = self.load_classifier(path)
+        # Warm-up: the first forward pass allocates buffers and picks kernels
+        classifier.classify_issue(np.full((224, 224, 3), 127, dtype=np.uint8), return_embedding=True)
+        return classifier
+
+    def reload(self, version=None, wait=False):
+        """
+        Load a version (default: the registry's current one) in the background and swap it in.
+
+        Returns:
+            bool: False if a load is already running
+        """
+        if not self._load_lock.acquire(blocking=False):
+            return False
+        thread = threading.Thread(target=self._reload, args=(version,), name='model-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _reload(self, version):
+        try:
+            self.state.update(status='loading', target=version, error=None)
+            start = time.perf_counter()
+            version, path = self._resolve(version)
+            self.state['target'] = version
+            if version == self.version:
+                self.state['status'] = 'idle'
+                return
+            classifier = self._build(path)
+            previous = self.version
+            self.current = (version, classifier)
+            self.state.update(status='idle', swapped_at=datetime.utcnow().isoformat(timespec='seconds'),
+                              swaps=self.state['swaps'] + 1)
+            print(f"[OK] Model swapped {previous} -> {version} (loaded and warmed in {time.perf_counter() - start:.1f}s)")
+        except Exception as e:
+            self.state.update(status='failed', error=str(e))
+            print(f"[WARN] Model reload failed, still serving {self.version}: {e}")
+        finally:
+            self._load_lock.release()
+
+    def watch(self, interval):
+        """Poll the registry manifest and follow its current version (no-op without a registry)."""
+        if self.registry is None or interval <= 0:
+            return
+
+        def manifest_mtime():
+            return os.path.getmtime(self.registry.manifest_path) if self.registry.exists() else None
+
+        def run():
+            # Only manifest changes count: a version loaded via the admin endpoint without
+            # activate=true stays until the registry's current version changes
+            last_mtime = manifest_mtime()
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = manifest_mtime()
+                    if mtime is None or mtime == last_mtime:
+                        continue
+                    last_mtime = mtime
+                    current = self.registry.read()['current']
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] Could not read model registry: {e}")
+                    continue
+                # A failed version is not retried until the manifest changes again
+                if current and current != self.version and not self.reload(current, wait=True):
+                    last_mtime = None  # another load is running; look again next time
+
+        threading.Thread(target=run, name='model-registry-watch', daemon=True).start()
+        print(f"[INFO] Watching model registry {self.registry.manifest_path} every {interval:g}s")
+
+    def status(self):
+        status = dict(self.state)
+        status['version'] = self.version
+        if self._has_registry():
+            manifest = self.registry.read()
+            status['registry_current'] = manifest['current']
+            status['versions'] = manifest['versions']
+        return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registry', default=os.getenv('MODEL_REGISTRY_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'registry'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='register a weights file')
+    add.add_argument('weights')
+    add.add_argument('--version')
+    add.add_argument('--activate', action='store_true')
+    add.add_argument('--notes', default='')
+    activate = commands.add_parser('activate', help='make a version current (workers follow within the watch interval)')
+    activate.add_argument('version')
+    commands.add_parser('list', help='show versions')
+    commands.add_parser('verify', help='check every file against its checksum')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.command == 'add':
+        version = registry.add(args.weights, version=args.version, activate=args.activate, notes=args.notes)
+        print(f"[OK] Added {version}" + (" (current)" if registry.read()['current'] == version else ''))
+    elif args.command == 'activate':
+        registry.activate(args.version)
+        print(f"[OK] Current version is now {args.version}")
+    elif args.command == 'list':
+        manifest = registry.read()
+        for version, entry in manifest['versions'].items():
+            marker = '*' if version == manifest['current'] else ' '
+            print(f"{marker} {version:12s} {entry['sha256'][:12]}  {entry['added_at']}  {entry['source']}  {entry['notes']}")
+    elif args.command == 'verify':
+        failed = 0
+        for version in registry.read()['versions']:
+            try:
+                registry.resolve(version)
+                print(f"[OK] {version}")
+            except (OSError, ValueError) as e:
+                failed += 1
+                print(f"[ERROR] {version}: {e}")
+        raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Per-request SQL instrumentation: statement counts, database time, slow-query log
+and query budgets.
+
+SQLAlchemy's before/after_cursor_execute events time every statement on the app's
+engines (primary and read replica). Statements are counted against the current
+request, whether they come from Model.query calls, lazy loads while JSON is built
+or helpers. Responses to admin requests (X-Admin-Token) and header-profiled requests
+(X-Profile) report the totals; other clients never see them:
+
+    X-DB-Queries: 3
+    Server-Timing: db;dur=4.2;desc="3 queries"
+
+Per-endpoint totals (requests, queries, database time, budget overruns) and the most
+recent slow queries are included in GET /api/db-stats (admin only).
+
+Slow-query log: a statement taking SLOW_QUERY_MS or longer is logged with its bound
+parameters and its plan. The plan is EXPLAIN QUERY PLAN on SQLite and EXPLAIN on
+PostgreSQL, run for SELECTs only. The entry is printed and appended as a JSON line to
+SLOW_QUERY_LOG if that is set. The parameters hold user data (addresses, descriptions,
+user ids), so they stay in the server log: the copy kept in memory for /api/db-stats
+has the statement and plan only.
+
+Off by default; QUERY_MONITOR=true installs the hooks.
+
+Statements run by shard scatter-gather threads count against the request that started
+them (ShardRouter.scatter runs them in a copy of its context). Statements executed with
+the query_monitor_skip execution option are not counted; search uses it for its
+once-per-process index probe.
+
+Query budgets: a view declares the statements it should need with @query_budget(n),
+and QUERY_BUDGETS="endpoint=n,..." overrides that per endpoint. A scatter-gather repeats
+its statements on every shard, so it is charged for one shard's share. A request over budget
+is logged with its statements grouped by text, so an N+1 pattern shows up as one
+statement repeated N times. It also raises a QueryBudgetWarning, which
+tests/test_query_budgets.py turns into a failure for every budgeted endpoint.
+"""
+
+import json
+import os
+import threading
+import time
+import warnings
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+EXPLAIN_PREFIX = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+# Execution option for one-off internal statements (e.g. schema probes) that no request should be charged for
+SKIP_OPTION = 'query_monitor_skip'
+MAX_PARAMS_CHARS = 500
+
+
+class QueryBudgetWarning(UserWarning):
+    """An endpoint issued more SQL statements than its query budget."""
+
+
+def query_budget(limit):
+    """Declare how many SQL statements a view should issue per request (place right under @app.route)."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def parse_budgets(value):
+    """'endpoint=n,endpoint=n' -> {endpoint: n}"""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        endpoint, _, limit = item.partition('=')
+        budgets[endpoint.strip()] = int(limit)
+    return budgets
+
+
+class QueryMonitor:
+    """Engine event hooks plus request hooks that account SQL statements per request and endpoint."""
+
+    def __init__(self, slow_ms=200, slow_log=None, budgets=None, keep_slow=50, show_headers=None):
+        """
+        Args:
+            slow_ms: statements at least this slow go to the slow-query log
+            slow_log: optional JSON-lines file for slow queries
+            budgets: {endpoint: max statements}, overriding @query_budget
+            keep_slow: slow queries kept in memory for /api/db-stats
+            show_headers: callable() -> bool, whether the current response gets the
+                X-DB-Queries / Server-Timing headers (default: never)
+        """
+        self.slow_seconds = slow_ms / 1000
+        self.slow_log = slow_log
+        self.budgets = budgets or {}
+        self.recent_slow = deque(maxlen=keep_slow)
+        self.show_headers = show_headers or (lambda: False)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app, engines):
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_monitor_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_monitor_start
+        stats = g.get('query_stats') if has_request_context() else None
+        if stats is not None and not context.execution_options.get(SKIP_OPTION):
+            # Shard scatter threads share the request's counters
+            with self._stats_lock:
+                stats['count'] += 1
+                stats['seconds'] += elapsed
+                stats['statements'][statement] += 1
+                shard = context.execution_options.get('shard')
+                if shard is not None:
+                    stats['shards'][shard] += 1
+        if elapsed >= self.slow_seconds:
+            self._log_slow(conn, statement, parameters, executemany, elapsed)
+
+    def _explain(self, conn, statement, parameters):
+        prefix = EXPLAIN_PREFIX.get(conn.dialect.name)
+        if prefix is None or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+        # On the raw DBAPI connection, so the EXPLAIN is neither counted nor re-logged
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        except Exception as e:
+            return [f'unavailable: {e}']
+        finally:
+            cursor.close()
+
+    def _log_slow(self, conn, statement, parameters, executemany, elapsed):
+        entry = {
+            'at': datetime.utcnow().isoformat(timespec='seconds'),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'ms': round(elapsed * 1000, 3),
+            'statement': statement,
+            'parameters': repr(parameters)[:MAX_PARAMS_CHARS],
+            'plan': None if executemany else self._explain(conn, statement, parameters),
+        }
+        self.recent_slow.append({key: value for key, value in entry.items() if key != 'parameters'})
+        plan = ' | '.join(entry['plan'] or [])
+        print(f"[WARN] Slow query {entry['ms']:.1f} ms ({entry['endpoint']}): {' '.join(statement.split())[:300]} "
+              f"params={entry['parameters'][:200]}" + (f" plan: {plan}" if plan else ''))
+        if self.slow_log:
+            try:
+                with open(self.slow_log, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+            except OSError as e:
+                print(f"[WARN] Could not write slow-query log: {e}")
+
+    def budget_for(self, endpoint):
+        if endpoint in self.budgets:
+            return self.budgets[endpoint]
+        view = current_app.view_functions.get(endpoint)
+        return getattr(view, 'query_budget', None)
+
+    def _before_request(self):
+        g.query_stats = {'count': 0, 'seconds': 0.0, 'statements': Counter(), 'shards': Counter()}
+
+    def _after_request(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        count, millis = stats['count'], stats['seconds'] * 1000
+        if self.show_headers():
+            response.headers['X-DB-Queries'] = str(count)
+            response.headers.add('Server-Timing', f'db;dur={millis:.1f};desc="{count} queries"')
+
+        endpoint = request.endpoint or 'unmatched'
+        budget = self.budget_for(endpoint)
+        # A scatter-gather runs the same statements on every shard; the budget counts one shard's share
+        scattered = stats['shards']
+        charged = count - sum(scattered.values()) + max(scattered.values(), default=0)
+        over = budget is not None and charged > budget
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, {'requests': 0, 'queries': 0, 'max_queries': 0,
+                                                           'db_ms': 0.0, 'over_budget': 0})
+            totals['requests'] += 1
+            totals['queries'] += count
+            totals['max_queries'] = max(totals['max_queries'], count)
+            totals['db_ms'] += millis
+            totals['over_budget'] += over
+        if over:
+            repeated = '; '.join(f"{times}x {' '.join(statement.split())[:120]}"
+                                 for statement, times in stats['statements'].most_common(3))
+            message = (f"{request.method} {request.path} ({endpoint}) issued {count} SQL statements "
+                       f"({charged} counting one shard of each scatter), budget {budget}")
+            print(f"[WARN] {message}. Most frequent: {repeated}")
+            warnings.warn(message, QueryBudgetWarning, stacklevel=2)
+        return response
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {
+                name: {
+                    'requests': t['requests'],
+                    'avg_queries': round(t['queries'] / t['requests'], 2),
+                    'max_queries': t['max_queries'],
+                    'avg_db_ms': round(t['db_ms'] / t['requests'], 3),
+                    'budget': self.budget_for(name),
+                    'over_budget': t['over_budget'],
+                } for name, t in self._endpoints.items()
+            }
+        return {'endpoints': endpoints, 'slow_queries': list(self.recent_slow)}
+
+
+def create_query_monitor(show_headers=None):
+    """Build the monitor from QUERY_MONITOR / SLOW_QUERY_* / QUERY_BUDGETS (None when disabled)."""
+    if os.getenv('QUERY_MONITOR', 'false').lower() not in ('1', 'true', 'yes'):
+        return None
+    monitor = QueryMonitor(slow_ms=float(os.getenv('SLOW_QUERY_MS', 200)),
+                           slow_log=os.getenv('SLOW_QUERY_LOG') or None,
+                           budgets=parse_budgets(os.getenv('QUERY_BUDGETS')),
+                           show_headers=show_headers)
+    print(f"[INFO] Query monitor enabled: slow >= {monitor.slow_seconds * 1000:g}ms"
+          + (f" -> {monitor.slow_log}" if monitor.slow_log else ''))
+    return monitor
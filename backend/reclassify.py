@@ -0,0 +1,255 @@
+"""
+Offline bulk re-classification of the uploads archive.
+
+Re-scores every image in backend/uploads and in the cold image directory of
+archived complaints (ARCHIVE_IMAGE_DIR, see archive.py) with the current model
+weights. The predictions are written in bulk to the image_prediction table, one row
+per image, keyed by image path as the app stores it (uploads/<file> or
+archive/<file>) and tagged with the weights' checksum. Images whose stored complaint
+issue_type disagrees with the new prediction are listed in an optional CSV report.
+Complaints are looked up in issue_report and archived_issue_report, and with
+SHARD_CONFIG set in every shard's database; the predictions stay on the main
+database. A photo archived since its last run gets a new archive/ row and its old
+uploads/ row is dropped.
+
+Pipeline:
+- A torch DataLoader with one decode worker per core opens and preprocesses images.
+- UrbanMobileNet runs on large batches in the main process, with every core for
+  intra-op parallelism.
+- Predictions are upserted and committed every --commit-every images. Committed
+  rows are the checkpoint: a rerun with the same weights skips images that already
+  have a prediction, so an interrupted job resumes where it stopped.
+
+Usage:
+    python reclassify.py [--model ../model/best_urban_mobilenet.pth] [--uploads uploads]
+                         [--archive archive_images] [--batch-size 64] [--workers N] [--report mismatches.csv] [--restart]
+"""
+
+import argparse
+import csv
+import os
+import time
+from datetime import datetime
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from sqlalchemy import (BigInteger, Column, DateTime, Float, MetaData, String, Table, create_engine, delete,
+                        inspect, select, text)
+from torch.utils.data import DataLoader, Dataset
+
+from model_inference import IssueClassifier
+from model_registry import file_checksum
+from sharding import load_shard_config
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+COMPLAINT_TABLES = ('issue_report', 'archived_issue_report')
+UPLOADS_PREFIX, ARCHIVE_PREFIX = 'uploads/', 'archive/'
+
+metadata = MetaData()
+image_prediction = Table(
+    'image_prediction', metadata,
+    Column('image_path', String(500), primary_key=True),
+    Column('complaint_id', BigInteger, index=True),
+    Column('stored_issue_type', String(100)),
+    Column('predicted_issue_type', String(100)),
+    Column('confidence', Float),
+    Column('model_checksum', String(64), index=True),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+
+def database_url():
+    """Same database as app.py: DATABASE_URL, else the local SQLite file."""
+    url = os.getenv('DATABASE_URL')
+    if url:
+        return url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url
+    return f"sqlite:///{os.path.join(BACKEND_DIR, 'instance', 'civic_issues.db')}"
+
+
+def shard_database_urls():
+    """Databases of the complaint shards besides the main one (SHARD_CONFIG, see sharding.py)."""
+    if not os.getenv('SHARD_CONFIG'):
+        return []
+    _, urls, _ = load_shard_config(os.getenv('SHARD_CONFIG'))
+    return list(urls.values())
+
+
+def image_names(directory):
+    """Sorted image file names in a directory (none if it does not exist)."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class UploadsDataset(Dataset):
+    """Decodes and preprocesses one image per item (runs in the DataLoader workers)."""
+
+    def __init__(self, directories, relative_paths, transform):
+        """
+        Args:
+            directories: {path prefix ('uploads/', 'archive/'): directory holding those files}
+            relative_paths: image paths as stored by the app
+        """
+        self.directories = directories
+        self.paths = relative_paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        prefix, _, name = self.paths[index].partition('/')
+        try:
+            with Image.open(os.path.join(self.directories[prefix + '/'], name)) as image:
+                return self.transform(image.convert('RGB')), index, True
+        except Exception:
+            # Unreadable file: keep the batch shape, report it as failed
+            return torch.zeros(3, 224, 224), index, False
+
+
+def upsert_predictions(conn, rows):
+    """Insert-or-replace prediction rows in one statement (SQLite and PostgreSQL)."""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(image_prediction)
+    statement = statement.on_conflict_do_update(
+        index_elements=['image_path'],
+        set_={name: statement.excluded[name] for name in
+              ('complaint_id', 'stored_issue_type', 'predicted_issue_type', 'confidence', 'model_checksum',
+               'created_at')}
+    )
+    conn.execute(statement, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join(os.path.dirname(BACKEND_DIR), 'model', 'best_urban_mobilenet.pth'))
+    parser.add_argument('--num-classes', type=int, default=6)
+    parser.add_argument('--cbam', default=os.getenv('MODEL_CBAM', 'auto'), help='auto, true or false')
+    parser.add_argument('--uploads', default=os.path.join(BACKEND_DIR, 'uploads'))
+    parser.add_argument('--archive', default=os.getenv('ARCHIVE_IMAGE_DIR') or os.path.join(BACKEND_DIR, 'archive_images'),
+                        help="archived complaints' photos (ARCHIVE_IMAGE_DIR)")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='decode processes (default: all cores)')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help='torch intra-op threads')
+    parser.add_argument('--commit-every', type=int, default=2048, help='images per bulk write / checkpoint')
+    parser.add_argument('--report', help='CSV of complaints whose issue_type disagrees with the new prediction')
+    parser.add_argument('--restart', action='store_true', help='ignore predictions already stored for these weights')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    classifier = IssueClassifier(model_path=args.model, num_classes=args.num_classes, cbam=args.cbam)
+    model = classifier.model
+    class_names = classifier.class_names
+    checksum = file_checksum(args.model)
+    print(f"[INFO] Model weights sha256={checksum[:12]} on {classifier.device}")
+
+    engine = create_engine(database_url())
+    metadata.create_all(engine)
+    # Image file name -> (complaint id, stored issue_type), from the hot and archived
+    # complaints of every shard when sharded
+    complaints = {}
+    for complaints_engine in [engine] + [create_engine(url) for url in shard_database_urls()]:
+        tables = [table for table in COMPLAINT_TABLES if inspect(complaints_engine).has_table(table)]
+        with complaints_engine.connect() as conn:
+            for table in tables:
+                complaints.update(
+                    (os.path.basename(path), (complaint_id, issue_type))
+                    for complaint_id, path, issue_type in conn.execute(text(
+                        f"SELECT id, image_path, issue_type FROM {table} WHERE image_path IS NOT NULL"))
+                )
+    with engine.connect() as conn:
+        done = set() if args.restart else set(conn.scalars(
+            select(image_prediction.c.image_path).where(image_prediction.c.model_checksum == checksum)))
+
+    directories = {UPLOADS_PREFIX: args.uploads, ARCHIVE_PREFIX: args.archive}
+    paths = [prefix + name for prefix, directory in directories.items() for name in image_names(directory)]
+    todo = [path for path in paths if path not in done]
+    print(f"[INFO] {len(paths)} images in {args.uploads} and {args.archive}; {len(paths) - len(todo)} already scored, "
+          f"{len(todo)} to go")
+    if not todo:
+        return
+
+    loader = DataLoader(
+        UploadsDataset(directories, todo, classifier.transform),
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        pin_memory=classifier.device.type == 'cuda',
+        persistent_workers=False,
+        prefetch_factor=4 if args.workers else None,
+    )
+
+    pending = []
+    scored = failed = mismatched = 0
+    report = None
+    if args.report:
+        report_file = open(args.report, 'a' if done else 'w', newline='')
+        report = csv.writer(report_file)
+        if not done:
+            report.writerow(['complaint_id', 'image_path', 'stored_issue_type', 'predicted_issue_type', 'confidence'])
+
+    def flush():
+        # One bulk upsert per chunk; report lines are written only once their rows are committed
+        with engine.begin() as conn:
+            upsert_predictions(conn, pending)
+            # Photos archived since an earlier run: their uploads/ rows name files that moved
+            moved = [UPLOADS_PREFIX + row['image_path'][len(ARCHIVE_PREFIX):] for row in pending
+                     if row['image_path'].startswith(ARCHIVE_PREFIX)]
+            if moved:
+                conn.execute(delete(image_prediction).where(image_prediction.c.image_path.in_(moved)))
+        if report:
+            for row in pending:
+                if row['stored_issue_type'] in class_names and row['stored_issue_type'] != row['predicted_issue_type']:
+                    report.writerow([row['complaint_id'], row['image_path'], row['stored_issue_type'],
+                                     row['predicted_issue_type'], f"{row['confidence']:.4f}"])
+            report_file.flush()
+
+    start = time.perf_counter()
+    last_log = start
+    try:
+        with torch.inference_mode():
+            for batch, indices, ok in loader:
+                probs = F.softmax(model(batch.to(classifier.device, non_blocking=True)), dim=1)
+                confidence, predicted = probs.max(dim=1)
+                now = datetime.utcnow()
+                for index, good, conf, pred in zip(indices.tolist(), ok.tolist(), confidence.tolist(),
+                                                   predicted.tolist()):
+                    if not good:
+                        failed += 1
+                        continue
+                    path = todo[index]
+                    complaint_id, stored = complaints.get(os.path.basename(path), (None, None))
+                    label = class_names[pred]
+                    pending.append({'image_path': path, 'complaint_id': complaint_id, 'stored_issue_type': stored,
+                                    'predicted_issue_type': label, 'confidence': conf,
+                                    'model_checksum': checksum, 'created_at': now})
+                    # Only compare types the model can predict (legacy categories never match)
+                    if stored in class_names and stored != label:
+                        mismatched += 1
+                if len(pending) >= args.commit_every:
+                    flush()
+                    scored += len(pending)
+                    pending = []
+                if time.perf_counter() - last_log > 10:
+                    last_log = time.perf_counter()
+                    processed = scored + len(pending) + failed
+                    print(f"[INFO] {processed}/{len(todo)} images, {processed / (last_log - start):.1f} img/s")
+        if pending:
+            flush()
+            scored += len(pending)
+    finally:
+        if report:
+            report_file.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"[OK] Scored {scored} images in {elapsed:.1f}s ({(scored + failed) / elapsed:.1f} img/s, "
+          f"{args.workers} decode workers, {args.threads} threads); {failed} unreadable; "
+          f"{mismatched} complaints disagree with the new model")
+
+
+if __name__ == '__main__':
+    main()
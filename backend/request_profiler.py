@@ -0,0 +1,169 @@
+"""
+On-demand sampling profiler for individual requests.
+
+A profiled request gets a helper thread that reads the request thread's Python
+stack every PROFILE_INTERVAL_MS milliseconds (sys._current_frames). The request
+thread itself is not instrumented. Sampling is by wall clock, so time spent
+waiting on the database, the geocoder or a lock shows up as well as CPU time.
+
+A request is profiled when either:
+- it carries the header "X-Profile: <PROFILE_TOKEN>", or
+- it is picked at random at rate PROFILE_SAMPLE_RATE (e.g. 0.001).
+
+Each profile is written to PROFILE_DIR in collapsed-stack format, one
+"frame;frame;frame count" line per distinct stack, root first. That is the input
+of flamegraph.pl and speedscope:
+
+    flamegraph.pl profiles/<file>.collapsed > flame.svg
+
+Header-triggered responses carry the file name in an X-Profile-Id header. With
+neither setting configured no hook is registered, so requests pay nothing.
+"""
+
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Profile'
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(code):
+    name = getattr(code, 'co_qualname', code.co_name)  # co_qualname: Python 3.11+
+    return f"{os.path.basename(code.co_filename)}:{name}"
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling; returns the elapsed wall time in seconds."""
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            del frame
+            self.stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+
+
+class RequestProfiler:
+    """Flask hooks that sample selected requests and save their collapsed stacks."""
+
+    def __init__(self, output_dir, token=None, sample_rate=0.0, interval=0.005, max_files=1000):
+        self.output_dir = output_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_files = max_files
+        self.profiled = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _requested(self):
+        supplied = request.headers.get(PROFILE_HEADER)
+        if supplied and self.token and hmac.compare_digest(supplied.encode(), self.token.encode()):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def _before(self):
+        trigger = self._requested()
+        if trigger:
+            g.profile_trigger = trigger
+            g.profile_sampler = StackSampler(threading.get_ident(), self.interval).start()
+
+    def _after(self, response):
+        # Runs before a streamed body is iterated, so streaming views are profiled up to their return
+        sampler = g.pop('profile_sampler', None)
+        if sampler is None:
+            return response
+        elapsed = sampler.stop()
+        try:
+            name = self._save(sampler, elapsed, response.status_code)
+        except OSError as e:
+            print(f"[WARN] Could not save request profile: {e}")
+            return response
+        if g.get('profile_trigger') == 'header':
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    def _teardown(self, exc):
+        # after_request is skipped when the view raised; just stop the sampler
+        sampler = g.pop('profile_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+    def _save(self, sampler, elapsed, status):
+        endpoint = (request.endpoint or 'unknown').replace('.', '_')
+        name = (f"{datetime.utcnow():%Y%m%dT%H%M%S.%f}-{endpoint}-{request.method}-{status}-"
+                f"{elapsed * 1000:.0f}ms.collapsed")
+        path = os.path.join(self.output_dir, name)
+        with open(path, 'w') as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.profiled += 1
+        print(f"[INFO] Profiled {request.method} {request.path}: {elapsed * 1000:.0f}ms, "
+              f"{sampler.samples} samples -> {path}")
+        self._prune()
+        return name
+
+    def _prune(self):
+        files = sorted(name for name in os.listdir(self.output_dir) if name.endswith('.collapsed'))
+        for name in files[:max(len(files) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except OSError:
+                pass
+
+
+def create_request_profiler(default_dir):
+    """Build the profiler from PROFILE_* environment variables (None when disabled)."""
+    token = os.getenv('PROFILE_TOKEN') or None
+    sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    if not token and sample_rate <= 0:
+        return None
+    profiler = RequestProfiler(
+        output_dir=os.getenv('PROFILE_DIR') or default_dir,
+        token=token,
+        sample_rate=sample_rate,
+        interval=float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000,
+        max_files=int(os.getenv('PROFILE_MAX_FILES', 1000)),
+    )
+    print(f"[INFO] Request profiler enabled: header={'on' if token else 'off'} sample_rate={sample_rate:g} "
+          f"interval={profiler.interval * 1000:g}ms -> {profiler.output_dir}")
+    return profiler
@@ -0,0 +1,297 @@
+"""
+Read-through response cache for the hot polling endpoints.
+
+Entries are keyed by request path plus sorted query parameters and hold the encoded
+JSON body and its ETag, so a hit never reaches SQLAlchemy and a matching
+If-None-Match gets a bodyless 304. Compressed variants are cached next to the body.
+
+Invalidation is tag based. Each entry is stored under the current version of its
+tags; invalidate(tag) bumps the version, so every key built on the old version is
+simply never read again (and ages out by TTL / LRU). Because versions are read before
+the payload is built, a reader racing a writer can never store a stale body under the
+new version.
+
+Backends:
+- memory: per-process LRU dict (default with one worker). With several workers,
+  invalidation only reaches the worker that handled the write; other workers serve
+  at most TTL-old data, so a warning is printed when WEB_CONCURRENCY > 1.
+- sqlite: a local SQLite file shared by every worker on the box, so invalidation is
+  seen by all of them immediately (default when WEB_CONCURRENCY > 1).
+- off: pass-through.
+"""
+
+import hashlib
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import Response, request
+
+from serialization import COMPRESS_MIN_SIZE, JSON_MIMETYPE, compress_body, encode_json, negotiate_encoding
+
+
+class InProcessBackend:
+    """
+    Thread-safe LRU dict with per-entry expiry.
+
+    Tag versions come from one counter, so a version value is never reused. That lets
+    a tag be forgotten once every entry built on its old versions has expired (it was
+    last bumped more than the longest entry TTL ago): it reads as version 0 again, which
+    only entries built after that point use. Per-complaint tags therefore do not pile up.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = OrderedDict()  # tag -> (version, monotonic bump time), least recently bumped first
+        self._counter = itertools.count(1)
+        self._max_ttl = 0
+        self._last_bump = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            self._max_ttl = max(self._max_ttl, ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_versions(self, tags):
+        with self._lock:
+            return [self._versions.get(tag, (0,))[0] for tag in tags]
+
+    def bump_versions(self, tags):
+        with self._lock:
+            now = time.monotonic()
+            for tag in tags:
+                self._versions[tag] = (next(self._counter), now)
+                self._versions.move_to_end(tag)
+            # Forget tags whose older entries have all expired
+            while self._versions and next(iter(self._versions.values()))[1] < now - self._max_ttl:
+                self._versions.popitem(last=False)
+            self._last_bump = time.time()
+
+    def last_bump(self):
+        return self._last_bump
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """Cache stored in a local SQLite file, shared by all worker processes."""
+
+    PURGE_EVERY = 256  # sets between expired-row sweeps
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sets = 0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        # One row: wall-clock time of the last bump by any worker
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_clock (id INTEGER PRIMARY KEY CHECK (id = 1), bumped_at REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+        )
+        self._sets += 1
+        if self._sets % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires < ?", (time.time(),))
+
+    def get_versions(self, tags):
+        conn = self._conn()
+        versions = []
+        for tag in tags:
+            row = conn.execute("SELECT version FROM cache_tags WHERE tag = ?", (tag,)).fetchone()
+            versions.append(row[0] if row else 0)
+        return versions
+
+    def bump_versions(self, tags):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO cache_tags (tag, version) VALUES (?, 1) "
+                "ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+                [(tag,) for tag in tags]
+            )
+            conn.execute("INSERT OR REPLACE INTO cache_clock (id, bumped_at) VALUES (1, ?)", (time.time(),))
+
+    def last_bump(self):
+        row = self._conn().execute("SELECT bumped_at FROM cache_clock WHERE id = 1").fetchone()
+        return row[0] if row else 0.0
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache_entries")
+
+
+class NullBackend:
+    """Pass-through backend used when caching is disabled."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_versions(self, tags):
+        return [0] * len(tags)
+
+    def bump_versions(self, tags):
+        pass
+
+    def last_bump(self):
+        return 0.0
+
+    def clear(self):
+        pass
+
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class ResponseCache:
+    """Serve JSON payloads from the cache, building them on a miss."""
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def request_key(self):
+        """Cache key for the current request: path plus sorted query parameters."""
+        args = sorted(request.args.items(multi=True))
+        return f"{request.path}?{urlencode(args)}" if args else request.path
+
+    def serve(self, build, tags, ttl=None):
+        """
+        Return a cached response for the current request, calling build() on a miss.
+
+        Args:
+            build: zero-argument callable returning the JSON payload
+            tags: invalidation tags the payload depends on (e.g. 'complaints')
+            ttl: entry lifetime in seconds (defaults to the cache TTL)
+
+        Returns:
+            flask.Response: 200 with the body, or 304 when If-None-Match matches
+        """
+        ttl = ttl or self.ttl
+        versions = self.backend.get_versions(tags)
+        key = self.request_key() + '#' + ','.join(f"{t}={v}" for t, v in zip(tags, versions))
+
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            body = encode_json(build())
+            entry = {'etag': make_etag(body), 'body': body}
+            self.backend.set(key, entry, ttl)
+            cache_state = 'MISS'
+        else:
+            self.hits += 1
+            cache_state = 'HIT'
+
+        if request.if_none_match.contains_weak(entry['etag']):
+            response = Response(status=304)
+        else:
+            body = entry['body']
+            response = Response(mimetype=JSON_MIMETYPE)
+            encoding = negotiate_encoding(request.accept_encodings) if len(body) >= COMPRESS_MIN_SIZE else None
+            if encoding:
+                variant_key = f"{key}|{encoding}"
+                data = self.backend.get(variant_key)
+                if data is None:
+                    data = compress_body(body, encoding)
+                    self.backend.set(variant_key, data, ttl)
+                response.set_data(data)
+                response.headers['Content-Encoding'] = encoding
+            else:
+                response.set_data(body)
+
+        response.set_etag(entry['etag'], weak=True)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = cache_state
+        return response
+
+    def invalidate(self, *tags):
+        """Drop every entry built on the given tags. Call after the commit."""
+        self.backend.bump_versions(tags)
+
+    def last_write(self):
+        """Wall-clock time of the last invalidation, by any worker sharing the backend (0.0 if none)."""
+        return self.backend.last_bump()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def create_response_cache():
+    """
+    Build the cache from RESPONSE_CACHE / RESPONSE_CACHE_* environment variables.
+
+    Without RESPONSE_CACHE, the default is memory for one worker and sqlite when
+    WEB_CONCURRENCY (gunicorn's worker count) is above 1, so a write in one worker
+    invalidates the others' entries.
+    """
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    kind = (os.getenv('RESPONSE_CACHE') or ('sqlite' if workers > 1 else 'memory')).lower()
+    ttl = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    if kind == 'sqlite':
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'response_cache.db')
+        path = os.getenv('RESPONSE_CACHE_PATH', default_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        backend = SQLiteBackend(path)
+        backend.clear()  # entries may predate a database restore; tag versions are kept
+        print(f"[INFO] Response cache: sqlite at {path} (ttl={ttl}s)")
+    elif kind in ('off', 'none', '0', 'false'):
+        backend = NullBackend()
+        print("[INFO] Response cache: disabled")
+    else:
+        backend = InProcessBackend(max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 2048)))
+        print(f"[INFO] Response cache: in-process (ttl={ttl}s)")
+        if workers > 1:
+            print(f"[WARN] Response cache is per worker with WEB_CONCURRENCY={workers}: a write invalidates "
+                  f"only its own worker's entries, others may serve data up to {ttl}s old (RESPONSE_CACHE=sqlite "
+                  f"shares them)")
+    return ResponseCache(backend, ttl=ttl)
@@ -0,0 +1,309 @@
+"""
+Full-text search over complaints, backed by the database's native index.
+
+- SQLite: an external-content FTS5 table (issue_report_fts) over address, description,
+  issue_type and department, kept in sync by AFTER INSERT/UPDATE/DELETE triggers,
+  ranked with bm25().
+- PostgreSQL: a generated, weighted tsvector column (search_vector) with a GIN index,
+  ranked with ts_rank_cd().
+
+The stored formal_complaint letter is not indexed. New complaints leave it NULL and the
+letter is rendered on demand from the row (app.complaint_letter), so the index covers the
+fields it is rendered from instead: what it says beyond them is template text. Indexes
+built over formal_complaint are replaced on install.
+
+Both are maintained by the database itself, so ORM writes, bulk INSERTs and set-based
+UPDATEs all stay in sync without application hooks. If neither is available (SQLite
+built without FTS5) search falls back to a LIKE scan.
+
+The backend is detected per engine on first use (and recorded by install_search_index),
+so every process and every shard uses its own database's index, whoever created it.
+
+Query terms are reduced to word tokens, all required; the last term is matched as a
+prefix so partially typed street names still hit. On FTS5 the page of rowids is ranked
+first and snippets are only built for that page.
+
+With sharded storage, search_shards() counts and searches every shard in parallel
+and merges the pages.
+"""
+
+import re
+from datetime import datetime
+
+from sqlalchemy import DateTime, text
+
+from sharding import merge_page
+
+TABLE = 'issue_report'
+MAX_TERMS = 10
+COUNT_CAP = 10000  # stop counting matches beyond this; broad terms would scan the whole index
+RANK_LIMIT = 1000  # rank by relevance only below this many matches
+
+# Indexed columns and their weights: address matches rank highest, then description,
+# then the issue type and department the letter names
+INDEXED_COLUMNS = ('address', 'description', 'issue_type', 'department')
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+POSTGRES_WEIGHTS = ('A', 'B', 'D', 'D')
+
+_columns = ', '.join(INDEXED_COLUMNS)
+_new = ', '.join(f'new.{column}' for column in INDEXED_COLUMNS)
+_old = ', '.join(f'old.{column}' for column in INDEXED_COLUMNS)
+
+SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}_fts USING fts5(
+        {_columns},
+        content='{TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts(rowid, {_columns}) VALUES (new.id, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLE}_fts_au AFTER UPDATE OF {_columns} ON {TABLE} BEGIN
+        INSERT INTO {TABLE}_fts({TABLE}_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old});
+        INSERT INTO {TABLE}_fts(rowid, {_columns}) VALUES (new.id, {_new});
+    END""",
+]
+# Index of an earlier version (over formal_complaint), dropped before SQLITE_DDL runs
+SQLITE_DROP = [f"DROP TRIGGER IF EXISTS {TABLE}_fts_{suffix}" for suffix in ('ai', 'ad', 'au')] + [
+    f"DROP TABLE IF EXISTS {TABLE}_fts"]
+
+POSTGRES_DDL = [
+    f"""ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        {' || '.join(f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+                     for column, weight in zip(INDEXED_COLUMNS, POSTGRES_WEIGHTS))}) STORED""",
+    f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_search_vector ON {TABLE} USING GIN (search_vector)",
+]
+POSTGRES_DROP = [f"ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector"]  # drops its index too
+
+RESULT_COLUMNS = ("r.id, r.issue_type, r.status, r.priority, r.department, r.address, r.description, "
+                  "r.latitude, r.longitude, r.created_at")
+SNIPPET_CHARS = 120
+
+_backends = {}  # engine URL -> 'fts5', 'tsvector' or None (LIKE)
+
+
+def install_search_index(engine):
+    """
+    Create the full-text index (idempotent). Call after db.create_all().
+
+    Returns:
+        str or None: 'fts5', 'tsvector', or None when falling back to LIKE
+    """
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == 'sqlite':
+                existing = conn.execute(
+                    text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': f'{TABLE}_fts'}
+                ).scalar()
+                if existing is not None and 'formal_complaint' in existing:
+                    print("[INFO] Rebuilding the full-text index without formal_complaint")
+                    for statement in SQLITE_DROP:
+                        conn.execute(text(statement))
+                    existing = None
+                for statement in SQLITE_DDL:
+                    conn.execute(text(statement))
+                if existing is None:
+                    # Index rows written before the FTS table existed
+                    conn.execute(text(f"INSERT INTO {TABLE}_fts({TABLE}_fts) VALUES ('rebuild')"))
+                backend = 'fts5'
+            elif dialect == 'postgresql':
+                expression = conn.execute(text(
+                    "SELECT generation_expression FROM information_schema.columns "
+                    "WHERE table_name = :table AND column_name = 'search_vector'"), {'table': TABLE}).scalar()
+                if expression is not None and 'formal_complaint' in expression:
+                    print("[INFO] Rebuilding the full-text index without formal_complaint")
+                    for statement in POSTGRES_DROP:
+                        conn.execute(text(statement))
+                for statement in POSTGRES_DDL:
+                    conn.execute(text(statement))
+                backend = 'tsvector'
+            else:
+                backend = None
+    except Exception as e:
+        print(f"[WARN] Full-text index unavailable ({e}); search will use LIKE scans")
+        backend = None
+    _backends[str(engine.url)] = backend
+    print(f"[INFO] Complaint search backend: {backend or 'like'}")
+    return backend
+
+
+def detect_backend(engine):
+    """The full-text index available on an engine's database (cached per engine URL)."""
+    key = str(engine.url)
+    if key not in _backends:
+        backend = None
+        try:
+            # Not charged to the request that happens to probe first (see query_monitor.py)
+            with engine.connect().execution_options(query_monitor_skip=True) as conn:
+                if engine.dialect.name == 'sqlite':
+                    found = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                         {'name': f'{TABLE}_fts'}).first()
+                    backend = 'fts5' if found else None
+                elif engine.dialect.name == 'postgresql':
+                    found = conn.execute(text("SELECT 1 FROM information_schema.columns "
+                                              "WHERE table_name = :table AND column_name = 'search_vector'"),
+                                         {'table': TABLE}).first()
+                    backend = 'tsvector' if found else None
+        except Exception as e:
+            print(f"[WARN] Could not detect the full-text index of {engine.url!r} ({e}); using LIKE scans")
+        _backends[key] = backend
+        print(f"[INFO] Complaint search backend for {engine.url!r}: {backend or 'like'}")
+    return _backends[key]
+
+
+def tokenize_query(query):
+    """Lower-cased word tokens of a user query (at most MAX_TERMS)."""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _filters(department, status, params):
+    clauses = []
+    if department:
+        clauses.append("r.department = :department")
+        params['department'] = department
+    if status:
+        clauses.append("COALESCE(r.status, 'pending') = :status")
+        params['status'] = status
+    return ''.join(f" AND {clause}" for clause in clauses)
+
+
+def make_snippet(text_value, terms):
+    """Short excerpt around the first matching term, with matches wrapped in <mark>. '' if none match."""
+    if not text_value:
+        return ''
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+    match = pattern.search(text_value)
+    if not match:
+        return ''
+    begin = max(match.start() - SNIPPET_CHARS // 3, 0)
+    excerpt = text_value[begin:begin + SNIPPET_CHARS]
+    excerpt = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", excerpt)
+    return ('...' if begin else '') + excerpt + ('...' if begin + SNIPPET_CHARS < len(text_value) else '')
+
+
+def _plan(executor, terms, department, status):
+    """Parameters, FROM/WHERE clause, rank and newest-first expressions for the executor's backend."""
+    params = {'cap': COUNT_CAP}
+    extra = _filters(department, status, params)
+    bind = executor.get_bind() if hasattr(executor, 'get_bind') else executor.engine
+    backend = detect_backend(bind)
+
+    if backend == 'fts5':
+        fts = f"{TABLE}_fts"
+        params['match'] = ' '.join(f'"{term}"' for term in terms) + '*'
+        source = f"{fts} JOIN {TABLE} r ON r.id = {fts}.rowid WHERE {fts} MATCH :match{extra}"
+        # bm25() is lower-is-better, so it is negated to match the other backends
+        rank = f"-bm25({fts}, {', '.join(str(w) for w in SQLITE_WEIGHTS)})"
+        newest = f"{fts}.rowid DESC"
+    elif backend == 'tsvector':
+        params['tsquery'] = ' & '.join(terms) + ':*'
+        source = f"{TABLE} r WHERE r.search_vector @@ to_tsquery('simple', :tsquery){extra}"
+        rank = "ts_rank_cd(r.search_vector, to_tsquery('simple', :tsquery))"
+        newest = "r.id DESC"
+    else:
+        like = []
+        for i, term in enumerate(terms):
+            params[f't{i}'] = f'%{term}%'
+            like.append('(' + ' OR '.join(f"lower(r.{column}) LIKE :t{i}" for column in INDEXED_COLUMNS) + ')')
+        source = f"{TABLE} r WHERE {' AND '.join(like)}{extra}"
+        rank = None
+        newest = "r.id DESC"
+    return params, source, rank, newest
+
+
+def count_matches(executor, query, department=None, status=None):
+    """
+    Returns:
+        tuple: (matches capped at COUNT_CAP, whether the backend can rank them)
+    """
+    terms = tokenize_query(query)
+    if not terms:
+        return 0, False
+    params, source, rank, _ = _plan(executor, terms, department, status)
+    total = executor.execute(text(f"SELECT COUNT(*) FROM (SELECT 1 FROM {source} LIMIT :cap) matches"),
+                             params).scalar()
+    return total, rank is not None
+
+
+def search_complaints(executor, query, limit=20, offset=0, department=None, status=None, total=None, ranked=None):
+    """
+    Ranked, paginated full-text search.
+
+    Matches are ranked by relevance when there are fewer than RANK_LIMIT of them;
+    broader queries are returned newest first (which the index can stop early on),
+    since ranking every match of a very common term costs a scan of its postings.
+
+    Args:
+        executor: SQLAlchemy session or connection (its bind decides the backend:
+                  FTS5, tsvector or LIKE)
+        query: free-text user query
+        limit, offset: pagination
+        department, status: optional exact-match filters
+        total: match count if already known (skips the count query)
+        ranked: force relevance order (True) or newest first (False); default by total
+
+    Returns:
+        tuple: (total_matches capped at COUNT_CAP,
+                list of result dicts with 'rank' (higher is better, None when unranked) and 'snippet')
+    """
+    terms = tokenize_query(query)
+    if not terms:
+        return 0, []
+    params, source, rank, newest = _plan(executor, terms, department, status)
+    params.update(limit=limit, offset=offset)
+
+    if total is None:
+        total = executor.execute(text(f"SELECT COUNT(*) FROM (SELECT 1 FROM {source} LIMIT :cap) matches"),
+                                 params).scalar()
+    if not total:
+        return 0, []
+    if ranked is None:
+        ranked = total < RANK_LIMIT
+    if rank is not None and ranked:
+        select = f"SELECT {RESULT_COLUMNS}, {rank} AS rank FROM {source} ORDER BY rank DESC"
+    else:
+        select = f"SELECT {RESULT_COLUMNS}, NULL AS rank FROM {source} ORDER BY {newest}"
+    # Typed, so SQLite's datetime strings come back as datetimes like every other endpoint's
+    statement = text(f"{select} LIMIT :limit OFFSET :offset").columns(created_at=DateTime)
+    rows = executor.execute(statement, params).mappings().all()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        description = result.pop('description')
+        result['snippet'] = (make_snippet(description, terms) or make_snippet(result['address'], terms)
+                             or (description or '')[:SNIPPET_CHARS])
+        results.append(result)
+    return total, results
+
+
+def search_shards(scatter, query, limit=20, offset=0, department=None, status=None):
+    """
+    search_complaints over several databases, merged into one page.
+
+    Matches are counted on every shard first, so all of them use the same order:
+    relevance when the combined count is below RANK_LIMIT and every backend ranks,
+    newest first otherwise. Each shard then returns its first offset + limit results.
+
+    Args:
+        scatter: callable(fn) running fn(connection) on each shard, e.g. ShardRouter.scatter
+
+    Returns:
+        tuple: (total_matches capped at COUNT_CAP, whether the page is ranked, results)
+    """
+    counts = scatter(lambda conn: count_matches(conn, query, department, status))
+    total = min(sum(count for count, _ in counts), COUNT_CAP)
+    ranked = total < RANK_LIMIT and all(rankable for _, rankable in counts)
+    if not total:
+        return 0, ranked, []
+    parts = scatter(lambda conn: search_complaints(conn, query, limit=offset + limit, department=department,
+                                                   status=status, total=COUNT_CAP, ranked=ranked)[1])
+    if ranked:
+        key = lambda result: result['rank']  # noqa: E731
+    else:
+        key = lambda result: (result['created_at'] or datetime.min, result['id'])  # noqa: E731
+        parts = [sorted(part, key=key, reverse=True) for part in parts]
+    return total, ranked, merge_page(parts, key=key, offset=offset, limit=limit)
@@ -0,0 +1,126 @@
+"""
+Fast JSON serialization and negotiated response compression for list endpoints.
+
+The JSON encoder is pluggable: orjson is used when it is installed, otherwise the
+stdlib json module with compact separators. Rows keep their raw datetime values and
+the encoder serializes each one exactly once, so handlers no longer call isoformat()
+field by field. Bodies above COMPRESS_MIN_SIZE are compressed with brotli or gzip,
+whichever the client accepts (brotli preferred when the package is available).
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # optional fast encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always available
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+
+# Compression settings (bytes / levels)
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+
+def _stdlib_default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _encode_stdlib(payload):
+    return json.dumps(
+        payload,
+        default=_stdlib_default,
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+def _encode_orjson(payload):
+    # orjson writes naive datetimes in the same format as datetime.isoformat()
+    return orjson.dumps(payload)
+
+
+ENCODERS = {'stdlib': _encode_stdlib}
+if orjson is not None:
+    ENCODERS['orjson'] = _encode_orjson
+
+_active_encoder = None
+
+
+def register_encoder(name, encode):
+    """Register a JSON encoder: a callable taking a payload and returning bytes."""
+    ENCODERS[name] = encode
+
+
+def set_encoder(name):
+    """Select the encoder used by encode_json() and json_response()."""
+    global _active_encoder
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown JSON encoder '{name}'. Available: {sorted(ENCODERS)}")
+    _active_encoder = ENCODERS[name]
+    print(f"[INFO] JSON encoder: {name}")
+
+
+def encode_json(payload):
+    """Serialize a payload to UTF-8 JSON bytes with the active encoder."""
+    return _active_encoder(payload)
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Pick a Content-Encoding from the request's Accept-Encoding header.
+
+    Args:
+        accept_encodings: werkzeug Accept object (request.accept_encodings)
+
+    Returns:
+        str or None: 'br', 'gzip' or None when the client accepts neither
+    """
+    candidates = []
+    if brotli is not None and accept_encodings['br']:
+        candidates.append((accept_encodings['br'], 1, 'br'))
+    if accept_encodings['gzip']:
+        candidates.append((accept_encodings['gzip'], 0, 'gzip'))
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+def compress_body(body, encoding):
+    """Compress a response body with the given Content-Encoding."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output deterministic for identical bodies
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def encoded_response(body, status=200):
+    """Wrap already-encoded JSON bytes in a Response, compressing when worthwhile."""
+    response = Response(body, status=status, mimetype=JSON_MIMETYPE)
+    response.vary.add('Accept-Encoding')
+    if len(body) >= COMPRESS_MIN_SIZE:
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding:
+            response.set_data(compress_body(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def json_response(payload, status=200):
+    """Drop-in replacement for jsonify() on large list payloads."""
+    return encoded_response(encode_json(payload), status)
+
+
+set_encoder(os.getenv('JSON_ENCODER') or ('orjson' if orjson is not None else 'stdlib'))
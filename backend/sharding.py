@@ -0,0 +1,269 @@
+"""
+Geographic sharding of complaint storage.
+
+With SHARD_CONFIG pointing at a JSON file, complaints are spread over several
+databases by location:
+
+    {
+      "shards": {
+        "nyc": {"number": 1, "url": "sqlite:///shards/nyc.db"},
+        "sf":  {"number": 2, "url": "postgresql://.../sf"}
+      },
+      "regions": {"dr5": "nyc", "dr7": "nyc", "9q8": "sf", "9q9": "sf"}
+    }
+
+- Routing: a complaint's shard is picked by the longest geohash prefix in "regions"
+  that matches its latitude/longitude. Complaints without a location, or outside
+  every region, go to the "default" shard. That is the main database (number 0), so
+  existing data stays where it is.
+- Ids: shard n (1 <= n <= MAX_SHARD_NUMBER) allocates complaint ids from
+  n * SHARD_ID_SPAN upwards (an SQLite sqlite_sequence entry or a PostgreSQL setval).
+  The shard of a complaint is therefore id // SHARD_ID_SPAN, and lookups by id
+  (track, details, status update) go straight to one database without scatter-gather.
+  A shard's number must never change once it holds data. Complaint id columns are
+  BIGINT: shard 3's range is already past the int4 maximum.
+- Sharded tables: issue_report, archived_issue_report, the full-text index and
+  submission_key. An idempotency key is stored on its complaint's shard, so the two
+  commit in one transaction. The other tables (departments, embeddings, duplicate
+  reports) stay on the main database. They refer to complaints by id, which is unique
+  across shards.
+- Offline jobs (archive.py, reclassify.py) visit every shard's database in turn.
+- Session: ShardedSession sends complaint-table statements to the shard selected with
+  shard_scope(name). Without a scope it behaves like RoutingSession (main database,
+  read replica for @read_replica views).
+- Cross-shard reads: scatter() runs one query per shard in parallel threads, each on
+  its own connection. merge_page() merges newest-first results into one page: every
+  shard returns at most offset + limit rows, so the merged slice is exact.
+
+Local testing: point the shard URLs at SQLite files. The tables and id ranges are
+created by create_tables() like the main database's.
+"""
+
+import heapq
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, copy_context
+
+from sqlalchemy import MetaData, text
+
+from db_pool import RoutingSession, engine_options, install_sqlite_pragmas
+
+DEFAULT_SHARD = 'default'
+SHARD_ID_SPAN = 1_000_000_000
+# Highest shard number: its ids must stay exact as JSON numbers in the browser (2**53 - 1)
+MAX_SHARD_NUMBER = (2 ** 53 - 1) // SHARD_ID_SPAN - 1
+SHARDED_TABLES = ('issue_report', 'archived_issue_report', 'submission_key')
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_current_shard = ContextVar('current_shard', default=None)
+
+
+def geohash(lat, lon, precision):
+    """Standard base32 geohash of a point."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def shard_scope(name):
+    """Send complaint-table statements of the current session to a shard (None: no-op)."""
+    if name is None:
+        return nullcontext()
+    return _scope(name)
+
+
+@contextmanager
+def _scope(name):
+    token = _current_shard.set(name)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+class ShardedSession(RoutingSession):
+    """RoutingSession that sends complaint tables to the shard in scope."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = _current_shard.get()
+        if bind is None and shard not in (None, DEFAULT_SHARD) \
+                and (mapper is None or mapper.persist_selectable.name in SHARDED_TABLES):
+            return self._db.engines[ShardRouter.bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ShardRouter:
+    """Shard names, numbers and regions; id and location routing; parallel scatter-gather."""
+
+    def __init__(self, shards, regions):
+        """
+        Args:
+            shards: {name: number}, without the default shard (number 0)
+            regions: {geohash prefix: shard name}
+        """
+        self.numbers = {DEFAULT_SHARD: 0, **shards}
+        self.names = sorted(self.numbers, key=self.numbers.get)
+        self._by_number = {number: name for name, number in self.numbers.items()}
+        # Longest prefix first, so "dr5r" beats "dr5"
+        self.regions = sorted(regions.items(), key=lambda item: -len(item[0]))
+        self.precision = max((len(prefix) for prefix in regions), default=0)
+        self.db = None
+        self._pool = ThreadPoolExecutor(max_workers=len(self.names), thread_name_prefix='shard')
+
+    @staticmethod
+    def bind_key(name):
+        return None if name == DEFAULT_SHARD else f'shard_{name}'
+
+    def shard_for_point(self, lat, lon):
+        if lat is None or lon is None or not self.precision:
+            return DEFAULT_SHARD
+        cell = geohash(lat, lon, self.precision)
+        return next((name for prefix, name in self.regions if cell.startswith(prefix)), DEFAULT_SHARD)
+
+    def shard_for_id(self, complaint_id):
+        return self._by_number.get(complaint_id // SHARD_ID_SPAN, DEFAULT_SHARD)
+
+    def engines(self):
+        """{name: Engine} (call inside an app context)"""
+        return {name: self.db.engines[self.bind_key(name)] for name in self.names}
+
+    def scatter(self, fn, names=None):
+        """
+        Run fn(connection) on each shard in parallel.
+
+        Each call runs in a copy of the caller's context, so request state (flask.g, and
+        with it the query monitor's per-request counters) follows it into the pool. Its
+        connection carries the shard name as the "shard" execution option.
+
+        Returns:
+            list of results, in shard order
+        """
+        engines = self.engines()
+        context = copy_context()
+
+        def run(name):
+            with engines[name].connect() as conn:
+                return fn(conn.execution_options(shard=name))
+
+        return list(self._pool.map(lambda name: context.copy().run(run, name), names or self.names))
+
+    def create_tables(self, tables, after_create=None):
+        """
+        Create the sharded tables on every shard and reserve each shard's id range.
+
+        Args:
+            tables: Table objects to create (the main database has them already)
+            after_create: optional callable(engine), e.g. the full-text index setup
+        """
+        for name, engine in self.engines().items():
+            if name == DEFAULT_SHARD:
+                continue
+            sqlite = engine.dialect.name == 'sqlite'
+            for table in tables:
+                shard_table = table.to_metadata(MetaData())
+                if sqlite and table.name == 'issue_report':
+                    # AUTOINCREMENT, so the id sequence lives in sqlite_sequence and never drops below the range
+                    shard_table.dialect_kwargs['sqlite_autoincrement'] = True
+                shard_table.create(engine, checkfirst=True)
+                for index in shard_table.indexes:
+                    index.create(engine, checkfirst=True)
+            self._reserve_id_range(engine, 'issue_report', self.numbers[name] * SHARD_ID_SPAN)
+            if after_create:
+                after_create(engine)
+
+    @staticmethod
+    def _reserve_id_range(engine, table, base):
+        with engine.begin() as conn:
+            if engine.dialect.name == 'sqlite':
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) SELECT :table, :base "
+                                  "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :table)"),
+                             {'table': table, 'base': base})
+                conn.execute(text("UPDATE sqlite_sequence SET seq = :base WHERE name = :table AND seq < :base"),
+                             {'table': table, 'base': base})
+            elif engine.dialect.name == 'postgresql':
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                                  f"GREATEST(:base, (SELECT COALESCE(max(id), 0) FROM {table})))"),
+                             {'table': table, 'base': base})
+
+
+def merge_page(parts, key, offset=0, limit=None):
+    """
+    Merge per-shard lists, each sorted newest first by key, and cut one page.
+
+    Returns:
+        list: rows offset .. offset + limit of the merged order (all rows when limit is None)
+    """
+    merged = heapq.merge(*parts, key=key, reverse=True)
+    return list(itertools.islice(merged, offset, None if limit is None else offset + limit))
+
+
+def load_shard_config(path):
+    """
+    Read and validate a SHARD_CONFIG file.
+
+    Returns:
+        tuple: ({name: number}, {name: database URL}, {geohash prefix: name}), without
+        the default shard
+    """
+    with open(path) as f:
+        config = json.load(f)
+    shards = {name: entry['number'] for name, entry in config['shards'].items()}
+    if DEFAULT_SHARD in shards:
+        raise ValueError(f"{path}: shard names must not be '{DEFAULT_SHARD}'")
+    invalid = sorted(name for name, number in shards.items()
+                     if not isinstance(number, int) or isinstance(number, bool)
+                     or not 1 <= number <= MAX_SHARD_NUMBER)
+    if invalid:
+        raise ValueError(f"{path}: shard numbers must be integers from 1 to {MAX_SHARD_NUMBER} "
+                         f"(invalid: {', '.join(invalid)})")
+    if len(set(shards.values())) != len(shards):
+        raise ValueError(f"{path}: shard numbers must be unique")
+    regions = config.get('regions', {})
+    unknown = set(regions.values()) - set(shards) - {DEFAULT_SHARD}
+    if unknown:
+        raise ValueError(f"{path}: regions refer to unknown shards {sorted(unknown)}")
+    urls = {}
+    for name, entry in config['shards'].items():
+        url = entry['url']
+        urls[name] = url.replace('postgres://', 'postgresql://', 1) if url.startswith('postgres://') else url
+    return shards, urls, regions
+
+
+def configure_shards(app):
+    """
+    Add a bind per shard from SHARD_CONFIG. Call before SQLAlchemy(app, ...).
+
+    Returns:
+        ShardRouter, or None when sharding is not configured
+    """
+    path = os.getenv('SHARD_CONFIG')
+    if not path:
+        return None
+    shards, urls, regions = load_shard_config(path)
+
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for name, url in urls.items():
+        if url.startswith('sqlite') and os.getenv('SQLITE_TUNING', 'true').lower() in ('1', 'true', 'yes'):
+            install_sqlite_pragmas()
+        binds[ShardRouter.bind_key(name)] = {'url': url, **engine_options(url, ShardRouter.bind_key(name))}
+    router = ShardRouter(shards, regions)
+    print(f"[INFO] Complaint storage sharded over {', '.join(router.names)} "
+          f"({len(router.regions)} geohash regions)")
+    return router
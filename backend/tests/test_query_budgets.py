@@ -0,0 +1,120 @@
+"""
+Every endpoint with a @query_budget stays within it.
+
+app.py reads its configuration at import time, so each configuration runs in a fresh
+interpreter: this file re-runs itself as a script once on a single SQLite database and
+once sharded over three SQLite files. The script seeds complaints through the batch
+endpoint, calls each budgeted endpoint once with QueryBudgetWarning raised as an error,
+and checks that the statements were counted at all (X-DB-Queries), including those run
+by the shard scatter-gather threads.
+
+Usage:
+    python -m pytest backend/tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+import warnings
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_TOKEN = 'budget-test'
+
+CITIES = [
+    # (lat, lon): New York and San Francisco are shards when sharded, Kanpur stays on the main database
+    (40.71, -74.00),
+    (37.77, -122.42),
+    (26.45, 80.33),
+]
+
+
+@pytest.mark.parametrize('sharded', [False, True], ids=['single', 'sharded'])
+def test_endpoints_stay_within_query_budgets(tmp_path, sharded):
+    env = dict(os.environ, **configuration(str(tmp_path), sharded))
+    result = subprocess.run([sys.executable, os.path.abspath(__file__)], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout[-4000:] + result.stderr[-4000:]
+
+
+def configuration(directory, sharded):
+    env = {
+        'DATABASE_URL': f"sqlite:///{os.path.join(directory, 'main.db')}",
+        'QUERY_MONITOR': 'true',
+        'QUERY_BUDGETS': '',
+        'RESPONSE_CACHE': 'off',  # every request must reach the databases
+        'LOCATION_ROUTING': 'false',
+        'MODEL_ADMIN_TOKEN': ADMIN_TOKEN,
+        'SHARD_CONFIG': '',
+    }
+    if sharded:
+        config = os.path.join(directory, 'shards.json')
+        with open(config, 'w') as f:
+            json.dump({'shards': {'nyc': {'number': 1, 'url': f"sqlite:///{os.path.join(directory, 'nyc.db')}"},
+                                  'sf': {'number': 2, 'url': f"sqlite:///{os.path.join(directory, 'sf.db')}"}},
+                       'regions': {'dr5': 'nyc', '9q8': 'sf'}}, f)
+        env['SHARD_CONFIG'] = config
+    return env
+
+
+def run_budgeted_endpoints():
+    """Seed complaints, then call every budgeted endpoint once (runs in the child process)."""
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from query_monitor import QueryBudgetWarning
+
+    with backend.app.app_context():
+        backend.create_tables()
+    backend.app.testing = True  # a budget warning raised in after_request reaches the caller
+    client = backend.app.test_client()
+    admin = {'X-Admin-Token': ADMIN_TOKEN}
+
+    items = [{'issue_type': 'pothole', 'address': f'Main Street {i}', 'description': f'pothole number {i}',
+              'latitude': lat, 'longitude': lon}
+             for i, (lat, lon) in enumerate(CITIES * 4)]
+    response = client.post('/api/submit-complaints/batch', json={'complaints': items})
+    assert response.status_code in (200, 201), response.get_json()
+    ids = [result['complaint_id'] for result in response.get_json()['results']]
+    client.put(f'/api/complaint/{ids[0]}/update-status', json={'status': 'resolved'})
+
+    requests = [
+        ('GET', f'/api/track-complaint/{ids[1]}', None),
+        ('GET', f'/api/complaint/{ids[1]}', None),
+        ('GET', '/api/complaints-map?lat=40.71&lon=-74.0&radius=50', None),
+        ('GET', '/api/complaints-map?lat=26.45&lon=80.33&include_archived=true', None),
+        ('GET', '/api/heatmap-data', None),
+        ('GET', '/api/all-complaints', None),
+        ('GET', '/api/all-complaints?limit=5', None),
+        ('GET', '/api/all-complaints?limit=5&offset=5&include_archived=true', None),
+        ('GET', '/api/stats', None),
+        ('GET', '/api/search?q=pothole', None),
+        ('GET', '/api/search?q=main+street&limit=5', None),
+        ('PUT', f'/api/complaint/{ids[2]}/update-status', {'status': 'in_progress'}),
+        ('PUT', '/api/complaints/update-status', {'ids': ids[3:6], 'priority': 'high'}),
+        ('PUT', '/api/complaints/update-status', {'filter': {'status': 'pending'}, 'priority': 'low'}),
+    ]
+    failures = []
+    for method, path, body in requests:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', QueryBudgetWarning)
+            try:
+                response = client.open(path, method=method, json=body, headers=admin)
+            except QueryBudgetWarning as e:
+                failures.append(str(e))
+                continue
+        queries = int(response.headers.get('X-DB-Queries', 0))
+        if response.status_code != 200:
+            failures.append(f'{method} {path}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}')
+        elif queries == 0:
+            failures.append(f'{method} {path}: no SQL statements were counted')
+        else:
+            print(f'[OK] {method} {path}: {queries} statements')
+    if failures:
+        print('\n'.join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run_budgeted_endpoints()